@@ -0,0 +1,80 @@
+# Reading the load stage's artifacts one after the other (artifacts.read_frame,
+# as data_transfer.py used to) against artifacts.read_frames, and writing them
+# with write_frame against write_frames, on moto's in-memory S3 (moto must be
+# installed) or a local folder. '--latency' adds that many milliseconds to every
+# S3 request, standing in for the round trip to a real bucket. Checks that both
+# ways give the same frames and that a missing artifact is reported as
+# artifacts.ArtifactNotFound naming it.
+#
+#   python benchmarks/bench_artifact_io.py --events 50000 --latency 30
+
+import argparse
+import tempfile
+import time
+
+import pandas as pd
+
+import fixtures
+import artifacts
+import bench_load
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run(store, frames, settings):
+    names = {name: artifacts.artifact_name(f'bench/{name}', '2023-05-20') for name in frames}
+    _, one_by_one = timed(lambda: [artifacts.write_frame(store, names[name], df, settings)
+                                   for name, df in frames.items()])
+    _, together = timed(lambda: artifacts.write_frames(store, {names[name]: df for name, df in frames.items()},
+                                                       settings))
+    print(f'write: one by one {one_by_one:6.2f}s, write_frames {together:6.2f}s')
+
+    serial, one_by_one = timed(lambda: {name: artifacts.read_frame(store, artifact, settings=settings)
+                                        for name, artifact in names.items()})
+    parallel, together = timed(lambda: artifacts.read_frames(store, names, settings))
+    print(f'read:  one by one {one_by_one:6.2f}s, read_frames  {together:6.2f}s  ({one_by_one / together:.1f}x)')
+    for name in frames:
+        pd.testing.assert_frame_equal(serial[name], parallel[name])
+
+    try:
+        artifacts.read_frames(store, dict(names, missing='bench/missing_2023-05-20'), settings)
+        raise AssertionError('a missing artifact was not reported')
+    except artifacts.ArtifactNotFound as e:
+        assert e.names == ['bench/missing_2023-05-20'], e.names
+        print(f'missing artifact: {e}')
+    frames = artifacts.read_frames(store, dict(names, missing='bench/missing_2023-05-20'), settings,
+                                   optional=('missing',))
+    assert frames['missing'] is None
+    print('same frames both ways')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--tracks', type=int, default=2000)
+    arg_parser.add_argument('--events', type=int, default=20000)
+    arg_parser.add_argument('--backend', choices=['local', 's3'], default='s3')
+    arg_parser.add_argument('--latency', type=float, default=20, help='milliseconds added to every S3 request')
+    arg_parser.add_argument('--io-threads', type=int, default=artifacts.DEFAULTS['io_threads'])
+    arg_parser.add_argument('--multipart-mb', type=int, default=artifacts.DEFAULTS['multipart_mb'])
+    args = arg_parser.parse_args()
+
+    frames = {name: df for name, df in bench_load.make_frames(args.tracks, args.events).items()
+              if name != 'data_dict'}
+    print(f"{len(frames)} artifacts, {sum(len(df) for df in frames.values())} rows")
+    settings = dict(artifacts.DEFAULTS, io_threads=args.io_threads, multipart_mb=args.multipart_mb)
+    if args.backend == 'local':
+        with tempfile.TemporaryDirectory() as root:
+            run(artifacts.LocalStore(root), frames, settings)
+    else:
+        import boto3
+        from moto import mock_aws
+
+        with mock_aws():
+            client = boto3.client('s3', region_name='us-east-1')
+            client.create_bucket(Bucket='bench-artifacts')
+            client.meta.events.register('request-created.s3', lambda **kwargs: time.sleep(args.latency / 1000))
+            run(artifacts.S3Store('bench-artifacts', client, args.multipart_mb, args.io_threads), frames, settings)
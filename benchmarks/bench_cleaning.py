@@ -0,0 +1,108 @@
+# concert_transforms.clean_concerts against the original cleaning_concerts.py
+# chain of replace() calls, on a synthetic raw concerts frame.
+# Checks that both produce the same concerts and festivals: the original kept
+# dates as datetime.date / 'mm/dd/yyyy' strings and classified events by the
+# length of the date string, so its dates are converted before comparing, and
+# only events it classified the same way are compared.
+#
+#   python benchmarks/bench_cleaning.py --rows 1000000 --unique 200000
+
+import argparse
+import datetime
+import time
+
+import pandas as pd
+
+import fixtures
+import concert_schema
+import concert_transforms
+
+
+def legacy_clean(df):
+    # cleaning_concerts.py as it was, minus the S3 reads/writes
+    df = df.copy()
+    df.columns=['performer', 'venue', 'date', 'genre', 'ranking', 'concert_id']
+    df['performer'] = df['performer'].replace(r'\nPerformer:\n\n\n|\n\n\n',"",regex=True)\
+                                     .replace(r'\n',', ', regex=True)
+    df['performer']=df['performer'].replace(r', \t*and More >>',', others', regex=True)
+    df['performer']=df['performer'].replace(r'\t*·','', regex=True)
+    df[['venue','location']]=df['venue'].replace(r'\nVenue:\n\n',"",regex=True).str.split(pat='\n',n=1,expand=True)
+    df.insert(2, "location", df.pop("location"))
+    df['location'] = df["location"].replace(r'\n|\t',"", regex=True).str.strip(', United States')
+    df['location'] = df['location'].str.split(",").str[-2:].str.join(', ')
+    df['location']=df['location'].str.strip()
+    df['genre']= df['genre'].str.replace(r'\nGenre:\n|\n','',regex=True).replace(' / ',', ',regex=True)
+    df['date'] = df['date'].replace('\nDate:|\n|\t', "", regex=True)
+    df[['date','time']]=df['date'].str.split(pat='|',n=1,expand=True)
+    df.insert(4,'time',df.pop('time'))
+    df['date']=df['date'].str.split(', ',n=1,expand=True)[1]
+    month_dict={'January':'01','February':'02','March':'03', 'April':'04','May':'05','June':'06',\
+                'July':'07','August':'08','September':'09','October':'10','November':'11','December':'12'}
+    df['date']=df['date'].replace(month_dict,regex=True).str.strip().replace(r" |, ","/",regex=True)
+    df['date']=df['date'].replace(r'/Sun/|/Mon/|/Tues/|/Wed/|/Thu/|/Fri/|/Sat/','',regex=True).replace(r'/-','-',regex=True)
+    df.loc[df['date'].map(len)==10,'date'] = pd.to_datetime(df.loc[df['date'].map(len)==10,'date']).dt.date
+    df['time']=df['time'].str.strip()
+    df['time'] = pd.to_datetime(df['time'],format= '%I:%M%p').dt.time
+    df.insert(0,'concert_id',df.pop('concert_id'))
+    df['ranking'] = df['ranking'].str.strip()
+    df = df.replace({pd.NaT: None})
+    festivals_df = df[[isinstance(value, str) for value in df['date']]]
+    concerts_df = df[[value.__class__ == datetime.date for value in df['date']]]
+    festivals_df=pd.DataFrame(festivals_df)
+    concerts_df=pd.DataFrame(concerts_df)
+    festivals_df = festivals_df.reset_index(drop=True)
+    concerts_df = concerts_df.reset_index(drop=True)
+    festivals_df[['start_date','end_date']]=festivals_df['date'].str.split(pat='-',n=1,expand=True)
+    festivals_df=festivals_df.drop(columns='date')
+    festivals_df.insert(4,'start_date',festivals_df.pop('start_date'))
+    festivals_df.insert(5,'end_date',festivals_df.pop('end_date'))
+    return concerts_df, festivals_df
+
+
+def as_datetime64(frame):
+    # the original's date columns into datetime64, like clean_concerts returns them
+    frame = frame.copy()
+    if 'date' in frame:
+        frame['date'] = pd.to_datetime(frame['date'])
+    for column in ('start_date', 'end_date'):
+        if column in frame:
+            # events it wrongly took for festivals ('9/3/2023') don't parse; they aren't compared
+            frame[column] = pd.to_datetime(frame[column].str.strip(), format='%m/%d/%Y', errors='coerce')
+    return frame
+
+
+def compare(old, new, label):
+    # the new output's typed columns as plain values, as the database gets them
+    old = as_datetime64(old).drop_duplicates('concert_id').set_index('concert_id')
+    new = concert_schema.plain(new).drop_duplicates('concert_id').set_index('concert_id')
+    shared = old.index.intersection(new.index)
+    print(f'{label}: {len(shared)} compared, {len(old) - len(shared)} only in the original, '
+          f'{len(new) - len(shared)} only in the new output')
+    pd.testing.assert_frame_equal(old.loc[shared, new.columns], new.loc[shared])
+
+
+def timed(label, func, raw):
+    start = time.perf_counter()
+    result = func(raw)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<10} {elapsed:7.2f}s  ({len(raw) / elapsed:,.0f} rows/s)')
+    return result, elapsed
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--unique', type=int, default=None,
+                            help='distinct events to generate, repeated up to --rows (default: all distinct)')
+    args = arg_parser.parse_args()
+
+    unique = min(args.unique or args.rows, args.rows)
+    raw = fixtures.raw_concerts_frame(args.rows, unique=unique)
+    print(f'{len(raw)} raw rows, {unique} distinct events')
+
+    (old_concerts, old_festivals), old_time = timed('original', legacy_clean, raw)
+    (new_concerts, new_festivals), new_time = timed('vectorized', concert_transforms.clean_concerts, raw)
+    print(f'speedup: {old_time / new_time:.1f}x')
+
+    compare(old_concerts, new_concerts, 'concerts')
+    compare(old_festivals, new_festivals, 'festivals')
@@ -0,0 +1,51 @@
+# The date/time step of the concert cleaner on its own: the original
+# month_dict replace + regex + pd.to_datetime (format inferred) chain against
+# concert_transforms.parse_event_dates, on a raw 'Date' column where the same
+# dates repeat many times (as they do in a real crawl).
+#
+#   python benchmarks/bench_dates.py --rows 1000000 --unique 2000
+
+import argparse
+import time
+
+import pandas as pd
+
+import fixtures
+import concert_transforms
+
+
+def legacy_dates(raw_dates):
+    # the date lines of the original cleaning_concerts.py
+    df = pd.DataFrame({'date': raw_dates})
+    df['date'] = df['date'].replace('\nDate:|\n|\t', "", regex=True)
+    df[['date','time']]=df['date'].str.split(pat='|',n=1,expand=True)
+    df['date']=df['date'].str.split(', ',n=1,expand=True)[1]
+    df['date']=df['date'].replace(concert_transforms.month_dict,regex=True).str.strip().replace(r" |, ","/",regex=True)
+    df['date']=df['date'].replace(r'/Sun/|/Mon/|/Tues/|/Wed/|/Thu/|/Fri/|/Sat/','',regex=True).replace(r'/-','-',regex=True)
+    df.loc[df['date'].map(len)==10,'date'] = pd.to_datetime(df.loc[df['date'].map(len)==10,'date']).dt.date
+    df['time']=df['time'].str.strip()
+    df['time'] = pd.to_datetime(df['time'],format= '%I:%M%p').dt.time
+    return df
+
+
+def timed(label, func, raw_dates):
+    start = time.perf_counter()
+    func(raw_dates)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<10} {elapsed:7.2f}s  ({len(raw_dates) / elapsed:,.0f} rows/s)')
+    return elapsed
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=1000000)
+    arg_parser.add_argument('--unique', type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    distinct = [fixtures.event_row(event_id)[2] for event_id in fixtures.event_ids(args.unique)]
+    raw_dates = pd.Series([distinct[i % len(distinct)] for i in range(args.rows)], dtype=object)
+    print(f'{len(raw_dates)} dates, {len(set(distinct))} distinct')
+
+    old_time = timed('original', legacy_dates, raw_dates)
+    new_time = timed('explicit', concert_transforms.parse_event_dates, raw_dates)
+    print(f'speedup: {old_time / new_time:.1f}x')
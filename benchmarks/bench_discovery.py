@@ -0,0 +1,74 @@
+# URL discovery (getURLs.get_list) against the local stand-in site, for each
+# link-extractor backend: listing pages per second and memory per worker.
+# Memory is the peak RSS of this process plus any browser processes it started,
+# sampled while discovery runs, divided by the number of workers.
+# The selenium backend needs the browser named by --browser (and its driver).
+#
+#   python benchmarks/bench_discovery.py --backends http selenium --workers 4 --rate 0
+
+import argparse
+import threading
+import time
+
+import psutil
+
+import concert_site
+import fixtures
+import getURLs
+
+
+def tree_rss(process):
+    total = 0
+    for p in [process] + process.children(recursive=True):
+        try:
+            total += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+def run(settings):
+    process = psutil.Process()
+    baseline = tree_rss(process)
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak[0] = max(peak[0], tree_rss(process))
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        urls = getURLs.get_list(settings)
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        sampler.join()
+    return urls, elapsed, (peak[0] - baseline) / settings['workers']
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--backends', nargs='+', default=['http'])
+    arg_parser.add_argument('--browser', default=getURLs.DEFAULTS['browser'])
+    arg_parser.add_argument('--workers', type=int, default=getURLs.DEFAULTS['workers'])
+    arg_parser.add_argument('--rate', type=float, default=0, help='requests/s, 0 = unlimited')
+    arg_parser.add_argument('--latency', type=float, default=0.05)
+    args = arg_parser.parse_args()
+
+    states = len(fixtures.STATES)
+    expected = sum(len(fixtures.state_event_ids(i)) for i in range(states))
+    pages = 1 + sum(-(-len(fixtures.state_event_ids(i)) // fixtures.EVENTS_PER_PAGE) for i in range(states))
+    server, base_url = concert_site.start_process(latency=args.latency)
+    try:
+        for backend in args.backends:
+            for workers in sorted({1, args.workers}):
+                settings = dict(getURLs.DEFAULTS, base_url=base_url, backend=backend, browser=args.browser,
+                                workers=workers, rate=args.rate)
+                urls, elapsed, memory = run(settings)
+                print(f'{backend:>9} {workers} workers: {len(urls)}/{expected} event urls, '
+                      f'{pages / elapsed:.1f} pages/s, {memory / 2**20:.1f} MB per worker')
+    finally:
+        server.terminate()
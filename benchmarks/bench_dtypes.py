@@ -0,0 +1,68 @@
+# The concert frames with Python-object columns (as they were) against the
+# compact types of concert_schema.py, at each of --scales raw events: memory per
+# column (deep, the Python objects counted too), the Parquet artifact's size,
+# and the time of a few things done with the cleaned concerts afterwards
+# (concerts per city and genre, a month's concerts sorted by date, the loaders'
+# conversion back to plain values). Checks that the typed frames give the
+# loaders the same values.
+#
+#   python benchmarks/bench_dtypes.py --scales 10000 100000 1000000 --unique 50000
+
+import argparse
+import time
+
+import pandas as pd
+
+import fixtures
+import artifacts
+import concert_schema
+import concert_transforms
+import loaders
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def objects(df):
+    # the frame as clean_concerts used to return it: every column but the dates as Python objects
+    plain = concert_schema.plain(df)
+    return plain.assign(concert_id=plain['concert_id'].astype(object))
+
+
+def uses(df):
+    # {label: seconds} of the things done with the concerts after cleaning
+    month = (df['date'] >= '2023-06-01') & (df['date'] < '2023-07-01')
+    steps = {'per city/genre': lambda: df.groupby(['location', 'genre'], observed=True).size(),
+             'month by date': lambda: df[month].sort_values(['date', 'time']),
+             'to loaders': lambda: loaders.prepare({'concerts': df})}
+    return {label: timed(step)[1] for label, step in steps.items()}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000, 500000])
+    arg_parser.add_argument('--unique', type=int, default=50000,
+                            help='distinct events, repeated up to the scale')
+    args = arg_parser.parse_args()
+
+    for scale in args.scales:
+        raw = fixtures.raw_concerts_frame(scale, unique=min(args.unique, scale))
+        typed_raw, type_time = timed(lambda: concert_schema.typed(raw, concert_schema.raw))
+        (concerts, _), clean_time = timed(lambda: concert_transforms.clean_concerts(typed_raw))
+        (old_concerts, _), old_clean_time = timed(lambda: concert_transforms.clean_concerts(raw))
+        old_concerts = objects(old_concerts)
+        pd.testing.assert_frame_equal(loaders.prepare({'concerts': old_concerts})['concerts'],
+                                      loaders.prepare({'concerts': concerts})['concerts'])
+
+        print(f'== {scale} raw events ({len(concerts)} concerts)')
+        print(concert_schema.memory_report({'raw objects': raw, 'raw typed': typed_raw}))
+        print(concert_schema.memory_report({'concerts objects': old_concerts, 'concerts typed': concerts}))
+        sizes = [len(artifacts.frame_to_bytes(df, 'parquet')) / 2**20 for df in (old_concerts, concerts)]
+        print(f'parquet: {sizes[0]:.1f} MB -> {sizes[1]:.1f} MB')
+        print(f'clean: from object columns {old_clean_time:.2f}s, from typed {clean_time:.2f}s '
+              f'(typing the raw frame {type_time:.2f}s)')
+        old_uses, new_uses = uses(old_concerts), uses(concerts)
+        print('  '.join(f'{label}: {old_uses[label]:.3f}s -> {new_uses[label]:.3f}s' for label in old_uses))
@@ -0,0 +1,58 @@
+# Fetch engine against the local stand-in site.
+# Compares the old "one task per URL + gather" approach with fetch_engine, and
+# checks that injected failures are retried instead of aborting the crawl.
+#
+#   python benchmarks/bench_fetch.py --events 5000 --latency 0.02 --failure-rate 0.05
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+import concert_site
+import fixtures
+import fetch_engine
+
+
+async def gather_all(urls):
+    # what concerts_data.get_tasks used to do
+    async def get_page(session, url):
+        async with session.get(url) as r:
+            return await r.text()
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        return await asyncio.gather(*[asyncio.create_task(get_page(session, url)) for url in urls])
+
+
+async def run(args):
+    app = concert_site.make_app(args.latency, args.failure_rate)
+    runner, base_url = await concert_site.start(app)
+    urls = [f'{base_url}/event/{event_id}' for event_id in fixtures.event_ids(args.events)]
+    try:
+        if not args.failure_rate:
+            start = time.perf_counter()
+            pages = await gather_all(urls)
+            elapsed = time.perf_counter() - start
+            print(f'gather:       {len(pages)} pages in {elapsed:.3f}s, {len(pages) / elapsed:.1f} pages/s')
+
+        app['counters']['hits'] = 0
+        settings = dict(fetch_engine.DEFAULTS, concurrency=args.concurrency, per_host=args.per_host,
+                        backoff=0.05, max_backoff=1.0, retries=args.retries)
+        pages, failures, stats = await fetch_engine.fetch_all(urls, settings)
+        print('fetch_engine: ' + fetch_engine.format_summary(stats))
+        print(f'server hits: {app["counters"]["hits"]} for {len(urls)} urls')
+        assert [page.url for page in pages] == [url for url in urls if url not in {f.url for f in failures}]
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--events', type=int, default=2000)
+    arg_parser.add_argument('--latency', type=float, default=0.01)
+    arg_parser.add_argument('--failure-rate', type=float, default=0.0)
+    arg_parser.add_argument('--concurrency', type=int, default=fetch_engine.DEFAULTS['concurrency'])
+    arg_parser.add_argument('--per-host', type=int, default=fetch_engine.DEFAULTS['per_host'])
+    arg_parser.add_argument('--retries', type=int, default=fetch_engine.DEFAULTS['retries'])
+    asyncio.run(run(arg_parser.parse_args()))
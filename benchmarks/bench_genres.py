@@ -0,0 +1,99 @@
+# genres.deduplicate() on a database filled the way the old loader did it: a new
+# genre row for every artist/concert genre on every day, with the links of the
+# latest day pointing at that day's rows. Reports the size of 'genres' and the
+# time of a few genre queries before and after, and checks that every artist
+# and concert keeps the same genre names.
+#
+#   python benchmarks/bench_genres.py --days 30 --artists 2000 --concerts 20000
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+import fixtures
+import genres
+from database import Base, Genre, artist_genre_table, concert_genre_table
+
+queries = {
+    'lookup by name': "SELECT genre_id FROM genres WHERE name = 'hip hop'",
+    'artists per genre': 'SELECT g.name, COUNT(*) FROM genres g JOIN artist_genre l USING (genre_id) GROUP BY g.name',
+    'concerts of a genre': "SELECT COUNT(*) FROM concert_genre l JOIN genres g USING (genre_id) WHERE g.name = 'rock'",
+}
+
+links_query = '''SELECT 'a' || l.artist_id, LOWER(g.name) FROM artist_genre l JOIN genres g USING (genre_id)
+                 UNION SELECT 'c' || l.concert_id, LOWER(g.name) FROM concert_genre l JOIN genres g USING (genre_id)'''
+
+
+def legacy_database(engine, days, artists, concerts, seed=0):
+    rng = random.Random(seed)
+    names = fixtures.GENRES + ['Rock', 'Pop', 'Hip Hop', 'Jazz', 'Country', 'Festival']
+    artist_genres = {f'artist{i:06d}': rng.sample(names, rng.randint(1, 3)) for i in range(artists)}
+    concert_genres = {100000 + i: rng.sample(names, rng.randint(1, 2)) for i in range(concerts)}
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # the unique index did not exist then
+        conn.execute(text('DROP INDEX genres_name_key'))
+        next_id = 1
+        for day in range(days):
+            rows, artist_links, concert_links = [], [], []
+            for links, table_genres, key in ((artist_links, artist_genres, 'artist_id'),
+                                             (concert_links, concert_genres, 'concert_id')):
+                for owner, owner_genres in table_genres.items():
+                    for name in owner_genres:
+                        rows.append({'genre_id': next_id, 'name': name})
+                        links.append({key: owner, 'genre_id': next_id})
+                        next_id += 1
+            conn.execute(Genre.__table__.insert(), rows)
+            # merge() replaced each owner's links with the day's new genre rows
+            conn.execute(artist_genre_table.delete())
+            conn.execute(concert_genre_table.delete())
+            conn.execute(artist_genre_table.insert(), artist_links)
+            conn.execute(concert_genre_table.insert(), concert_links)
+
+
+def run_queries(engine, repeat=5):
+    with engine.connect() as conn:
+        for label, query in queries.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(query)).all()
+            print(f'  {label:<20} {(time.perf_counter() - start) / repeat * 1000:8.1f} ms')
+
+
+def genre_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT COUNT(*) FROM genres')).scalar()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--days', type=int, default=30)
+    arg_parser.add_argument('--artists', type=int, default=2000)
+    arg_parser.add_argument('--concerts', type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine('sqlite:///' + os.path.join(directory, 'genres.sqlite3'))
+        legacy_database(engine, args.days, args.artists, args.concerts)
+        with engine.connect() as conn:
+            before = set(conn.execute(text(links_query)).all())
+        print(f'before: {genre_rows(engine)} genre rows')
+        run_queries(engine)
+
+        start = time.perf_counter()
+        replaced = genres.deduplicate(engine)
+        print(f'deduplicate: {replaced} rows folded in {time.perf_counter() - start:.2f}s')
+
+        with engine.connect() as conn:
+            after = set(conn.execute(text(links_query)).all())
+        assert before == after, 'genre links changed'
+        print(f'after: {genre_rows(engine)} genre rows')
+        run_queries(engine)
+
+        start = time.perf_counter()
+        assert genres.deduplicate(engine) == 0
+        print(f'second deduplicate (nothing to do): {time.perf_counter() - start:.3f}s')
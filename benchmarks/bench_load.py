@@ -0,0 +1,92 @@
+# Loading a day's DataFrames into SQLite with loaders.py: the row-by-row
+# session.merge() path against the bulk INSERT ... ON CONFLICT path.
+# Each path loads into its own fresh database twice (the second load is all
+# updates, like a re-run of the same day) and reports input rows per second.
+# Afterwards the two databases must hold the same rows (genres compared by name).
+# data_dictionary is left out: its SmallInteger autoincrement key is only
+# generated by PostgreSQL.
+#
+#   python benchmarks/bench_load.py --tracks 5000 --events 20000
+
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import fixtures
+import concert_transforms
+import loaders
+from database import Base
+
+# what each table is compared on (genre ids replaced by names)
+queries = {
+    'artists': 'SELECT artist_id, name, popularity FROM artists',
+    'albums': 'SELECT * FROM albums',
+    'tracks': 'SELECT * FROM tracks',
+    'top_tracks': 'SELECT * FROM top_tracks',
+    'audio_features': 'SELECT * FROM audio_features',
+    'concerts': 'SELECT * FROM concerts',
+    'festivals': 'SELECT * FROM festivals',
+    'genres': 'SELECT name FROM genres',
+    'artist_genre': 'SELECT DISTINCT l.artist_id, g.name FROM artist_genre l JOIN genres g USING (genre_id)',
+    'artist_album': 'SELECT DISTINCT * FROM artist_album',
+    'artist_track': 'SELECT DISTINCT * FROM artist_track',
+    'concert_genre': 'SELECT DISTINCT l.concert_id, g.name FROM concert_genre l JOIN genres g USING (genre_id)',
+}
+
+
+def make_frames(tracks, events):
+    top50_df, artists_df, albums_df, audio_df = fixtures.spotify_frames(tracks)
+    concerts_df, festivals_df = concert_transforms.clean_concerts(fixtures.raw_concerts_frame(events))
+    return {'artists': artists_df, 'albums': albums_df, 'top50': top50_df, 'audio': audio_df,
+            'concerts': concerts_df, 'festivals': festivals_df}
+
+
+def load(mode, engine, frames, batch_size):
+    if mode == 'bulk':
+        loaders.bulk_load(engine, frames, batch_size)
+    else:
+        session = sessionmaker(bind=engine)()
+        loaders.merge_load(session, frames)
+        session.close()
+
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        return {name: sorted(map(tuple, conn.execute(text(query)).all()), key=repr) for name, query in queries.items()}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--tracks', type=int, default=2000)
+    arg_parser.add_argument('--events', type=int, default=10000)
+    arg_parser.add_argument('--batch-size', type=int, default=1000)
+    arg_parser.add_argument('--modes', nargs='+', default=['merge', 'bulk'])
+    args = arg_parser.parse_args()
+
+    frames = make_frames(args.tracks, args.events)
+    rows = sum(len(df) for df in frames.values())
+    print(f'{rows} rows: ' + ', '.join(f'{name} {len(df)}' for name, df in frames.items()))
+
+    snapshots = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            engine = create_engine('sqlite:///' + os.path.join(directory, f'{mode}.sqlite3'))
+            Base.metadata.create_all(engine)
+            for run in ('first load', 'reload'):
+                start = time.perf_counter()
+                load(mode, engine, frames, args.batch_size)
+                elapsed = time.perf_counter() - start
+                print(f'{mode:>6} {run:<10} {elapsed:7.2f}s  ({rows / elapsed:,.0f} rows/s)')
+            snapshots[mode] = snapshot(engine)
+            engine.dispose()
+
+    if len(snapshots) > 1:
+        first, *others = snapshots.values()
+        for other in others:
+            for name in queries:
+                assert first[name] == other[name], f'{name} differs between load modes'
+        print('both load modes give the same tables')
@@ -0,0 +1,88 @@
+# What [metrics] costs and what it records. A day's offline stages (cleaning,
+# creating the tables, loading Spotify and concert data into SQLite) run in
+# process with pipeline_runner on synthetic artifacts in a local store: first
+# with metrics disabled, then enabled with JSON-lines output (and the cleaning
+# stage under cProfile, if --profile: that run then includes the profiler's
+# overhead), then with Prometheus textfile output.
+# Prints the time of each run and the records of the enabled one.
+#
+#   python benchmarks/bench_metrics.py --events 50000 --tracks 500 --profile
+
+import argparse
+import configparser
+import json
+import os
+import sys
+import tempfile
+import time
+
+import fixtures
+import artifacts
+
+# pipeline_runner is in the project folder, above the scripts fixtures puts on the path
+sys.path.insert(0, fixtures.parent_directory)
+import pipeline_runner
+
+run_date = '2023-05-20'
+stages = ['clean', 'create_tables', 'load_spotify', 'load_concerts']
+
+
+def config(directory, name, metrics_options):
+    parser = configparser.ConfigParser()
+    parser.read_dict({'aws_boto_credentials': {'bucket_name': ''},
+                      'storage': {'backend': 'local', 'root': os.path.join(directory, 'artifacts')},
+                      'database': {'DB_URL': f'sqlite:///{os.path.join(directory, name)}.sqlite3',
+                                   'load_mode': 'bulk'},
+                      'metrics': metrics_options})
+    return parser
+
+
+def timed_run(directory, name, metrics_options):
+    start = time.perf_counter()
+    pipeline_runner.run(stages, run_date, config(directory, name, metrics_options))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--events', type=int, default=20000)
+    arg_parser.add_argument('--tracks', type=int, default=200)
+    arg_parser.add_argument('--profile', action='store_true', help='also profile the clean stage')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = artifacts.LocalStore(os.path.join(directory, 'artifacts'))
+        artifacts.write_frame(store, artifacts.artifact_name('concerts_df', run_date),
+                              fixtures.raw_concerts_frame(args.events))
+        for name, df in zip(['data/top50', 'data/artists_df', 'data/albums_df', 'data/audio_feats'],
+                            fixtures.spotify_frames(args.tracks, run_date)):
+            artifacts.write_frame(store, artifacts.artifact_name(name, run_date), df)
+
+        jsonl = os.path.join(directory, 'metrics.jsonl')
+        prom = os.path.join(directory, 'pipeline.prom')
+        # the first run in the process pays for imports and warm-up, it is not counted
+        timed_run(directory, 'warmup', {'enabled': 'false'})
+        disabled = timed_run(directory, 'disabled', {'enabled': 'false'})
+        enabled = timed_run(directory, 'jsonl', {'enabled': 'true', 'path': jsonl,
+                                                 'profile': 'clean' if args.profile else '',
+                                                 'profile_dir': os.path.join(directory, 'profiles')})
+        prometheus = timed_run(directory, 'prometheus', {'enabled': 'true', 'output': 'prometheus', 'path': prom})
+
+        print(f'{args.events} events, {args.tracks} tracks: metrics disabled {disabled:.2f}s, '
+              f'jsonl {enabled:.2f}s, prometheus {prometheus:.2f}s')
+        with open(jsonl) as f:
+            records = [json.loads(line) for line in f]
+        for record in records:
+            counts = {key: value for key, value in record.items()
+                      if key not in ('run_date', 'stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out')}
+            print(f"  {record['stage']:<18} wall {record['wall_s']:7.3f}s cpu {record['cpu_s']:7.3f}s "
+                  f"rss {record['peak_rss_mb']}MB rows {record['rows_in']} -> {record['rows_out']} {counts}")
+        # one textfile per top-level stage, next to prom
+        textfiles = sorted(name for name in os.listdir(directory) if name.startswith('pipeline_'))
+        samples = 0
+        for name in textfiles:
+            with open(os.path.join(directory, name)) as f:
+                samples += len(f.readlines())
+        print(f"prometheus textfiles: {', '.join(textfiles)} ({samples} samples)")
+        if args.profile:
+            print(f"profiles: {os.listdir(os.path.join(directory, 'profiles'))}")
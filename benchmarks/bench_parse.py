@@ -0,0 +1,52 @@
+# BeautifulSoup parse() against the lxml XPath fast path, serial and on a
+# process pool, over a stored corpus of event pages.
+# Without --corpus, a synthetic corpus is written to a temporary directory first.
+#
+#   python benchmarks/bench_parse.py --pages 2000 --workers 4
+#   python benchmarks/bench_parse.py --corpus path/to/saved/event/pages
+
+import argparse
+import os
+import tempfile
+import time
+
+import fixtures
+import concerts_data
+
+
+def timed(label, pages, settings):
+    start = time.perf_counter()
+    events = concerts_data.parse(pages, settings)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<22} {len(pages) / elapsed:>9.1f} pages/s  ({elapsed:.2f}s)')
+    return events
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--corpus')
+    arg_parser.add_argument('--pages', type=int, default=1000)
+    arg_parser.add_argument('--page-kb', type=int, default=20)
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    arg_parser.add_argument('--batch-size', type=int, default=concerts_data.PARSE_DEFAULTS['batch_size'])
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = tmp
+            fixtures.write_corpus(corpus, args.pages, args.page_kb)
+        pages = fixtures.read_corpus(corpus)
+    print(f'{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.1f} KB on average')
+
+    results = {}
+    for parser in ('bs4', 'lxml'):
+        for workers in (0, args.workers):
+            settings = {'workers': workers, 'batch_size': args.batch_size, 'parser': parser}
+            label = f'{parser} ' + (f'{workers} workers' if workers else 'serial')
+            results[label] = timed(label, pages, settings)
+
+    # every variant has to produce exactly the same rows
+    expected = results['bs4 serial']
+    for label, events in results.items():
+        assert events == expected, f'{label} differs from bs4 serial'
@@ -0,0 +1,178 @@
+# Resolving concert performers to Spotify artists (performers.py) against
+# searching the API for every performer name, one after the other (MockSpotify,
+# '--latency' seconds per call). The artists are made-up names; the performers
+# are some of them as written, some with a case, accent, spacing or punctuation
+# difference, some with a typo, and names the database doesn't have (half of them known to the API).
+# Also checks the trigram blocking against scoring every artist for a sample of
+# the names (same matches, or an artist as similar), then runs the whole stage
+# (performers.link) on SQLite and a local store and counts the links.
+#
+#   python benchmarks/bench_performers.py --artists 100000 --names 20000 --latency 0.05
+
+import argparse
+import configparser
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+import fixtures
+import artifacts
+import concert_schema
+import performers
+import spotify_fetch
+from database import Artist, Base, Concert, concert_artist_table
+from spotify_mock import MockSpotify
+
+syllables = ['ka', 'lo', 'mi', 'ra', 'ne', 'to', 'vi', 'sha', 'del', 'mar', 'gen', 'ly', 'bo', 'zu', 'qui', 'ster',
+             'an', 'el', 'or', 'ix', 'ay', 'ton', 'ber', 'ric']
+
+
+def made_up_name(rng):
+    words = [''.join(rng.choice(syllables) for _ in range(rng.randint(1, 3))).capitalize()
+             for _ in range(rng.randint(1, 3))]
+    if rng.random() < 0.1:
+        words = ['The'] + words
+    return ' '.join(words)
+
+
+def typo(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + rng.choice('aeiourst') + name[i + 1:] if rng.random() < 0.5 else name[:i] + name[i + 1:]
+
+
+def variant(name, rng):
+    # what concertful may write for the same artist
+    return rng.choice([name.upper(), name.replace('e', 'é', 1), f' {name}  ', f'{name}!'])
+
+
+def make_data(n_artists, n_names, seed=0):
+    # artists (the most popular first), and (performer name, expected artist_id or None, kind) per name
+    rng = random.Random(seed)
+    names = list(dict.fromkeys(made_up_name(rng) for _ in range(n_artists * 2)))[:n_artists]
+    artists = [(f'artist{i:07d}', name) for i, name in enumerate(names)]
+    known = {performers.normalize(name) for name in names}
+    unknown = list(dict.fromkeys(name for name in (made_up_name(rng) + ' ' + made_up_name(rng) for _ in range(n_names))
+                                 if performers.normalize(name) not in known))
+    known_to_api = [{'id': f'found{i:07d}', 'name': name, 'popularity': rng.randint(0, 100)}
+                    for i, name in enumerate(unknown[::2])]
+    performer_names = []
+    for i in range(n_names):
+        artist_id, name = rng.choice(artists)
+        draw = rng.random()
+        if draw < 0.5:
+            performer_names.append((name, artist_id, 'exact'))
+        elif draw < 0.7:
+            performer_names.append((variant(name, rng), artist_id, 'exact'))
+        elif draw < 0.85 and len(name) > 8:
+            performer_names.append((typo(name, rng), artist_id, 'similar'))
+        else:
+            performer_names.append((unknown[i % len(unknown)], None, 'unknown'))
+    return artists, known_to_api, performer_names
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def brute_force(index, key, threshold):
+    # every artist scored in Python, the best at threshold (the more popular on a tie)
+    best = None
+    for artist_key, artist_id in zip(index.keys, index.ids):
+        score = performers.similarity(key, artist_key)
+        if score >= threshold and (best is None or score > best[1]):
+            best = (artist_id, score)
+    return best
+
+
+def link_stage(artists, performer_names, per_concert=3, seed=0):
+    # performers.link on a SQLite database with the artists and the concerts
+    rng = random.Random(seed)
+    names = [name for name, _, _ in performer_names]
+    texts = [', '.join(rng.sample(names, rng.randint(1, per_concert))) + (', others' if rng.random() < 0.2 else '')
+             for _ in range(len(names) // 2)]
+    concerts = pd.DataFrame({'concert_id': [str(100000 + i) for i in range(len(texts))], 'performer': texts})
+    with tempfile.TemporaryDirectory() as directory:
+        parser = configparser.ConfigParser()
+        parser.read_dict({'aws_boto_credentials': {'bucket_name': ''},
+                          'storage': {'backend': 'local', 'root': os.path.join(directory, 'artifacts')},
+                          'database': {'DB_URL': f'sqlite:///{os.path.join(directory, "link.sqlite3")}'}})
+        store, storage = artifacts.store_from_config(parser)
+        artifacts.write_frame(store, artifacts.artifact_name('cleaned_concerts', '2023-05-20'),
+                              concert_schema.typed(concerts, concert_schema.concerts), storage)
+        engine = create_engine(parser.get('database', 'DB_URL'))
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(Artist.__table__.insert(), [{'artist_id': artist_id, 'name': name, 'popularity': 100 - i % 100}
+                                                     for i, (artist_id, name) in enumerate(artists)])
+            conn.execute(Concert.__table__.insert(), [{'concert_id': int(concert_id), 'performer': text}
+                                                      for concert_id, text in zip(concerts['concert_id'], texts)])
+        _, seconds = timed(lambda: performers.link('2023-05-20', parser, engine=engine, store=store))
+        # a second run replaces the links instead of adding to them
+        performers.link('2023-05-20', parser, engine=engine, store=store)
+        with engine.connect() as conn:
+            links = conn.execute(concert_artist_table.select()).all()
+        engine.dispose()
+    assert len(links) == len(set(links))
+    return len(concerts), len(links), seconds
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--artists', type=int, default=50000)
+    arg_parser.add_argument('--names', type=int, default=10000, help='performer names to resolve')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds per Spotify call')
+    arg_parser.add_argument('--workers', type=int, default=spotify_fetch.DEFAULTS['workers'])
+    arg_parser.add_argument('--sample', type=int, default=200, help='names checked against brute force')
+    args = arg_parser.parse_args()
+
+    artists, known_to_api, performer_names = make_data(args.artists, args.names)
+    names = [name for name, _, _ in performer_names]
+    distinct = list(dict.fromkeys(names))
+    mock = MockSpotify(n_tracks=0, latency=args.latency, extra_artists=known_to_api)
+    print(f'{len(artists)} artists, {len(names)} performer names ({len(distinct)} distinct)')
+
+    index, index_time = timed(lambda: performers.ArtistIndex(artists))
+    settings = dict(performers.DEFAULTS, search=True)
+    search_settings = dict(spotify_fetch.DEFAULTS, workers=args.workers, rate=0)
+    (ids, counts, new_artists), resolve_time = timed(lambda: performers.resolve(
+        names, index, settings, lambda wanted: spotify_fetch.search_artists(mock, wanted, search_settings)))
+    searches = mock.calls['search']
+    print(f'index: {index_time:.2f}s, resolve: {resolve_time:.2f}s with {searches} searches  {dict(counts)}')
+
+    # one search per distinct name, one after the other
+    baseline = min(len(distinct), 200)
+    _, search_time = timed(lambda: [mock.search(q=f'artist:{name}', type='artist', limit=5) for name in distinct[:baseline]])
+    search_time *= len(distinct) / baseline
+    print(f'searching every name: {len(distinct)} searches, ~{search_time:.1f}s '
+          f'(timed on {baseline}), {search_time / resolve_time:.0f}x slower')
+
+    wrong = [(name, ids.get(performers.normalize(name)), expected) for name, expected, kind in performer_names
+             if kind != 'unknown' and ids.get(performers.normalize(name)) != expected]
+    # a typo can make a name as close to another artist: only count those not at least as similar
+    wrong = [entry for entry in wrong if entry[1] is None or performers.similarity(
+        performers.normalize(entry[0]), index.keys[index.ids.index(entry[1])]) <
+        performers.similarity(performers.normalize(entry[0]), performers.normalize(dict(artists)[entry[2]]))]
+    print(f'known names resolved to another artist or not at all: {len(wrong)}')
+    linked = [name for name, _, kind in performer_names
+              if kind == 'unknown' and ids.get(performers.normalize(name), 'found').startswith('artist')]
+    print(f'names not in the database linked to a similar artist there: {len(linked)} of '
+          f'{sum(kind == "unknown" for _, _, kind in performer_names)}')
+
+    rng = random.Random(1)
+    sample = [key for key in rng.sample([performers.normalize(name) for name in distinct], min(args.sample, len(distinct)))
+              if key not in index.exact]
+    blocked, blocked_time = timed(lambda: index.match(sample, settings['threshold'], settings['candidates']))
+    brute, brute_time = timed(lambda: {key: brute_force(index, key, settings['threshold']) for key in sample})
+    missed = [key for key in sample if brute[key] is not None and
+              (key not in blocked or blocked[key][1] < brute[key][1] - 1e-9)]
+    print(f'{len(sample)} names not matched exactly: blocking {blocked_time:.3f}s, every artist {brute_time:.2f}s '
+          f'({brute_time / max(blocked_time, 1e-9):.0f}x), {len(missed)} best matches missed')
+
+    n_concerts, n_links, link_time = link_stage(artists, performer_names)
+    print(f'performers.link: {n_concerts} concerts, {n_links} links in {link_time:.2f}s')
@@ -0,0 +1,60 @@
+# Several playlists from a mock spotipy client (spotify_mock.py) that answers
+# with 429s when it gets more than --max-rate calls a second: one playlist after
+# another (metadata fetched per playlist, a 429 retried by the call that got
+# it) against spotify_fetch.fetch_playlists (pages and metadata batches on
+# --workers threads, metadata for all playlists at once, calls paced at --rate
+# and a 429 pausing every worker). Reports API calls, 429s and time, and checks
+# that both give the same rows.
+#
+#   python benchmarks/bench_playlists.py --playlists 10 --workers 8 --latency 0.05
+
+import argparse
+import time
+
+import fixtures
+import spotify_fetch
+from rate_limit import RetryScheduler
+from spotify_mock import MockSpotify
+
+
+def one_by_one(sp, playlists, date_, settings):
+    client = spotify_fetch.ScheduledClient(sp, RetryScheduler(0, spotify_fetch.spotify_retry_after,
+                                                              max_retries=settings['max_retries']))
+    rows = ([], [], [], [])
+    for playlist_id in playlists:
+        items = spotify_fetch.playlist_items(client, playlist_id)
+        for all_rows, playlist_rows in zip(rows, spotify_fetch.playlist_rows(client, items, date_, playlist_id)):
+            all_rows.extend(playlist_rows)
+    return rows
+
+
+def run(label, func, args, settings):
+    sp = MockSpotify(args.tracks, args.latency, n_playlists=args.playlists, playlist_size=args.playlist_size,
+                     max_rate=args.max_rate, retry_after=args.retry_after)
+    start = time.perf_counter()
+    rows = func(sp, list(sp.playlists), '2023-05-20', settings)
+    elapsed = time.perf_counter() - start
+    calls = sum(count for name, count in sp.calls.items() if name != '429')
+    print(f'{label:<12} {calls:5} calls  {sp.calls["429"]:4} x 429  {elapsed:6.2f}s  '
+          f'({len(rows[0])} playlist rows)')
+    return rows
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--playlists', type=int, default=10)
+    arg_parser.add_argument('--playlist-size', type=int, default=150, help='tracks per playlist, paged by 100')
+    arg_parser.add_argument('--tracks', type=int, default=1000, help='tracks the playlists are drawn from')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds per API call')
+    arg_parser.add_argument('--max-rate', type=float, default=30, help='calls per second before a 429')
+    arg_parser.add_argument('--retry-after', type=float, default=1.0)
+    arg_parser.add_argument('--workers', type=int, default=8)
+    arg_parser.add_argument('--rate', type=float, default=25, help='requests per second the scheduler allows')
+    args = arg_parser.parse_args()
+
+    settings = dict(spotify_fetch.DEFAULTS, workers=args.workers, rate=args.rate)
+    old = run('one by one', one_by_one, args, settings)
+    new = run('concurrent', spotify_fetch.fetch_playlists, args, settings)
+    unpaced = run('no pacing', spotify_fetch.fetch_playlists, args, dict(settings, rate=0))
+    assert old == new == unpaced, 'the playlists gave different rows'
+    print('same rows')
@@ -0,0 +1,150 @@
+# The dashboard's queries on a database with some history in it, against the
+# schema as it was (link tables without a primary key, no indexes besides the
+# primary keys) and the same database after upgrades.upgrade() has added the
+# link tables' keys and the indexes database.py defines. Both are SQLite files
+# with the same rows (a few links stored twice in the old one, as happened
+# before the keys). Reports milliseconds per query and SQLite's plan for each,
+# and checks that both give the same rows.
+#
+#   python benchmarks/bench_queries.py --days 365 --concerts 200000
+
+import argparse
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import Column, MetaData, Table, create_engine, text
+
+import fixtures
+import upgrades
+from database import Base
+
+queries = {
+    'top tracks by artist': ('SELECT t.date_on_top, t.playlist_id, t.rank_number, t.track_id FROM artist_track a '
+                             'JOIN top_tracks t ON t.track_id = a.track_id WHERE a.artist_id = :artist '
+                             'ORDER BY t.date_on_top, t.rank_number'),
+    'concerts in a city': ('SELECT concert_id, performer, venue, date FROM concerts '
+                           'WHERE location = :location AND date >= :start AND date < :end ORDER BY date, concert_id'),
+    'concerts by genre': ('SELECT c.concert_id, c.date FROM concert_genre g JOIN concerts c ON c.concert_id = g.concert_id '
+                          'WHERE g.genre_id = :genre AND c.date >= :start AND c.date < :end ORDER BY c.concert_id'),
+    'festivals starting': ('SELECT festival_id, start_date FROM festivals '
+                           'WHERE start_date >= :start AND start_date < :end ORDER BY festival_id'),
+    'artists of a genre': 'SELECT artist_id FROM artist_genre WHERE genre_id = :genre ORDER BY artist_id',
+    'tracks of an album': 'SELECT track_id FROM tracks WHERE album_id = :album ORDER BY track_id',
+}
+
+first_day = datetime.date(2022, 1, 1)
+
+
+def legacy_metadata():
+    # the tables without foreign keys, indexes or the link tables' primary keys
+    legacy = MetaData()
+    for table in Base.metadata.sorted_tables:
+        is_link = table in upgrades.link_tables
+        Table(table.name, legacy, *[Column(c.name, c.type, primary_key=c.primary_key and not is_link)
+                                    for c in table.columns])
+    return legacy
+
+
+def history(days, concerts, seed=0):
+    # {table: rows}: a playlist of 200 ranks a day drawn from 3000 tracks, and
+    # concerts over two years in fixtures.CITIES-like cities
+    rng = random.Random(seed)
+    artists = [f'artist{i:05d}' for i in range(1500)]
+    albums = [f'album{i:05d}' for i in range(2000)]
+    tracks = [f'track{i:05d}' for i in range(3000)]
+    genres = list(range(1, len(fixtures.GENRES) + 1))
+    cities = [f'City {i}, {state[:2].upper()}' for i, state in enumerate(fixtures.STATES * 5)]
+    rows = {
+        'artists': [{'artist_id': a, 'name': a, 'popularity': rng.randint(0, 100)} for a in artists],
+        'genres': [{'genre_id': g, 'name': name} for g, name in zip(genres, fixtures.GENRES)],
+        'albums': [{'album_id': a, 'title': a} for a in albums],
+        'tracks': [{'track_id': t, 'title': t, 'album_id': rng.choice(albums)} for t in tracks],
+        'artist_genre': [{'artist_id': a, 'genre_id': g} for a in artists for g in rng.sample(genres, 2)],
+        'artist_album': [{'artist_id': rng.choice(artists), 'album_id': a} for a in albums],
+        'artist_track': [{'artist_id': a, 'track_id': t} for t in tracks for a in rng.sample(artists, 2)],
+        'top_tracks': [{'date_on_top': first_day + datetime.timedelta(days=day), 'playlist_id': 'top',
+                        'rank_number': rank + 1, 'track_id': track}
+                       for day in range(days) for rank, track in enumerate(rng.sample(tracks, 200))],
+        'concerts': [], 'festivals': [], 'concert_genre': []}
+    for concert_id in range(1, concerts + 1):
+        date = first_day + datetime.timedelta(days=rng.randrange(730))
+        if rng.random() < 0.1:
+            rows['festivals'].append({'festival_id': str(concert_id), 'location': rng.choice(cities),
+                                      'start_date': date, 'end_date': date + datetime.timedelta(days=2)})
+            continue
+        rows['concerts'].append({'concert_id': concert_id, 'performer': f'Artist {concert_id % 5000}',
+                                 'venue': f'Venue {concert_id % 800}', 'location': rng.choice(cities), 'date': date})
+        rows['concert_genre'].extend({'concert_id': concert_id, 'genre_id': g} for g in rng.sample(genres, 2))
+    return rows, cities
+
+
+def write(engine, metadata, rows, duplicates=0.05, seed=0):
+    rng = random.Random(seed)
+    with engine.begin() as conn:
+        for name, table_rows in rows.items():
+            if name in ('artist_genre', 'artist_album', 'artist_track', 'concert_genre'):
+                # the old tables could hold the same link twice
+                table_rows = table_rows + rng.sample(table_rows, int(len(table_rows) * duplicates))
+            for start in range(0, len(table_rows), 10000):
+                conn.execute(metadata.tables[name].insert(), table_rows[start:start + 10000])
+
+
+def parameters(rows, cities, n, seed=1):
+    rng = random.Random(seed)
+    for _ in range(n):
+        start = first_day + datetime.timedelta(days=rng.randrange(700))
+        yield {'artist': rng.choice(rows['artists'])['artist_id'], 'location': rng.choice(cities),
+               'genre': rng.choice(rows['genres'])['genre_id'], 'album': rng.choice(rows['albums'])['album_id'],
+               'start': start.isoformat(), 'end': (start + datetime.timedelta(days=30)).isoformat()}
+
+
+def run(engine, query, params):
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        results = [set(map(tuple, conn.execute(text(query), p).all())) for p in params]
+        elapsed = time.perf_counter() - start
+        plan = ' / '.join(row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + query), params[0]))
+    return results, elapsed / len(params) * 1000, plan
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--days', type=int, default=365)
+    arg_parser.add_argument('--concerts', type=int, default=100000)
+    arg_parser.add_argument('--queries', type=int, default=50, help='runs of each query, with different parameters')
+    args = arg_parser.parse_args()
+
+    rows, cities = history(args.days, args.concerts)
+    print(f"{len(rows['top_tracks'])} top_tracks rows, {len(rows['concerts'])} concerts, "
+          f"{len(rows['festivals'])} festivals")
+    with tempfile.TemporaryDirectory() as directory:
+        old_path, new_path = os.path.join(directory, 'old.sqlite3'), os.path.join(directory, 'new.sqlite3')
+        old = create_engine('sqlite:///' + old_path)
+        legacy = legacy_metadata()
+        legacy.create_all(old)
+        write(old, legacy, rows)
+        old.dispose()
+
+        shutil.copy(old_path, new_path)
+        new = create_engine('sqlite:///' + new_path)
+        start = time.perf_counter()
+        dropped = upgrades.add_link_primary_keys(new)
+        added = upgrades.add_indexes(new)
+        print(f'upgrade: {time.perf_counter() - start:.2f}s, repeated links dropped {dropped}, '
+              f'{len(added)} indexes added')
+        old = create_engine('sqlite:///' + old_path)
+
+        params = list(parameters(rows, cities, args.queries))
+        for name, query in queries.items():
+            old_results, old_ms, old_plan = run(old, query, params)
+            new_results, new_ms, new_plan = run(new, query, params)
+            assert old_results == new_results, f'{name}: the results differ'
+            print(f'{name:<22} {old_ms:9.2f} ms -> {new_ms:7.2f} ms  ({old_ms / new_ms:,.0f}x)')
+            print(f'    before: {old_plan}\n    after:  {new_plan}')
+        print('same rows from both schemas')
+        old.dispose()
+        new.dispose()
@@ -0,0 +1,93 @@
+# A day's load on top of the previous day's, with and without row_hashes.py.
+# Day two is day one with --changed of the artists, albums, audio features and
+# concerts modified (popularity, a genre, a venue) and a new day of top tracks.
+# Each load mode loads both days into a fresh SQLite database, writing every row
+# (as before) and only the new or changed ones; reports the time of the second
+# load and the rows inserted/updated/skipped, and checks that the databases end
+# up holding the same rows (bench_load.py's comparison).
+#
+#   python benchmarks/bench_row_hashes.py --tracks 5000 --events 50000 --changed 0.05
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import fixtures
+import bench_load
+import loaders
+import row_hashes
+from database import Base
+
+
+def next_day(frames, changed, seed=0):
+    # the same data a day later, with a share of every entity changed
+    rng = random.Random(seed)
+    frames = {name: df.copy() for name, df in frames.items()}
+
+    def some(df):
+        return df.index[[rng.random() < changed for _ in range(len(df))]]
+
+    artists = frames['artists']
+    rows = some(artists)
+    artists.loc[rows, 'artist_popularity'] = [rng.randint(0, 100) for _ in rows]
+    for row in some(artists):
+        artists.at[row, 'artist_genres'] = list(artists.at[row, 'artist_genres']) + ['new genre']
+    rows = some(frames['albums'])
+    frames['albums'].loc[rows, 'album_popularity'] = [rng.randint(0, 100) for _ in rows]
+    rows = some(frames['audio'])
+    frames['audio'].loc[rows, 'energy'] = [rng.random() for _ in rows]
+    rows = some(frames['concerts'])
+    # a categorical column can't take new values
+    frames['concerts']['venue'] = frames['concerts']['venue'].astype(object)
+    frames['concerts'].loc[rows, 'venue'] = [f'Venue {rng.randint(1, 800)}' for _ in rows]
+    frames['top50'] = frames['top50'].assign(date_on_top='2023-05-21')
+    return frames
+
+
+def load(mode, engine, frames, hashes):
+    if mode == 'bulk':
+        return loaders.bulk_load(engine, frames, 1000, hashes)
+    session = sessionmaker(bind=engine)()
+    counts = loaders.merge_load(session, frames, hashes)
+    session.close()
+    return counts
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--tracks', type=int, default=2000)
+    arg_parser.add_argument('--events', type=int, default=10000)
+    arg_parser.add_argument('--changed', type=float, default=0.05)
+    arg_parser.add_argument('--modes', nargs='+', default=['merge', 'bulk'])
+    args = arg_parser.parse_args()
+
+    day_one = bench_load.make_frames(args.tracks, args.events)
+    day_two = next_day(day_one, args.changed)
+    print(f"{sum(len(df) for df in day_two.values())} rows a day, {args.changed:.0%} of each entity changed")
+
+    snapshots = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            for skip in (False, True):
+                label = f'{mode} ' + ('only changed' if skip else 'every row')
+                engine = create_engine('sqlite:///' + os.path.join(directory, f'{mode}_{skip}.sqlite3'))
+                Base.metadata.create_all(engine)
+                load(mode, engine, day_one, row_hashes.RowHashes() if skip else None)
+                hashes = row_hashes.RowHashes() if skip else None
+                start = time.perf_counter()
+                load(mode, engine, day_two, hashes)
+                elapsed = time.perf_counter() - start
+                print(f'{label:<18} second day {elapsed:7.2f}s' + (f'  {hashes.report()}' if hashes else ''))
+                snapshots[label] = bench_load.snapshot(engine)
+                engine.dispose()
+
+    first, *others = snapshots.values()
+    for other in others:
+        for name in bench_load.queries:
+            assert first[name] == other[name], f'{name} differs'
+    print('every load gives the same tables')
@@ -0,0 +1,117 @@
+# Separate scripts against pipeline_runner. First the start-up each stage script
+# pays on its own (a new interpreter importing the script and everything it
+# imports) against one interpreter importing the runner; the scripts are
+# imported without any pipeline.conf, so this also fails if one of them does
+# I/O when imported. Then a day's offline stages (cleaning, creating the
+# tables, loading Spotify and concert data into SQLite) on synthetic artifacts
+# in a local store: cleaning_concerts.py and data_transfer.py as separate
+# processes, the way the DAG ran them, against one 'python -m pipeline_runner'.
+# Both must leave the same rows in the database.
+# Last, the data dictionary stage both ways (data_dictionary.py and the
+# runner's data_dict), each into a store of its own: it is kept out of the
+# loads above since its generated key needs PostgreSQL.
+#
+#   python benchmarks/bench_runner.py --events 50000 --tracks 500
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixtures
+import artifacts
+
+project_directory = fixtures.parent_directory
+data_scripts = os.path.join(project_directory, 'data_scripts')
+database_scripts = os.path.join(project_directory, 'database_scripts')
+
+# the scripts the DAG used to start one by one
+stage_modules = [('data_scripts', 'getURLs'), ('data_scripts', 'concerts_data'), ('data_scripts', 'cleaning_concerts'),
+                 ('data_scripts', 'spotify_data'), ('data_scripts', 'data_dictionary'),
+                 ('database_scripts', 'database'), ('database_scripts', 'data_transfer')]
+
+tables = ['artists', 'albums', 'tracks', 'top_tracks', 'audio_features', 'concerts', 'festivals', 'genres',
+          'artist_genre', 'concert_genre']
+
+
+def timed_process(args, env=None):
+    start = time.perf_counter()
+    subprocess.run(args, check=True, env=env, cwd=project_directory, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_time(code):
+    # best of three fresh interpreters
+    return min(timed_process([sys.executable, '-c', code]) for _ in range(3))
+
+
+def write_conf(directory, name):
+    path = os.path.join(directory, f'{name}.conf')
+    with open(path, 'w') as f:
+        f.write(f'[aws_boto_credentials]\nbucket_name =\n'
+                f'[storage]\nbackend = local\nroot = {os.path.join(directory, "artifacts")}\n'
+                f'[database]\nDB_URL = sqlite:///{os.path.join(directory, name)}.sqlite3\nload_mode = bulk\n')
+    return path
+
+
+def counts(directory, name):
+    conn = sqlite3.connect(os.path.join(directory, f'{name}.sqlite3'))
+    result = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in tables}
+    conn.close()
+    return result
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--events', type=int, default=20000)
+    arg_parser.add_argument('--tracks', type=int, default=200)
+    args = arg_parser.parse_args()
+
+    print('start-up (interpreter + imports, best of 3)')
+    bare = import_time('pass')
+    separate = 0.0
+    for folder, module in stage_modules:
+        paths = [os.path.join(project_directory, folder), data_scripts]
+        seconds = import_time(f'import sys; sys.path[:0] = {paths!r}; import {module}')
+        separate += seconds
+        print(f'  {module:<18} {seconds:6.2f}s')
+    runner = import_time(f'import sys; sys.path.insert(0, {project_directory!r}); import pipeline_runner')
+    print(f'  {len(stage_modules)} scripts: {separate:.2f}s, pipeline_runner: {runner:.2f}s '
+          f'(bare interpreter {bare:.2f}s)')
+
+    run_date = '2023-05-20'
+    with tempfile.TemporaryDirectory() as directory:
+        store = artifacts.LocalStore(os.path.join(directory, 'artifacts'))
+        artifacts.write_frame(store, artifacts.artifact_name('concerts_df', run_date),
+                              fixtures.raw_concerts_frame(args.events))
+        for name, df in zip(['data/top50', 'data/artists_df', 'data/albums_df', 'data/audio_feats'],
+                            fixtures.spotify_frames(args.tracks, run_date)):
+            artifacts.write_frame(store, artifacts.artifact_name(name, run_date), df)
+
+        # the data dictionary is left out: its key is only generated by PostgreSQL
+        env = dict(os.environ, PIPELINE_CONF=write_conf(directory, 'scripts'))
+        scripts = [os.path.join(data_scripts, 'cleaning_concerts.py'), os.path.join(database_scripts, 'data_transfer.py')]
+        scripts_time = sum(timed_process([sys.executable, script, '--date', run_date], env) for script in scripts)
+
+        runner_time = timed_process([sys.executable, '-m', 'pipeline_runner', '--date', run_date,
+                                     '--config', write_conf(directory, 'runner'),
+                                     '--stages', 'clean', 'create_tables', 'load_spotify', 'load_concerts'])
+        print(f'{args.events} events, {args.tracks} tracks: separate scripts {scripts_time:.2f}s, '
+              f'pipeline_runner {runner_time:.2f}s')
+        assert counts(directory, 'scripts') == counts(directory, 'runner'), 'the databases differ'
+        print('same rows in both databases')
+
+        for name in ('scripts', 'runner'):
+            os.makedirs(os.path.join(directory, 'data_dict', name))
+        env = dict(os.environ, PIPELINE_CONF=write_conf(os.path.join(directory, 'data_dict', 'scripts'), 'scripts'))
+        timed_process([sys.executable, os.path.join(data_scripts, 'data_dictionary.py')], env)
+        timed_process([sys.executable, '-m', 'pipeline_runner', '--date', run_date, '--stages', 'data_dict',
+                       '--config', write_conf(os.path.join(directory, 'data_dict', 'runner'), 'runner')])
+        frames = [artifacts.read_frame(artifacts.LocalStore(os.path.join(directory, 'data_dict', name, 'artifacts')),
+                                       'data_dict')
+                  for name in ('scripts', 'runner')]
+        assert frames[0].equals(frames[1]) and len(frames[0]), 'the data dictionaries differ'
+        print(f'data dictionary: {len(frames[0])} rows both ways')
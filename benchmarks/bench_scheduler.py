@@ -0,0 +1,130 @@
+# load_scheduler.py: the frames' dependency order from the foreign keys, and a
+# day's load one frame at a time against the scheduled one.
+# With --url (a PostgreSQL database whose tables may be dropped and created
+# again) both loads run against it and must give the same tables. Without it
+# the frames are loaded into SQLite, which only takes one writer at a time (and
+# so is always loaded one by one); the scheduler is then run with each frame
+# replaced by a sleep as long as its SQLite load took, which shows how far the
+# schedule shortens the load when the frames can really run side by side.
+# Each simulated frame also counts statements in its own metrics stage, in
+# steps between its sleeps: every stage must end up with only its own count,
+# even while the frames run side by side.
+#
+#   python benchmarks/bench_scheduler.py --tracks 5000 --events 50000 --parallelism 4
+#   python benchmarks/bench_scheduler.py --url postgresql://localhost/scratch --mode merge
+
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import fixtures
+import bench_load
+import load_scheduler
+import loaders
+import metrics
+from database import Base
+
+
+def timed_load(engine, frames, mode, parallelism):
+    # {frame: (start, end)} seconds from the start of the load
+    frames = loaders.prepare(frames)
+    times = {}
+    start = time.perf_counter()
+
+    def load_frame(name):
+        began = time.perf_counter() - start
+        if mode == 'bulk':
+            loaders.bulk_frame(engine, name, frames[name])
+        else:
+            session = sessionmaker(bind=engine)()
+            loaders.merge_frame(session, name, frames[name])
+            session.close()
+        times[name] = (began, time.perf_counter() - start)
+
+    load_scheduler.run(load_frame, loaders.loadable(frames), parallelism)
+    return times
+
+
+def show(label, times):
+    total = max(end for _, end in times.values())
+    print(f'{label}: {total:.2f}s')
+    for name, (began, end) in sorted(times.items(), key=lambda item: item[1]):
+        print(f'    {name:<10} {began:6.2f}s -> {end:6.2f}s')
+    return total
+
+
+class Collected(metrics.Recorder):
+    # keeps the finished stages instead of writing them out
+
+    def finished(self, stage):
+        self.stages.append(stage)
+
+
+def fresh_engine(url):
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--tracks', type=int, default=2000)
+    arg_parser.add_argument('--events', type=int, default=20000)
+    arg_parser.add_argument('--mode', choices=['bulk', 'merge'], default='bulk')
+    arg_parser.add_argument('--parallelism', type=int, default=load_scheduler.DEFAULTS['load_parallelism'])
+    arg_parser.add_argument('--url', help='PostgreSQL database to load into (default: SQLite files)')
+    args = arg_parser.parse_args()
+
+    print('frames wait for:')
+    for name, parents in load_scheduler.dependencies().items():
+        print(f"    {name:<10} {', '.join(sorted(parents)) or '-'}")
+
+    frames = bench_load.make_frames(args.tracks, args.events)
+    print(f"{sum(len(df) for df in frames.values())} rows, {args.mode} load")
+
+    if args.url:
+        engine = fresh_engine(args.url)
+        serial = show('one at a time', timed_load(engine, frames, args.mode, 1))
+        serial_tables = bench_load.snapshot(engine)
+        engine.dispose()
+        engine = fresh_engine(args.url)
+        scheduled = show(f'scheduled, {args.parallelism} at a time',
+                         timed_load(engine, frames, args.mode, args.parallelism))
+        assert bench_load.snapshot(engine) == serial_tables, 'the tables differ'
+        engine.dispose()
+        print(f'{serial / scheduled:.1f}x, same tables')
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = fresh_engine('sqlite:///' + os.path.join(directory, 'load.sqlite3'))
+            times = timed_load(engine, frames, args.mode, 1)
+            engine.dispose()
+        serial = show('one at a time (SQLite)', times)
+        durations = {name: end - began for name, (began, end) in times.items()}
+        simulated = {}
+        start = time.perf_counter()
+
+        statements = {name: 10 * (i + 1) for i, name in enumerate(durations)}
+
+        def sleep_frame(name):
+            began = time.perf_counter() - start
+            with metrics.stage(f'load.{name}'):
+                for _ in range(statements[name]):
+                    metrics.count('db_statements')
+                    time.sleep(durations[name] / statements[name])
+            simulated[name] = (began, time.perf_counter() - start)
+
+        metrics.recorder = recorder = Collected()
+        with metrics.stage('load'):
+            load_scheduler.run(sleep_frame, list(durations), args.parallelism)
+        metrics.recorder = None
+        scheduled = show(f'scheduled, {args.parallelism} at a time (frames as sleeps)', simulated)
+        print(f'{serial / scheduled:.1f}x')
+        counted = {stage.name: stage.counts['db_statements'] for stage in recorder.stages}
+        assert counted == dict({f'load.{name}': n for name, n in statements.items()},
+                               load=sum(statements.values())), counted
+        print('every frame counted only its own statements')
@@ -0,0 +1,75 @@
+# Playlist metadata from a mock spotipy client (spotify_mock.py): the original
+# per-item sp.album/sp.artist/sp.audio_features loop against
+# spotify_fetch.playlist_rows with the batch endpoints. Reports API calls and
+# time (--latency seconds per call) and checks that both give the same
+# DataFrames once spotify_data.py has dropped its duplicates.
+#
+#   python benchmarks/bench_spotify.py --tracks 50 --latency 0.05
+
+import argparse
+import time
+
+import pandas as pd
+
+import fixtures
+import spotify_data
+import spotify_fetch
+from spotify_mock import MockSpotify
+
+
+def legacy_rows(sp, items, date_):
+    # the loop spotify_data.py used to run
+    top50_data = []
+    albums_data = []
+    artists_data = []
+    tracks_info = []
+    for rank, track in enumerate(items):
+        rank_no = rank + 1
+        track_id = track['track']['id']
+        tracks_artists_id = [artist['id'] for artist in track['track']['artists']]
+        album_id = track['track']['album']['id']
+        album_pg = sp.album(album_id)
+        for artist_id in tracks_artists_id:
+            artist_pg = sp.artist(artist_id)
+            artists_data.append({'artist_id': artist_id, 'artist_name': artist_pg['name'],
+                                 'artist_popularity': artist_pg['popularity'], 'artist_genres': artist_pg['genres']})
+        audio_feats = sp.audio_features(track_id)[0]
+        top50_data.append({'date_on_top': date_, 'rank_no': rank_no, 'track_id': track_id,
+                           'track_name': track['track']['name'], 'artists_ids': tracks_artists_id,
+                           'album_id': album_id})
+        albums_data.append({'album_id': album_id, 'album_name': album_pg['name'], 'album_label': album_pg['label'],
+                            'album_popularity': album_pg['popularity'], 'album_release_date': album_pg['release_date'],
+                            'album_total_tracks': album_pg['total_tracks'],
+                            'album_artists_ids': [artist['id'] for artist in album_pg['artists']],
+                            'album_type': album_pg['album_type']})
+        rows_feats = {'track_id': track_id}
+        rows_feats.update((column, audio_feats[column]) for column in spotify_fetch.audio_feature_columns)
+        tracks_info.append(rows_feats)
+    return top50_data, artists_data, albums_data, tracks_info
+
+
+def run(label, func, n_tracks, latency):
+    sp = MockSpotify(n_tracks, latency)
+    items = sp.playlist_tracks('top50', limit=n_tracks)['items']
+    sp.calls.clear()
+    start = time.perf_counter()
+    rows = func(sp, items, '2023-05-20')
+    elapsed = time.perf_counter() - start
+    calls = ', '.join(f'{name} {count}' for name, count in sorted(sp.calls.items()))
+    print(f'{label:<8} {sum(sp.calls.values()):5} calls ({calls})  {elapsed:6.2f}s')
+    # the DataFrames spotify_data.py stores
+    return spotify_data.playlist_frames(*rows)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--tracks', type=int, nargs='+', default=[50, 100])
+    arg_parser.add_argument('--latency', type=float, default=0.02, help='seconds per API call')
+    args = arg_parser.parse_args()
+
+    for n_tracks in args.tracks:
+        print(f'{n_tracks} tracks')
+        old = run('per item', legacy_rows, n_tracks, args.latency)
+        new = run('batched', spotify_fetch.playlist_rows, n_tracks, args.latency)
+        for old_df, new_df in zip(old, new):
+            pd.testing.assert_frame_equal(old_df, new_df)
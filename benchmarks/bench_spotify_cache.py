@@ -0,0 +1,73 @@
+# Daily runs of spotify_fetch.fetch_playlists against a mock client (see
+# spotify_mock.py), with and without a spotify_cache.SpotifyCache. Each day the
+# playlists drop some tracks and pick up new ones, and the clock moves on by a
+# day, so artists (24h TTL) are fetched every day while albums and audio
+# features mostly come from the cache. Reports API calls per day, the cache's
+# hits and misses, and checks both give the same rows.
+#
+#   python benchmarks/bench_spotify_cache.py --days 7 --playlists 5
+
+import argparse
+import os
+import random
+import tempfile
+
+import fixtures
+import spotify_cache
+import spotify_fetch
+from spotify_mock import MockSpotify
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def __call__(self):
+        return self.now
+
+
+def next_day(sp, rng, churn):
+    # every playlist swaps 'churn' of its tracks for others
+    for playlist in sp.playlists.values():
+        others = [track_id for track_id in sp.playlist if track_id not in set(playlist)]
+        for position in rng.sample(range(len(playlist)), int(len(playlist) * churn)):
+            playlist[position] = others.pop(rng.randrange(len(others)))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--days', type=int, default=7)
+    arg_parser.add_argument('--playlists', type=int, default=5)
+    arg_parser.add_argument('--playlist-size', type=int, default=50)
+    arg_parser.add_argument('--tracks', type=int, default=2000)
+    arg_parser.add_argument('--churn', type=float, default=0.1, help='share of each playlist replaced per day')
+    arg_parser.add_argument('--max-entries', type=int, default=spotify_cache.DEFAULTS['max_entries'])
+    args = arg_parser.parse_args()
+
+    settings = dict(spotify_fetch.DEFAULTS, rate=0)
+    sp = MockSpotify(args.tracks, n_playlists=args.playlists, playlist_size=args.playlist_size)
+    rng = random.Random(1)
+    clock = Clock()
+    totals = {'no cache': 0, 'cache': 0}
+    with tempfile.TemporaryDirectory() as directory:
+        cache = spotify_cache.SpotifyCache(os.path.join(directory, 'cache.sqlite3'),
+                                           dict(spotify_cache.DEFAULTS, max_entries=args.max_entries), clock)
+        for day in range(args.days):
+            if day:
+                next_day(sp, rng, args.churn)
+                clock.now += 86400
+            calls = {}
+            rows = {}
+            for label, day_cache in (('no cache', None), ('cache', cache)):
+                sp.calls.clear()
+                rows[label] = spotify_fetch.fetch_playlists(sp, list(sp.playlists), f'day {day}', settings,
+                                                            cache=day_cache)
+                calls[label] = sum(count for name, count in sp.calls.items() if name != 'playlist_tracks')
+                totals[label] += calls[label]
+            assert rows['no cache'] == rows['cache'], f'day {day}: the cache changed the rows'
+            cache.evict()
+            print(f'day {day}: metadata calls {calls["no cache"]:3} without cache, {calls["cache"]:3} with')
+        print(f'total: {totals["no cache"]} without cache, {totals["cache"]} with')
+        print(cache.stats())
+        cache.close()
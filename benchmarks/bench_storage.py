@@ -0,0 +1,76 @@
+# Writing and reading a cleaned concerts frame through artifacts.py in each
+# format: size, write time, full read, a two-column read, and a pass over the
+# row groups. '--backend s3' runs against moto's in-memory S3 (moto must be
+# installed) and also reports how many bytes the two-column read downloaded.
+#
+#   python benchmarks/bench_storage.py --rows 500000 --backend s3
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import fixtures
+import artifacts
+import concert_transforms
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run(store, df, formats, row_group_size):
+    columns = ['concert_id', 'date']
+    for fmt in formats:
+        settings = dict(artifacts.DEFAULTS, format=fmt, row_group_size=row_group_size)
+        key, write_time = timed(lambda: artifacts.write_frame(store, 'cleaned_concerts', df, settings))
+        size = store.size(key)
+        back, read_time = timed(lambda: artifacts.read_frame(store, 'cleaned_concerts', settings=settings))
+        pd.testing.assert_frame_equal(df, back)
+        _, columns_time = timed(lambda: artifacts.read_frame(store, 'cleaned_concerts', columns, settings))
+        rows, stream_time = timed(lambda: sum(len(part) for part in
+                                              artifacts.iter_frames(store, 'cleaned_concerts', columns, settings)))
+        line = (f'{fmt:>8}: {size / 2**20:7.1f} MB  write {write_time:6.2f}s  read {read_time:6.2f}s  '
+                f'2 columns {columns_time:6.2f}s  row groups {stream_time:6.2f}s')
+        if isinstance(store, artifacts.S3Store) and fmt != 'pickle':
+            with store.open(key) as f:
+                if fmt == 'parquet':
+                    import pyarrow.parquet as pq
+                    pq.ParquetFile(f).read(columns=columns)
+                else:
+                    import pyarrow as pa
+                    pa.ipc.open_file(f).read_all().select(columns)
+                line += f'  (2 columns downloaded {f.raw.bytes_read / 2**20:.1f} MB)'
+        print(line)
+        # the next format must not find this one
+        if isinstance(store, artifacts.LocalStore):
+            os.remove(store.path(key))
+        else:
+            store.client.delete_object(Bucket=store.bucket, Key=key)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=200000)
+    arg_parser.add_argument('--backend', choices=['local', 's3'], default='local')
+    arg_parser.add_argument('--formats', nargs='+', default=['pickle', 'parquet', 'arrow'])
+    arg_parser.add_argument('--row-group-size', type=int, default=artifacts.DEFAULTS['row_group_size'])
+    args = arg_parser.parse_args()
+
+    concerts_df, _ = concert_transforms.clean_concerts(fixtures.raw_concerts_frame(args.rows))
+    print(f'{len(concerts_df)} concerts')
+    if args.backend == 'local':
+        with tempfile.TemporaryDirectory() as root:
+            run(artifacts.LocalStore(root), concerts_df, args.formats, args.row_group_size)
+    else:
+        import boto3
+        from moto import mock_aws
+
+        with mock_aws():
+            client = boto3.client('s3', region_name='us-east-1')
+            client.create_bucket(Bucket='bench-artifacts')
+            run(artifacts.S3Store('bench-artifacts', client), concerts_df, args.formats, args.row_group_size)
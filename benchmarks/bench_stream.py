@@ -0,0 +1,56 @@
+# Peak memory of the collect-then-parse path (main + parse) against the
+# streaming path (stream_events), at a few crawl sizes.
+# Each run happens in a fresh subprocess so ru_maxrss is that run's own peak.
+#
+#   python benchmarks/bench_stream.py --events 500 2000 --page-kb 20
+
+import argparse
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+
+import concert_site
+import fixtures
+
+
+async def crawl(mode, events, page_kb):
+    import concerts_data
+
+    server, base_url = concert_site.start_process(page_kb=page_kb)
+    urls = [f'{base_url}/event/{event_id}' for event_id in fixtures.event_ids(events)]
+    try:
+        if mode == 'stream':
+            df, failures, stats = await concerts_data.stream_events(urls)
+        else:
+            pages, failures, stats = await concerts_data.main(urls)
+            df = concerts_data.events_frame(concerts_data.parse([page.text for page in pages]),
+                                            concerts_data.get_ids([page.url for page in pages]))
+    finally:
+        server.terminate()
+    return len(df), stats
+
+
+def child(mode, events, page_kb):
+    start = time.perf_counter()
+    rows, stats = asyncio.run(crawl(mode, events, page_kb))
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{mode:>7} {events:>7} events: {rows} rows in {elapsed:.2f}s, peak RSS {peak_mb:.0f} MB '
+          f'({stats["pages_per_sec"]} pages/s)')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--events', type=int, nargs='+', default=[500, 2000])
+    arg_parser.add_argument('--page-kb', type=int, default=20)
+    arg_parser.add_argument('--child', choices=['batch', 'stream'])
+    args = arg_parser.parse_args()
+    if args.child:
+        child(args.child, args.events[0], args.page_kb)
+    else:
+        for events in args.events:
+            for mode in ('batch', 'stream'):
+                subprocess.run([sys.executable, __file__, '--child', mode, '--events', str(events),
+                                '--page-kb', str(args.page_kb)], check=True)
@@ -0,0 +1,101 @@
+# A local aiohttp stand-in for concertful.com.
+# Serves synthetic event pages at /event/<id> with optional added latency and
+# injected failures, so the fetch engine can be exercised and measured offline,
+# and the area/state listing pages (with ?page=N pagination) used for URL discovery.
+#
+#   python benchmarks/concert_site.py --port 8080 --latency 0.05 --failure-rate 0.1
+
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from aiohttp import web
+
+import fixtures
+
+
+def make_app(latency=0.0, failure_rate=0.0, seed=0, filler_kb=0):
+    rng = random.Random(seed)
+    app = web.Application()
+    # mutable so it can still be reset/read after the app has started
+    # bump 'version' to make every ETag change
+    app['counters'] = {'hits': 0, 'version': 1}
+
+    async def event(request):
+        app['counters']['hits'] += 1
+        if latency:
+            await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        if rng.random() < failure_rate:
+            raise web.HTTPServiceUnavailable()
+        event_id = request.match_info['event_id']
+        if not event_id.isdigit():
+            raise web.HTTPNotFound()
+        # pages carry an ETag so conditional requests (incremental mode) can get a 304
+        etag = f'"{event_id}-{app["counters"]["version"]}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(text=fixtures.event_html(int(event_id), filler_kb=filler_kb),
+                            content_type='text/html', headers={'ETag': etag})
+
+    async def area(request):
+        app['counters']['hits'] += 1
+        return web.Response(text=fixtures.area_html(), content_type='text/html')
+
+    async def state(request):
+        app['counters']['hits'] += 1
+        if latency:
+            await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        name = request.match_info['state']
+        if name not in fixtures.STATES:
+            raise web.HTTPNotFound()
+        page = int(request.query.get('page', 1))
+        return web.Response(text=fixtures.state_page_html(fixtures.STATES.index(name), page),
+                            content_type='text/html')
+
+    app.router.add_get('/event/{event_id}', event)
+    app.router.add_get('/area/united-states/', area)
+    app.router.add_get('/area/united-states/{state}/', state)
+    return app
+
+
+async def start(app, host='127.0.0.1', port=0):
+    # port=0 picks a free port; returns the runner (to clean up) and the base URL
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://{host}:{port}'
+
+
+def start_process(latency=0.0, failure_rate=0.0, page_kb=0):
+    # same site in a separate process, for benchmarks where the client side is
+    # CPU-bound and would otherwise slow the server down as well
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, '--port', str(port), '--latency', str(latency),
+                                '--failure-rate', str(failure_rate), '--page-kb', str(page_kb)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process, f'http://127.0.0.1:{port}'
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--port', type=int, default=8080)
+    arg_parser.add_argument('--latency', type=float, default=0.0)
+    arg_parser.add_argument('--failure-rate', type=float, default=0.0)
+    arg_parser.add_argument('--page-kb', type=int, default=0)
+    args = arg_parser.parse_args()
+    web.run_app(make_app(args.latency, args.failure_rate, filler_kb=args.page_kb),
+                host='127.0.0.1', port=args.port)
@@ -0,0 +1,238 @@
+# Synthetic stand-ins for the pages and data the pipeline works with, so the
+# scripts can be exercised and timed without hitting concertful.com.
+# The event page mimics the parts of a concertful event page that
+# concerts_data.parse() and cleaning_concerts.py rely on: the first four <tr>
+# rows (performer, venue, date, genre) and the '.aln' ranking.
+
+import gzip
+import os
+import random
+import sys
+
+# make the pipeline scripts importable the same way they import each other
+current_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.dirname(current_directory)
+for folder in ('data_scripts', 'database_scripts'):
+    path = os.path.join(parent_directory, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+SHORT_WEEKDAYS = ['Mon', 'Tues', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+GENRES = ['Rock', 'Pop', 'Hip Hop', 'Country', 'Jazz', 'Metal', 'Indie', 'Electronic', 'Blues', 'Folk']
+CITIES = [('Austin', 'TX'), ('Chicago', 'IL'), ('Denver', 'CO'), ('Nashville', 'TN'),
+          ('Seattle', 'WA'), ('Portland', 'OR'), ('Atlanta', 'GA'), ('Boston', 'MA')]
+
+
+def event_fields(event_id, festival_share=0.1):
+    # the same event_id always produces the same event
+    rng = random.Random(event_id)
+    performers = [f'Artist {rng.randint(1, 5000)}' for _ in range(rng.randint(1, 4))]
+    more = rng.random() < 0.2
+    city, state = rng.choice(CITIES)
+    venue = f'Venue {rng.randint(1, 800)}'
+    address = f'{rng.randint(1, 999)} Main St, {city}, {state} {rng.randint(10000, 99999)}, United States'
+    month = rng.randrange(12)
+    day = rng.randint(1, 28)
+    year = rng.choice([2023, 2024])
+    weekday = rng.randrange(7)
+    if rng.random() < festival_share:
+        end = day + rng.randint(1, 3)
+        date = (f'{WEEKDAYS[weekday]}, {MONTHS[month]} {day}, {year} - '
+                f'{SHORT_WEEKDAYS[(weekday + end - day) % 7]}, {MONTHS[month]} {end}, {year}')
+        genres = ['Festival']
+    else:
+        hour = rng.randint(1, 11)
+        minute = rng.choice(['00', '30'])
+        date = f'{WEEKDAYS[weekday]}, {MONTHS[month]} {day}, {year} | {hour}:{minute}pm'
+        genres = rng.sample(GENRES, rng.randint(1, 2))
+    return {'performers': performers, 'more': more, 'venue': venue, 'address': address,
+            'date': date, 'genres': genres, 'ranking': rng.randint(1, 20000)}
+
+
+def event_html(event_id, festival_share=0.1, filler_kb=0):
+    # filler_kb pads the page with unrelated markup, real event pages are
+    # tens of KB of navigation/scripts around the few rows we read
+    f = event_fields(event_id, festival_share)
+    # whitespace between tags matters: BeautifulSoup keeps each whitespace-only
+    # string as one '\n', which is what the regexes in cleaning_concerts.py expect
+    performers = '\n'.join(f'<a href="/artist/{name.replace(" ", "-")}/">{name}</a>'
+                           for name in f['performers'])
+    if f['more']:
+        performers += '\n\t\t\t<a href="#">and More >></a>'
+    return (
+        '<!DOCTYPE html>\n<html><head><title>Event</title></head><body>\n'
+        '<div class="event_info"><table>\n'
+        f'<tr>\n<td>Performer:</td>\n<td>\n<div>\n{performers}\n</div>\n</td>\n</tr>\n'
+        f'<tr>\n<td>Venue:</td>\n<td>\n<b>{f["venue"]}</b>\n<span>{f["address"]}</span>\n</td></tr>\n'
+        f'<tr>\n<td>Date:</td>\n<td>\t\t{f["date"]}</td>\n</tr>\n'
+        f'<tr>\n<td>Genre:</td>\n<td>{" / ".join(f["genres"])}</td>\n</tr>\n'
+        '</table></div>\n'
+        f'<div class="rank"><span class="aln">#{f["ranking"]}</span></div>\n'
+        + '<div class="filler"><p>lorem ipsum dolor sit amet</p></div>\n' * (filler_kb * 16)
+        + '</body></html>\n')
+
+
+def event_ids(n, start=100000):
+    return list(range(start, start + n))
+
+
+def write_corpus(directory, n, filler_kb=20):
+    # stores n synthetic event pages as <event_id>.html, for benchmarks that
+    # should run on the same files every time (real pages can be dropped in too)
+    os.makedirs(directory, exist_ok=True)
+    for event_id in event_ids(n):
+        with open(os.path.join(directory, f'{event_id}.html'), 'w') as f:
+            f.write(event_html(event_id, filler_kb=filler_kb))
+
+
+def read_corpus(directory):
+    # <event_id>.html, or .html.gz as record_pages.py saves real pages
+    names = sorted(name for name in os.listdir(directory) if name.endswith(('.html', '.html.gz')))
+    pages = []
+    for name in names:
+        path = os.path.join(directory, name)
+        with (gzip.open(path, 'rt', encoding='utf-8') if name.endswith('.gz') else open(path)) as f:
+            pages.append(f.read())
+    return pages
+
+
+STATES = ['alabama', 'alaska', 'arizona', 'arkansas', 'california', 'colorado', 'connecticut',
+          'delaware', 'florida', 'georgia', 'hawaii', 'idaho', 'illinois', 'indiana', 'iowa',
+          'kansas', 'kentucky', 'louisiana', 'maine', 'maryland']
+EVENTS_PER_PAGE = 20
+
+
+def state_event_ids(state_index, seed=0):
+    # between a few and ~8 pages worth of events per state, fixed for a given state
+    rng = random.Random(seed * 1000 + state_index)
+    count = rng.randint(3, 8 * EVENTS_PER_PAGE)
+    return [1000000 + state_index * 10000 + k for k in range(count)]
+
+
+def area_html(states=STATES):
+    links = '\n'.join(f'<li><a href="/area/united-states/{state}/">{state.title()}</a></li>' for state in states)
+    return ('<!DOCTYPE html>\n<html><body>\n<a href="/area/united-states/">United States</a>\n'
+            f'<ul class="areas">\n{links}\n</ul>\n</body></html>\n')
+
+
+def state_page_html(state_index, page=1, seed=0):
+    ids = state_event_ids(state_index, seed)
+    total_pages = max(1, -(-len(ids) // EVENTS_PER_PAGE))
+    page_ids = ids[(page - 1) * EVENTS_PER_PAGE:page * EVENTS_PER_PAGE]
+    events = '\n'.join(f'<div class="event"><a href="/event/{event_id}">Event {event_id}</a></div>'
+                       for event_id in page_ids)
+    counter = (f'<div class="buttons_counter"><span>Page {page} of {total_pages}</span></div>\n'
+               if total_pages > 1 else '')
+    return f'<!DOCTYPE html>\n<html><body>\n<div class="events">\n{events}\n</div>\n{counter}</body></html>\n'
+
+
+def event_row(event_id, festival_share=0.1):
+    # what concerts_data.parse() returns for event_html(event_id), without the HTML round trip
+    f = event_fields(event_id, festival_share)
+    performers = '\n'.join(f['performers']) + ('\nand More >>' if f['more'] else '')
+    return [f'\nPerformer:\n\n\n{performers}\n\n\n',
+            f'\nVenue:\n\n{f["venue"]}\n{f["address"]}\n',
+            f'\nDate:\n\t\t{f["date"]}\n',
+            f'\nGenre:\n{" / ".join(f["genres"])}\n',
+            str(f['ranking'])]
+
+
+def raw_concerts_frame(n, festival_share=0.1, start=100000, unique=None):
+    # the DataFrame concerts_data.py uploads: parsed rows plus 'concert_id'
+    # unique: generate only that many distinct events and repeat them up to n rows
+    # (ids included), which is how 1M-row frames stay quick to make
+    import pandas as pd
+
+    distinct = min(unique or n, n)
+    ids = event_ids(distinct, start)
+    df = pd.DataFrame([event_row(event_id, festival_share) for event_id in ids],
+                      columns=['performer', 'venue', 'date', 'genre', 'ranking'])
+    df['concert_id'] = [str(event_id) for event_id in ids]
+    if distinct < n:
+        df = df.iloc[[i % distinct for i in range(n)]].reset_index(drop=True)
+    return df
+
+
+GENRES = ['pop', 'dance pop', 'rap', 'hip hop', 'trap', 'r&b', 'latin', 'reggaeton', 'country', 'rock',
+          'indie', 'edm', 'k-pop', 'alt z', 'soul']
+
+
+def spotify_frames(n_tracks, date_on_top='2023-05-20', seed=0):
+    # the four DataFrames spotify_data.py writes, for n_tracks playlist entries
+    import pandas as pd
+
+    rng = random.Random(seed)
+    n_artists = max(1, n_tracks // 2)
+    artists = [f'artist{i:06d}' for i in range(n_artists)]
+    top50, albums, audio = [], {}, []
+    for rank in range(n_tracks):
+        track_id = f'track{rank:07d}'
+        track_artists = rng.sample(artists, min(len(artists), rng.randint(1, 3)))
+        album_id = f'album{rng.randrange(max(1, n_tracks * 2 // 3)):06d}'
+        albums.setdefault(album_id, {'album_id': album_id, 'album_name': f'Album {album_id}',
+                                     'album_label': f'Label {rng.randrange(50)}',
+                                     'album_popularity': rng.randint(0, 100),
+                                     'album_release_date': f'20{rng.randint(10, 23)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}',
+                                     'album_total_tracks': rng.randint(1, 20),
+                                     'album_artists_ids': track_artists[:1], 'album_type': 'album'})
+        top50.append({'date_on_top': date_on_top, 'rank_no': rank + 1, 'track_id': track_id,
+                      'track_name': f'Track {rank}', 'artists_ids': track_artists, 'album_id': album_id})
+        audio.append({'track_id': track_id, 'acousticness': rng.random(), 'danceability': rng.random(),
+                      'energy': rng.random(), 'key': rng.randint(-1, 11), 'loudness': -60 * rng.random(),
+                      'mode': rng.randint(0, 1), 'speechiness': rng.random(), 'instrumentalness': rng.random(),
+                      'liveness': rng.random(), 'valence': rng.random(), 'tempo': 60 + 120 * rng.random(),
+                      'duration_ms': rng.randint(90000, 400000), 'time_signature': rng.randint(3, 7)})
+    artists_df = pd.DataFrame([{'artist_id': artist_id, 'artist_name': f'Artist {artist_id}',
+                                'artist_popularity': rng.randint(0, 100),
+                                'artist_genres': rng.sample(GENRES, rng.randint(0, 3))} for artist_id in artists])
+    return pd.DataFrame(top50), artists_df, pd.DataFrame(list(albums.values())), pd.DataFrame(audio)
+
+
+def spotify_responses(n_tracks, seed=0):
+    # the Web API responses for a playlist of n_tracks, as MockSpotify answers
+    # them: every playlist page and every albums/artists/audio_features batch
+    from spotify_mock import MockSpotify
+    import spotify_fetch
+
+    sp = MockSpotify(n_tracks, seed=seed)
+    pages, offset = [], 0
+    while offset < n_tracks:
+        pages.append(sp.playlist_tracks('top50', limit=spotify_fetch.BATCH_LIMITS['playlist_tracks'], offset=offset))
+        offset += spotify_fetch.BATCH_LIMITS['playlist_tracks']
+    batches = {'albums': [sp.albums(ids) for ids in spotify_fetch.chunks(list(sp.album_data),
+                                                                         spotify_fetch.BATCH_LIMITS['albums'])],
+               'artists': [sp.artists(ids) for ids in spotify_fetch.chunks(list(sp.artist_data),
+                                                                           spotify_fetch.BATCH_LIMITS['artists'])],
+               'audio_features': [sp.audio_features(ids) for ids in
+                                  spotify_fetch.chunks(sp.playlist, spotify_fetch.BATCH_LIMITS['audio_features'])]}
+    return {'playlist_tracks': pages, **batches}
+
+
+if __name__ == '__main__':
+    # writes a fixture set to a folder, for runs that should all use the same files:
+    #   pages/        event pages (--pages distinct ones)
+    #   raw_concerts.parquet, spotify_*.parquet, spotify_responses.json
+    #
+    #   python benchmarks/fixtures.py --out fixtures_1m --events 1000000 --tracks 10000
+    import argparse
+    import json
+
+    arg_parser = argparse.ArgumentParser(description='Write synthetic fixtures')
+    arg_parser.add_argument('--out', required=True)
+    arg_parser.add_argument('--events', type=int, default=1000)
+    arg_parser.add_argument('--unique', type=int, default=200000, help='distinct events in the raw frame')
+    arg_parser.add_argument('--pages', type=int, default=1000)
+    arg_parser.add_argument('--page-kb', type=int, default=20)
+    arg_parser.add_argument('--tracks', type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    write_corpus(os.path.join(args.out, 'pages'), min(args.pages, args.events), args.page_kb)
+    raw_concerts_frame(args.events, unique=args.unique).to_parquet(os.path.join(args.out, 'raw_concerts.parquet'))
+    for name, df in zip(['top50', 'artists', 'albums', 'audio_feats'], spotify_frames(args.tracks)):
+        df.to_parquet(os.path.join(args.out, f'spotify_{name}.parquet'))
+    with open(os.path.join(args.out, 'spotify_responses.json'), 'w') as f:
+        json.dump(spotify_responses(args.tracks), f)
+    print(f'fixtures for {args.events} events and {args.tracks} tracks written to {args.out}')
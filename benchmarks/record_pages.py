@@ -0,0 +1,62 @@
+# Saves real concertful event pages as benchmark fixtures, gzipped, one
+# <event_id>.html.gz per page, in benchmarks/recorded/ (read by
+# fixtures.read_corpus, so bench_parse.py --corpus and suite.py's
+# 'parse.recorded' run on them). The pages are fetched with the pipeline's own
+# fetch_engine settings ([concerts_fetch] in pipeline.conf), so the site sees
+# the same request rate as a run. URLs come from the command line, a file with
+# one per line, or the 'concert_urls' artifact discover() stored for --date.
+#
+#   python benchmarks/record_pages.py https://concertful.com/event/123456 ...
+#   python benchmarks/record_pages.py --urls urls.txt
+#   python benchmarks/record_pages.py --date 2023-05-20 --limit 200
+
+import argparse
+import asyncio
+import gzip
+import os
+
+import fixtures
+import concerts_data
+import fetch_engine
+import getURLs
+import pipeline_config
+
+recorded_directory = os.path.join(fixtures.current_directory, 'recorded')
+
+
+def urls_to_record(args, parser):
+    if args.url:
+        return args.url
+    if args.urls:
+        with open(args.urls) as f:
+            return [line.strip() for line in f if line.strip()]
+    return getURLs.shard_urls(args.date, parser)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Record event pages as benchmark fixtures')
+    arg_parser.add_argument('url', nargs='*')
+    arg_parser.add_argument('--urls', help='file with one URL per line')
+    arg_parser.add_argument('--date', type=pipeline_config.run_date, default=pipeline_config.run_date(),
+                            help='read the URLs from the concert_urls artifact of this day')
+    arg_parser.add_argument('--limit', type=int, default=200)
+    arg_parser.add_argument('--out', default=recorded_directory)
+    args = arg_parser.parse_args()
+
+    parser = pipeline_config.read_config()
+    urls = urls_to_record(args, parser)[:args.limit]
+    pages, failures, stats = asyncio.run(concerts_data.main(urls, fetch_engine.settings_from_config(parser)))
+    print(fetch_engine.format_summary(stats))
+
+    os.makedirs(args.out, exist_ok=True)
+    saved = 0
+    for page in pages:
+        if page.text is None:
+            continue
+        event_id = concerts_data.get_ids([page.url])[0]
+        with gzip.open(os.path.join(args.out, f'{event_id}.html.gz'), 'wt', encoding='utf-8') as f:
+            f.write(page.text)
+        saved += 1
+    for failure in failures:
+        print(f"Could not fetch {failure.url}: {failure.error}")
+    print(f'{saved} pages saved in {args.out}')
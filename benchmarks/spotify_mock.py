@@ -0,0 +1,123 @@
+# A stand-in for spotipy.Spotify with a made-up catalog: a playlist of n tracks
+# whose artists and albums repeat, as they do in a real top-50 list. Every API
+# method counts its calls in 'calls' and can sleep 'latency' seconds to stand
+# in for the round trip. Batch methods check Spotify's limits on ids per call.
+# n_playlists > 1 adds playlists 'playlist000'... drawn from the same tracks (so
+# they overlap, like the real charts). With max_rate set, a call that makes more
+# than max_rate calls in the last second is answered with a 429 and a
+# Retry-After of retry_after seconds, the way the Web API does.
+# search() finds the catalog's artists whose name is the one searched for,
+# ignoring case (plus any artists given in extra_artists).
+
+import random
+import threading
+import time
+from collections import Counter, deque
+
+from spotipy import SpotifyException
+
+import fixtures
+
+BATCH_LIMITS = {'albums': 20, 'artists': 50, 'audio_features': 100, 'playlist_tracks': 100}
+
+
+class MockSpotify:
+
+    def __init__(self, n_tracks=50, latency=0.0, seed=0, n_playlists=1, playlist_size=None, max_rate=None,
+                 retry_after=1.0, extra_artists=()):
+        rng = random.Random(seed)
+        self.latency = latency
+        self.calls = Counter()
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.recent = deque()
+        self.lock = threading.Lock()
+        n_artists = max(1, n_tracks * 2 // 3)
+        self.artist_data = {f'artist{i:06d}': {'id': f'artist{i:06d}', 'name': f'Artist {i}',
+                                               'popularity': rng.randint(0, 100),
+                                               'genres': rng.sample(fixtures.GENRES, rng.randint(0, 3))}
+                            for i in range(n_artists)}
+        artist_ids = list(self.artist_data)
+        self.album_data = {}
+        self.track_data = {}
+        self.feature_data = {}
+        for i in range(n_tracks):
+            track_artists = rng.sample(artist_ids, min(len(artist_ids), rng.randint(1, 3)))
+            album_id = f'album{rng.randrange(max(1, n_tracks * 3 // 4)):06d}'
+            self.album_data.setdefault(album_id, {'id': album_id, 'name': f'Album {album_id}',
+                                                  'album_type': rng.choice(['album', 'single']),
+                                                  'artists': [{'id': track_artists[0]}],
+                                                  'label': f'Label {rng.randrange(20)}',
+                                                  'popularity': rng.randint(0, 100),
+                                                  'release_date': f'20{rng.randint(10, 23)}-0{rng.randint(1, 9)}-15',
+                                                  'total_tracks': rng.randint(1, 20)})
+            track_id = f'track{i:07d}'
+            self.track_data[track_id] = {'id': track_id, 'name': f'Track {i}', 'popularity': rng.randint(0, 100),
+                                         'artists': [{'id': artist_id} for artist_id in track_artists],
+                                         'album': {'id': album_id}}
+            self.feature_data[track_id] = {'id': track_id, 'acousticness': rng.random(), 'danceability': rng.random(),
+                                           'energy': rng.random(), 'key': rng.randint(-1, 11),
+                                           'loudness': -60 * rng.random(), 'mode': rng.randint(0, 1),
+                                           'speechiness': rng.random(), 'instrumentalness': rng.random(),
+                                           'liveness': rng.random(), 'valence': rng.random(),
+                                           'tempo': 60 + 120 * rng.random(), 'duration_ms': rng.randint(90000, 400000),
+                                           'time_signature': rng.randint(3, 7)}
+        self.playlist = list(self.track_data)
+        self.artist_names = {}
+        for artist in list(self.artist_data.values()) + list(extra_artists):
+            self.artist_names.setdefault(artist['name'].casefold(), []).append(artist)
+        self.playlists = {}
+        if n_playlists > 1:
+            size = min(playlist_size or 50, n_tracks)
+            self.playlists = {f'playlist{j:03d}': rng.sample(self.playlist, size) for j in range(n_playlists)}
+
+    def call(self, name, ids=()):
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and self.recent[0] <= now - 1:
+                self.recent.popleft()
+            if self.max_rate is not None and len(self.recent) >= self.max_rate:
+                self.calls['429'] += 1
+                raise SpotifyException(429, -1, f'{name}: API rate limit exceeded',
+                                       headers={'Retry-After': str(self.retry_after)})
+            self.recent.append(now)
+            self.calls[name] += 1
+        if name in BATCH_LIMITS and len(ids) > BATCH_LIMITS[name]:
+            raise ValueError(f'{name}: {len(ids)} ids, at most {BATCH_LIMITS[name]} allowed')
+        if self.latency:
+            time.sleep(self.latency)
+
+    def playlist_tracks(self, playlist_id, limit=100, offset=0, **kwargs):
+        self.call('playlist_tracks')
+        playlist = self.playlists.get(playlist_id, self.playlist)
+        items = [{'track': self.track_data[track_id]} for track_id in playlist[offset:offset + limit]]
+        more = offset + limit < len(playlist)
+        return {'items': items, 'total': len(playlist), 'offset': offset, 'limit': limit,
+                'next': f'playlist:{playlist_id}?offset={offset + limit}' if more else None}
+
+    def album(self, album_id):
+        self.call('album')
+        return self.album_data[album_id]
+
+    def albums(self, albums):
+        self.call('albums', albums)
+        return {'albums': [self.album_data.get(album_id) for album_id in albums]}
+
+    def artist(self, artist_id):
+        self.call('artist')
+        return self.artist_data[artist_id]
+
+    def artists(self, artists):
+        self.call('artists', artists)
+        return {'artists': [self.artist_data.get(artist_id) for artist_id in artists]}
+
+    def audio_features(self, tracks=[]):
+        tracks = [tracks] if isinstance(tracks, str) else list(tracks)
+        self.call('audio_features', tracks)
+        return [self.feature_data.get(track_id) for track_id in tracks]
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        self.call('search')
+        name = q[len('artist:'):] if q.startswith('artist:') else q
+        items = self.artist_names.get(name.casefold(), [])[offset:offset + limit] if type == 'artist' else []
+        return {f'{type}s': {'items': items, 'total': len(items), 'offset': offset, 'limit': limit}}
@@ -0,0 +1,206 @@
+# The benchmark suite: every stage's hot path at a few scales, timed the same
+# way each time, so a change that slows a stage down shows up as a number.
+#
+#   parse.bs4, parse.lxml  concerts_data.parse on synthetic event pages (serial)
+#   parse.recorded         the same (lxml) on the real pages in benchmarks/recorded
+#                          (saved by record_pages.py; skipped when there are none)
+#   clean                  concert_transforms.clean_concerts on a raw concerts frame
+#   spotify.rows           spotify_fetch.playlist_rows against MockSpotify (no latency):
+#                          the batching and joining, not the network
+#   spotify.frames         spotify_data.playlist_frames on those rows
+#   load.bulk, load.merge  loaders.bulk_load / merge_load of the cleaned concerts and
+#                          a playlist (scale / 10 tracks) into a fresh SQLite database
+#
+# Scale is the number of events (pages, raw rows) or tracks, from 1k to 1M.
+# A case is skipped above its own max_scale (BeautifulSoup pages, 1M HTML
+# pages or merge() calls would take hours). Fixtures are generated before timing; each case runs
+# --repeat times and reports the best and median. --save writes the results
+# as JSON; --baseline compares against saved results and exits with status 1
+# if any case is more than --tolerance slower than it was.
+#
+#   python benchmarks/suite.py --scales 1000 10000 --save results/base.json
+#   python benchmarks/suite.py --scales 1000 10000 --baseline results/base.json
+#   python benchmarks/suite.py --cases clean load.bulk --scales 1000000 --repeat 1
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import fixtures
+import concert_transforms
+import concerts_data
+import loaders
+import spotify_data
+import spotify_fetch
+from database import Base
+from spotify_mock import MockSpotify
+
+# distinct events/pages generated; larger scales repeat them
+UNIQUE_EVENTS = 200000
+UNIQUE_PAGES = 2000
+
+recorded_directory = os.path.join(fixtures.current_directory, 'recorded')
+# the load cases' databases, removed when the suite exits
+work_directory = tempfile.TemporaryDirectory()
+
+
+class Case:
+    # setup(scale) returns (rows, prepare): prepare() is called (untimed) before
+    # every repeat and returns the function that is timed
+
+    def __init__(self, name, setup, max_scale=1000000):
+        self.name = name
+        self.setup = setup
+        self.max_scale = max_scale
+
+
+def parse_setup(parser, corpus=None):
+    def setup(scale):
+        if corpus and not os.path.isdir(corpus):
+            return None
+        pages = fixtures.read_corpus(corpus) if corpus else synthetic_pages(scale)
+        if not pages:
+            return None
+        settings = dict(concerts_data.PARSE_DEFAULTS, workers=0, parser=parser)
+        return len(pages), lambda: lambda: concerts_data.parse(pages, settings)
+    return setup
+
+
+def synthetic_pages(scale):
+    distinct = [fixtures.event_html(event_id, filler_kb=20) for event_id in fixtures.event_ids(min(scale, UNIQUE_PAGES))]
+    return [distinct[i % len(distinct)] for i in range(scale)]
+
+
+def clean_setup(scale):
+    raw = fixtures.raw_concerts_frame(scale, unique=UNIQUE_EVENTS)
+    return len(raw), lambda: lambda: concert_transforms.clean_concerts(raw)
+
+
+def playlist(scale):
+    sp = MockSpotify(scale)
+    return sp, spotify_fetch.playlist_items(sp, 'top50')
+
+
+def spotify_rows_setup(scale):
+    sp, items = playlist(scale)
+    return len(items), lambda: lambda: spotify_fetch.playlist_rows(sp, items, '2023-05-20')
+
+
+def spotify_frames_setup(scale):
+    sp, items = playlist(scale)
+    rows = spotify_fetch.playlist_rows(sp, items, '2023-05-20')
+    return len(items), lambda: lambda: spotify_data.playlist_frames(*rows)
+
+
+def load_setup(mode):
+    def setup(scale):
+        concerts_df, festivals_df = concert_transforms.clean_concerts(fixtures.raw_concerts_frame(scale, unique=UNIQUE_EVENTS))
+        # repeated events would be the same rows again
+        concerts_df = concerts_df.drop_duplicates('concert_id')
+        festivals_df = festivals_df.drop_duplicates('concert_id')
+        top50_df, artists_df, albums_df, audio_df = fixtures.spotify_frames(max(1, scale // 10))
+        frames = {'artists': artists_df, 'albums': albums_df, 'top50': top50_df, 'audio': audio_df,
+                  'concerts': concerts_df, 'festivals': festivals_df}
+        runs = []
+
+        def prepare():
+            # a fresh database for every repeat: a first load, not a reload
+            path = os.path.join(work_directory.name, f'{mode}_{scale}_{len(runs)}.sqlite3')
+            runs.append(path)
+            engine = create_engine('sqlite:///' + path)
+            Base.metadata.create_all(engine)
+            if mode == 'bulk':
+                return lambda: loaders.bulk_load(engine, frames)
+            return lambda: loaders.merge_load(sessionmaker(bind=engine)(), frames)
+        return sum(len(df) for df in frames.values()), prepare
+    return setup
+
+
+CASES = [Case('parse.bs4', parse_setup('bs4'), max_scale=2000),
+         Case('parse.lxml', parse_setup('lxml'), max_scale=100000),
+         Case('parse.recorded', parse_setup('lxml', recorded_directory)),
+         Case('clean', clean_setup),
+         Case('spotify.rows', spotify_rows_setup, max_scale=100000),
+         Case('spotify.frames', spotify_frames_setup, max_scale=100000),
+         Case('load.bulk', load_setup('bulk')),
+         Case('load.merge', load_setup('merge'), max_scale=10000)]
+
+
+def run_case(case, scale, repeat):
+    if scale > case.max_scale:
+        return None
+    setup = case.setup(scale)
+    if setup is None:
+        return None
+    rows, prepare = setup
+    times = []
+    for _ in range(repeat):
+        func = prepare()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {'rows': rows, 'best_s': round(best, 4), 'median_s': round(statistics.median(times), 4),
+            'rows_per_s': round(rows / best, 1)}
+
+
+def regressions(results, baseline, tolerance):
+    # (case, scale, baseline best, best) for every case slower than the baseline allows
+    slower = []
+    for name, scales in results['cases'].items():
+        for scale, result in scales.items():
+            before = baseline['cases'].get(name, {}).get(scale)
+            if result and before and result['best_s'] > before['best_s'] * (1 + tolerance):
+                slower.append((name, scale, before['best_s'], result['best_s']))
+    return slower
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark every stage')
+    arg_parser.add_argument('--cases', nargs='+', choices=[case.name for case in CASES],
+                            default=[case.name for case in CASES])
+    arg_parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--save', help='write the results to this JSON file')
+    arg_parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='how much slower than the baseline a case may be (0.25 = 25%%)')
+    args = arg_parser.parse_args()
+
+    results = {'python': platform.python_version(), 'pandas': pd.__version__, 'machine': platform.machine(),
+               'cases': {}}
+    for case in CASES:
+        if case.name not in args.cases:
+            continue
+        results['cases'][case.name] = {}
+        for scale in args.scales:
+            result = run_case(case, scale, args.repeat)
+            # JSON keys are strings, so the scales are too
+            results['cases'][case.name][str(scale)] = result
+            if result is None:
+                print(f'{case.name:<15} {scale:>8}  skipped')
+            else:
+                print(f'{case.name:<15} {scale:>8}  best {result["best_s"]:8.3f}s  median {result["median_s"]:8.3f}s  '
+                      f'{result["rows_per_s"]:>12,.0f} rows/s')
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for name, scale, before, after in slower:
+            print(f'REGRESSION {name} at {scale}: {before:.3f}s -> {after:.3f}s')
+        if slower:
+            sys.exit(1)
+        print(f'no case more than {args.tolerance:.0%} slower than {args.baseline}')
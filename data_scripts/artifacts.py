@@ -0,0 +1,368 @@
+# Purpose: store the DataFrames the stages hand to each other (raw concerts,
+# cleaned concerts/festivals, spotify tables, data dictionary).
+#
+# They used to be whole pickle.dumps(df) blobs: slow to write and read, not
+# compressed, tied to the pandas version, and always read in full. Here a frame
+# is written as Parquet (or Arrow IPC) with compression and its column types,
+# in row groups of 'row_group_size' rows, so a reader can
+#   - read only the columns it needs
+#   - go through a big frame one row group at a time (iter_frames)
+# On S3 the object is read through ranged GETs, so only the footer and the
+# requested column chunks are downloaded.
+# Pickle is still available as a format, and older .pkl artifacts are still
+# read when no Parquet/Arrow artifact with the same name exists.
+#
+# Artifacts are named without an extension ('cleaned_concerts_2023-05-20'); the
+# extension of the format is added to the key. Names come from artifact_name(),
+# from the run's date and, for the sharded concert stages, the shard.
+# Backends: 's3' (the bucket in [aws_boto_credentials]) or 'local' (a folder,
+# for running the pipeline or benchmarks without AWS).
+#
+# A stage that needs several artifacts reads them with read_frames(): they are
+# downloaded side by side on 'io_threads' threads and each is decoded as soon as
+# it is in, while the others are still downloading; write_frames() uploads each
+# frame while the next one is encoded. On S3, objects of 'multipart_mb' or more
+# go up as multipart uploads and come down as ranged GETs of that size, several
+# at a time. An artifact that isn't there raises ArtifactNotFound.
+
+import io
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+import pipeline_config
+
+# format: parquet, arrow or pickle; compression: zstd, lz4, snappy, gzip or none
+# root: folder used by the local backend, relative to the project folder
+# io_threads: artifacts downloaded/uploaded at the same time (and parts of one on S3)
+# multipart_mb: S3 objects this large or larger are transferred in parts of this size
+DEFAULTS = {'backend': 's3', 'format': 'parquet', 'compression': 'zstd', 'row_group_size': 50000,
+            'root': 'artifacts', 'io_threads': 8, 'multipart_mb': 8}
+
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow', 'pickle': '.pkl'}
+
+project_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def settings_from_config(parser, section='storage'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def artifact_name(name, run_date, shard=None):
+    # ('cleaned_concerts', '2023-05-20', 3) -> 'cleaned_concerts_2023-05-20_part003'
+    name = f'{name}_{run_date}'
+    return name if shard is None else f'{name}_part{shard:03d}'
+
+
+class ArtifactNotFound(FileNotFoundError):
+    # names: the artifacts (without extension) that exist in no format; store: where they were looked for
+
+    def __init__(self, names, store):
+        self.names = list(names)
+        self.store = str(store)
+        super().__init__(f"no artifact {', '.join(repr(name) for name in self.names)} in {self.store}")
+
+
+def base_name(key):
+    # 'data/top50_2023-05-20.pkl' -> 'data/top50_2023-05-20'
+    for extension in EXTENSIONS.values():
+        if key.endswith(extension):
+            return key[:-len(extension)]
+    return key
+
+
+class S3ObjectFile(io.RawIOBase):
+    # read-only, seekable view of an S3 object; every read is a ranged GET
+
+    def __init__(self, client, bucket, key, size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-{end}')
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        self.bytes_read += len(data)
+        metrics.count('bytes_read', len(data))
+        return len(data)
+
+
+class S3Store:
+
+    def __init__(self, bucket, client=None, multipart_mb=DEFAULTS['multipart_mb'], threads=DEFAULTS['io_threads']):
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        from boto3.s3.transfer import TransferConfig
+        self.bucket = bucket
+        self.client = client
+        # boto3's transfer manager: single requests below multipart_mb, parts of multipart_mb side by side above
+        part_size = multipart_mb * 2**20
+        self.transfer_config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                              max_concurrency=threads)
+
+    def put(self, key, data):
+        self.client.upload_fileobj(io.BytesIO(data), self.bucket, key, Config=self.transfer_config)
+
+    def get(self, key):
+        buffer = io.BytesIO()
+        self.client.download_fileobj(self.bucket, key, buffer, Config=self.transfer_config)
+        return buffer.getvalue()
+
+    def size(self, key):
+        # None if there is no such object
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def open(self, key):
+        # reads are buffered so pyarrow's small reads don't each become a request
+        return io.BufferedReader(S3ObjectFile(self.client, self.bucket, key, self.size(key)),
+                                 buffer_size=1 << 16)
+
+    def __str__(self):
+        return f's3://{self.bucket}'
+
+
+class LocalStore:
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write next to the target and rename, so a reader never sees half a file
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def size(self, key):
+        path = self.path(key)
+        return os.path.getsize(path) if os.path.exists(path) else None
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def __str__(self):
+        return self.root
+
+
+def make_store(settings, bucket=None, client=None):
+    if settings['backend'] == 'local':
+        return LocalStore(os.path.join(project_directory, settings['root']))
+    return S3Store(bucket, client, settings['multipart_mb'], settings['io_threads'])
+
+
+def store_from_config(parser, client=None, store=None):
+    # the store set in [storage] (on the bucket in [aws_boto_credentials]) and its settings;
+    # store: one already made (pipeline_runner shares one between the stages)
+    settings = settings_from_config(parser)
+    if store is None:
+        store = make_store(settings, parser.get("aws_boto_credentials", "bucket_name", fallback=None), client)
+    return store, settings
+
+
+def compression(settings):
+    return None if settings['compression'] == 'none' else settings['compression']
+
+
+def frame_to_bytes(df, fmt, settings=DEFAULTS, schema=None):
+    if fmt == 'pickle':
+        return pickle.dumps(df)
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, schema=schema)
+    sink = pa.BufferOutputStream()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink, compression=compression(settings), row_group_size=settings['row_group_size'])
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression(settings))
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=settings['row_group_size'])
+    return sink.getvalue().to_pybytes()
+
+
+def encode_frame(name, df, settings=DEFAULTS, schema=None):
+    # the key and bytes write_frame stores
+    key = base_name(name) + EXTENSIONS[settings['format']]
+    data = frame_to_bytes(df, settings['format'], settings, schema)
+    metrics.count('bytes_written', len(data))
+    return key, data
+
+
+def write_frame(store, name, df, settings=DEFAULTS, schema=None):
+    # schema: optional pyarrow schema, otherwise the column types are taken from df
+    # returns the key the frame was written to
+    key, data = encode_frame(name, df, settings, schema)
+    store.put(key, data)
+    return key
+
+
+def write_frames(store, frames, settings=DEFAULTS):
+    # {name: DataFrame}, each uploaded while the next is encoded; returns {name: key}
+    keys = {}
+    with ThreadPoolExecutor(max_workers=max(1, settings['io_threads'])) as pool:
+        uploads = []
+        for name, df in frames.items():
+            keys[name], data = encode_frame(name, df, settings)
+            uploads.append(pool.submit(metrics.bind(store.put), keys[name], data))
+        for upload in uploads:
+            upload.result()
+    return keys
+
+
+def find_artifact(store, name, settings=DEFAULTS):
+    # the configured format first, then the others (e.g. a .pkl written before the switch)
+    name = base_name(name)
+    formats = [settings['format']] + [fmt for fmt in EXTENSIONS if fmt != settings['format']]
+    for fmt in formats:
+        key = name + EXTENSIONS[fmt]
+        if store.size(key) is not None:
+            return key, fmt
+    raise ArtifactNotFound([name], store)
+
+
+def table_pieces(store, key, fmt, columns):
+    # pyarrow tables, one per row group / record batch, with only 'columns'
+    import pyarrow as pa
+
+    with store.open(key) as f:
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(f)
+            for i in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(i, columns=columns)
+        else:
+            reader = pa.ipc.open_file(f)
+            for i in range(reader.num_record_batches):
+                table = pa.Table.from_batches([reader.get_batch(i)])
+                yield table.select(columns) if columns is not None else table
+
+
+def get_counted(store, key):
+    # the whole object, counted as 'bytes_read' (ranged S3 reads are counted by S3ObjectFile)
+    data = store.get(key)
+    metrics.count('bytes_read', len(data))
+    return data
+
+
+def read_table(f, fmt, columns=None):
+    import pyarrow as pa
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(f).read(columns=columns)
+    table = pa.ipc.open_file(f).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def to_frame(table):
+    # columns written with pandas' string dtype come back Arrow-backed, as concert_schema.py makes them
+    import pandas as pd
+
+    with pd.option_context('mode.string_storage', 'pyarrow'):
+        return table.to_pandas()
+
+
+def decode_frame(data, fmt, columns=None):
+    # the DataFrame in a whole artifact's bytes
+    if fmt == 'pickle':
+        df = pickle.loads(data)
+        return df if columns is None else df[columns]
+    import pyarrow as pa
+
+    with pa.BufferReader(data) as f:
+        return to_frame(read_table(f, fmt, columns))
+
+
+def download(store, name, settings=DEFAULTS):
+    # (bytes, format) of the artifact
+    key, fmt = find_artifact(store, name, settings)
+    return get_counted(store, key), fmt
+
+
+def read_frame(store, name, columns=None, settings=DEFAULTS):
+    # the whole artifact is one download; a few columns are read with ranged requests
+    if columns is None:
+        return decode_frame(*download(store, name, settings))
+    key, fmt = find_artifact(store, name, settings)
+    if fmt == 'pickle':
+        return decode_frame(get_counted(store, key), fmt, columns)
+    with store.open(key) as f:
+        return to_frame(read_table(f, fmt, columns))
+
+
+def read_frames(store, names, settings=DEFAULTS, optional=()):
+    # {frame: artifact name} -> {frame: DataFrame}; the artifacts are downloaded side by side
+    # and decoded here as they come in. The artifacts missing are raised together as one
+    # ArtifactNotFound, except the frames in optional, which come back as None.
+    frames = {}
+    missing = set()
+    with ThreadPoolExecutor(max_workers=max(1, settings['io_threads'])) as pool:
+        downloads = {pool.submit(metrics.bind(download), store, name, settings): frame
+                     for frame, name in names.items()}
+        for future in as_completed(downloads):
+            frame = downloads[future]
+            try:
+                data, fmt = future.result()
+            except ArtifactNotFound:
+                frames[frame] = None
+                if frame not in optional:
+                    missing.add(frame)
+                continue
+            frames[frame] = decode_frame(data, fmt)
+    if missing:
+        raise ArtifactNotFound([base_name(name) for frame, name in names.items() if frame in missing], store)
+    return {frame: frames[frame] for frame in names}
+
+
+def iter_frames(store, name, columns=None, settings=DEFAULTS):
+    # one DataFrame per row group, so a large artifact never has to be in memory at once
+    # (a pickle artifact comes out as a single frame)
+    key, fmt = find_artifact(store, name, settings)
+    if fmt == 'pickle':
+        df = pickle.loads(get_counted(store, key))
+        yield df if columns is None else df[columns]
+        return
+    for table in table_pieces(store, key, fmt, columns):
+        yield to_frame(table)
@@ -0,0 +1,129 @@
+# Purpose: compact column types for the concert frames (the raw one written by
+# concerts_data.py, the cleaned concerts and festivals written by cleaning_concerts.py).
+#
+# They used to hold every column as Python objects: a str per cell even where a
+# few hundred venues, cities, genres and date cells repeat over the day's events,
+# ids and rankings as digit strings, and datetime.time objects for the time.
+# Each frame now has a schema, {column: kind}, applied by typed():
+#   category  repetitive text: a pandas categorical (an int code per row), or
+#             Arrow strings when more than max_category_share of the values are
+#             distinct after all (a categorical would then be larger); rankings
+#             too, so they keep the text concertful shows ('1,234' stays as it is)
+#   string    mostly distinct text (performers): Arrow-backed strings
+#   int       concert_id: nullable Int64 (<NA> when missing or unreadable)
+#   date      datetime64[ns]
+#   time      time of day as timedelta64[ns] since midnight (NaT when missing)
+# Parquet and Arrow artifacts keep these types (categoricals as dictionary columns).
+# The database still gets the plain Python values it always got: plain() turns a
+# frame back into them (loaders.prepare calls it), so artifacts written before
+# this load the same way.
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+max_category_share = 0.5
+
+raw = {'performer': 'string', 'venue': 'category', 'date': 'category', 'genre': 'category', 'ranking': 'category',
+       'concert_id': 'int'}
+concerts = {'concert_id': 'int', 'performer': 'string', 'venue': 'category', 'location': 'category',
+            'date': 'date', 'time': 'time', 'genre': 'category', 'ranking': 'category'}
+festivals = {'concert_id': 'int', 'performer': 'string', 'venue': 'category', 'location': 'category',
+             'start_date': 'date', 'end_date': 'date', 'time': 'time', 'genre': 'category', 'ranking': 'category'}
+
+
+def to_ints(series):
+    # '4197', ' 4,197 ' or 4197 into Int64; each distinct value is converted once
+    if pd.api.types.is_integer_dtype(series):
+        return series.astype('Int64')
+    # digit strings (the usual case) go through int(), much faster than pd.to_numeric
+    missing = series.isna().to_numpy()
+    values = np.zeros(len(series), dtype=np.int64)
+    try:
+        values[~missing] = series.to_numpy(dtype=object)[~missing].astype(np.int64)
+        return pd.Series(pd.arrays.IntegerArray(values, missing), index=series.index)
+    except (TypeError, ValueError):
+        pass
+    codes, uniques = pd.factorize(series)
+    text = pd.Series(uniques, dtype=object).astype(str).str.strip().str.replace(',', '', regex=False)
+    numbers = pd.array(pd.to_numeric(text, errors='coerce'), dtype='Int64')
+    return pd.Series(numbers.take(codes, allow_fill=True), index=series.index)
+
+
+def typed(df, schema):
+    # df with its columns converted to the kinds in schema; columns not in it are left as they are
+    columns = {}
+    for column in df.columns:
+        kind = schema.get(column)
+        series = df[column]
+        if kind == 'category' and not isinstance(series.dtype, pd.CategoricalDtype):
+            # one pass over the values for both the codes and whether a categorical is worth it
+            codes, uniques = pd.factorize(series)
+            if len(uniques) <= len(series) * max_category_share:
+                series = pd.Series(pd.Categorical.from_codes(codes, uniques), index=series.index)
+            else:
+                kind = 'string'
+        if kind == 'string':
+            series = series.astype(pd.StringDtype('pyarrow'))
+        elif kind == 'int':
+            series = to_ints(series)
+        elif kind == 'date':
+            series = pd.to_datetime(series)
+        elif kind == 'time':
+            series = pd.to_timedelta(series)
+        columns[column] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def to_times(series):
+    # timedelta64 since midnight into datetime.time, None when missing
+    codes, uniques = pd.factorize(series)
+    converted = np.empty(len(uniques) + 1, dtype=object)
+    converted[:-1] = [(datetime.datetime.min + value).time() for value in uniques]
+    converted[-1] = None
+    return converted.take(codes)
+
+
+def plain(df):
+    # the values the loaders expect: str ids, datetime.time, None for
+    # missing values; datetime64 columns are left to loaders.to_dates
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            columns[column] = series
+            continue
+        missing = series.isna().to_numpy()
+        if pd.api.types.is_timedelta64_dtype(series):
+            values = to_times(series)
+        elif pd.api.types.is_integer_dtype(series):
+            values = np.array(list(map(str, series.to_numpy(dtype=np.int64, na_value=0).tolist())), dtype=object)
+            values[missing] = None
+        else:
+            values = series.to_numpy(dtype=object)
+            values[missing] = None
+        columns[column] = pd.Series(values, index=df.index, dtype=object)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_report(frames):
+    # {label: DataFrame} -> one line per column with the bytes per row of each
+    # (deep: the Python objects counted too), and the totals
+    labels = list(frames)
+    columns = list(dict.fromkeys(column for df in frames.values() for column in df.columns))
+    lines = [f"{'column':<12}" + ''.join(f'{label:>26}' for label in labels)]
+    for column in columns:
+        line = f'{column:<12}'
+        for df in frames.values():
+            if column not in df:
+                line += f"{'-':>26}"
+                continue
+            usage = df[column].memory_usage(deep=True, index=False) / max(len(df), 1)
+            line += f'{usage:9.1f} B/row {str(df[column].dtype):>10.10}'
+        lines.append(line)
+    line = f"{'total':<12}"
+    for df in frames.values():
+        line += f'{df.memory_usage(deep=True).sum() / 2**20:8.1f} MB, {len(df):>8} rows'
+    lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,173 @@
+# Purpose: clean the raw concerts DataFrame built by concerts_data.py and split it
+# into concerts and festivals. cleaning_concerts.py reads/writes S3 around this.
+#
+# The original script ran a chain of .replace(..., regex=True) calls over the same
+# columns, each one making a new Series. Here every column is cleaned in one pass:
+#   - each column's replacements are folded into one compiled regex (or a short
+#     plain-Python function) applied to a single string
+#   - it is only applied to the distinct values of the column (pd.factorize), then
+#     mapped back; venues, dates, genres and rankings repeat a lot between events
+#   - the concert/festival split is a boolean mask instead of isinstance() loops
+# Dates are parsed by parse_event_dates (see below) into datetime64 columns:
+# 'date' for concerts, 'start_date'/'end_date' for festivals, and the time of day
+# into a timedelta64 'time'. Both frames come out with concert_schema.py's types.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+import concert_schema
+import metrics
+
+raw_columns = ['performer', 'venue', 'date', 'genre', 'ranking', 'concert_id']
+
+concert_columns = ['concert_id', 'performer', 'venue', 'location', 'date', 'time', 'genre', 'ranking']
+festival_columns = ['concert_id', 'performer', 'venue', 'location', 'start_date', 'end_date', 'time', 'genre',
+                    'ranking']
+
+# dictionary to help with converting date data into datetime format
+month_dict={'January':'01','February':'02','March':'03', 'April':'04','May':'05','June':'06',\
+            'July':'07','August':'08','September':'09','October':'10','November':'11','December':'12'}
+# month number by full and abbreviated name ('May', 'Sep', 'September', ...)
+month_numbers = {**{name: int(number) for name, number in month_dict.items()},
+                 **{name[:3]: int(number) for name, number in month_dict.items()},
+                 'Sept': 9}
+
+# performer: remove 'Performer' and new line characters, turn 'and More >>' into
+# 'others', separate performers with ', ' and drop '·' separators.
+# Alternatives are tried in order, the same order the old replace() calls ran in
+performer_pattern = re.compile(r'(?P<drop>\nPerformer:\n\n\n|\n\n\n|\t*·)'
+                               r'|(?P<more>(?:\n|, )\t*and More >>)'
+                               r'|(?P<newline>\n)')
+performer_replacements = {'drop': '', 'more': ', others', 'newline': ', '}
+
+venue_label_pattern = re.compile(r'\nVenue:\n\n')
+genre_label_pattern = re.compile(r'\nGenre:\n|\n')
+date_label_pattern = re.compile(r'\nDate:|\n|\t')
+
+
+def map_unique(series, func):
+    # apply func once per distinct non-null value and broadcast the results back
+    codes, uniques = pd.factorize(series)
+    cleaned = np.empty(len(uniques) + 1, dtype=object)
+    cleaned[:-1] = [func(value) for value in uniques]
+    cleaned[-1] = np.nan
+    # code -1 (missing) picks the trailing NaN
+    return pd.Series(cleaned.take(codes), index=series.index, dtype=object)
+
+
+def clean_performer(text):
+    return performer_pattern.sub(lambda m: performer_replacements[m.lastgroup], text)
+
+
+def split_venue(text):
+    # returns (venue, location): name on the first line, address after it
+    parts = venue_label_pattern.sub('', text).split('\n', 1)
+    if len(parts) == 1:
+        return parts[0], None
+    # clean up location by removing US, new line and tab characters,
+    # only keep city, state to query more easily
+    location = parts[1].replace('\n', '').replace('\t', '').strip(', United States')
+    return parts[0], ', '.join(location.split(',')[-2:]).strip()
+
+
+def clean_genre(text):
+    return genre_label_pattern.sub('', text).replace(' / ', ', ')
+
+
+# concertful dates look like 'Saturday, May 20, 2023 | 7:00pm' for a concert and
+# 'Friday, May 19, 2023 - Sun, May 21, 2023' for a festival (time optional in both).
+# Each distinct cell is parsed once, with explicit formats: the weekday is matched
+# and ignored, month/day/year are read with named groups and turned into
+# datetime64 directly, and the time is parsed with '%I:%M%p'.
+event_date_pattern = re.compile(r'^\s*(?:[A-Za-z]+,\s*)?(?P<month>[A-Za-z]+)\.?\s+(?P<day>\d{1,2}),?\s+(?P<year>\d{4})\s*$')
+range_separator_pattern = re.compile(r'\s+-\s+|\s*-\s*(?=[A-Za-z])')
+
+
+def dates_from_text(texts):
+    # 'Friday, May 19, 2023' (weekday optional) into datetime64, NaT when it doesn't match
+    parts = texts.str.extract(event_date_pattern)
+    return pd.to_datetime(pd.DataFrame({'year': pd.to_numeric(parts['year']),
+                                        'month': parts['month'].map(month_numbers),
+                                        'day': pd.to_numeric(parts['day'])}),
+                          errors='coerce')
+
+
+def to_times(values):
+    # 'h:mmpm' into the time since midnight (timedelta64), NaT when missing or unreadable
+    codes, uniques = pd.factorize(values)
+    times = pd.to_datetime(pd.Series(uniques, dtype=object), format='%I:%M%p', errors='coerce')
+    converted = np.append((times - times.dt.normalize()).to_numpy(), np.timedelta64('NaT', 'ns'))
+    return converted.take(codes)
+
+
+def parse_event_dates(raw_dates):
+    # raw 'Date' cells into a DataFrame with 'start' and 'end' (datetime64, end is
+    # NaT for single dates), 'time' (timedelta64 since midnight) and 'is_range'
+    codes, uniques = pd.factorize(raw_dates)
+    cells = pd.Series(uniques, dtype=object).str.replace(date_label_pattern, '', regex=True)
+    date_time = cells.str.split('|', n=1, expand=True).reindex(columns=[0, 1])
+    bounds = date_time[0].str.split(range_separator_pattern, n=1, expand=True, regex=True).reindex(columns=[0, 1])
+    parsed = pd.DataFrame({'start': dates_from_text(bounds[0]),
+                           'end': dates_from_text(bounds[1].fillna('')),
+                           'time': to_times(date_time[1].str.strip()),
+                           'is_range': bounds[1].notna()})
+    # rows with a missing cell (code -1) get the empty row reindex() adds at the end
+    # (appending it with .loc would convert the time column to objects and back)
+    dates = parsed.reindex(range(len(parsed) + 1)).take(codes).reset_index(drop=True)
+    dates['is_range'] = dates['is_range'].fillna(False).astype(bool)
+    dates.index = raw_dates.index
+    return dates
+
+
+def pairs_to_columns(series):
+    # Series of (a, b) tuples into two object arrays
+    first = np.empty(len(series), dtype=object)
+    second = np.empty(len(series), dtype=object)
+    values = series.to_numpy(dtype=object)
+    for i, pair in enumerate(values):
+        first[i], second[i] = pair if isinstance(pair, tuple) else (pair, pair)
+    return first, second
+
+
+def clean_concerts(raw):
+    # raw: DataFrame straight from concerts_data.py (typed or not)
+    # returns (concerts_df, festivals_df), typed with concert_schema.concerts/festivals
+    df = raw.copy()
+    df.columns = raw_columns
+
+    # each step is timed on its own, see metrics.py
+    with metrics.stage('clean.performer'):
+        performer = map_unique(df['performer'], clean_performer)
+    with metrics.stage('clean.venue'):
+        venue, location = pairs_to_columns(map_unique(df['venue'], split_venue))
+    with metrics.stage('clean.genre'):
+        genre = map_unique(df['genre'], clean_genre)
+    with metrics.stage('clean.dates'):
+        dates = parse_event_dates(df['date'])
+    # the ranking as text, as concertful shows it (raw frames written typed for a while held it as Int64)
+    ranking = map_unique(df['ranking'], lambda value: str(value).strip())
+
+    cleaned = pd.DataFrame({'concert_id': df['concert_id'].array,
+                            'performer': performer.to_numpy(),
+                            'venue': venue,
+                            'location': location,
+                            'time': dates['time'].to_numpy(),
+                            'genre': genre.to_numpy(),
+                            'ranking': ranking.to_numpy()},
+                           index=df.index)
+    cleaned['start_date'] = dates['start']
+    cleaned['end_date'] = dates['end']
+
+    # a range of dates is a festival, a single date a concert; cells whose date
+    # could not be read are left out of both
+    with metrics.stage('clean.split'):
+        is_range = dates['is_range'].to_numpy(dtype=bool)
+        has_date = dates['start'].notna().to_numpy()
+
+        concerts_df = cleaned[has_date & ~is_range].rename(columns={'start_date': 'date'})
+        concerts_df = concerts_df[concert_columns].reset_index(drop=True)
+        festivals_df = cleaned[has_date & is_range][festival_columns].reset_index(drop=True)
+    return (concert_schema.typed(concerts_df, concert_schema.concerts),
+            concert_schema.typed(festivals_df, concert_schema.festivals))
@@ -6,73 +6,242 @@
 # multiprocessing (vs process,thread level) because we want to scrape thousands
 # of URLs. We use the asyncio and aiohttp modules for this.
 
-import aiohttp
 import asyncio
 from bs4 import BeautifulSoup
+import lxml.etree
 import lxml.html
-from aiohttp import ClientSession, ClientTimeout
+from concurrent.futures import ProcessPoolExecutor
 import nest_asyncio
-import boto3
-from datetime import datetime
-import pickle
-import os, configparser
-nest_asyncio.apply()
+import os
 
-import getURLs
+import fetch_engine
+import event_cache
+import artifacts
+import concert_schema
+import metrics
+import pipeline_config
 
 import pandas as pd
 
-async def get_pages(session, url):
-    async with session.get(url) as r:
-        return await r.text()
-
-async def get_tasks(session,urls):
-    tasks = []
-    for url in urls:
-        task = asyncio.create_task(get_pages(session,url))
-        tasks.append(task)
-    results = await asyncio.gather(*tasks)
-    return results
-
-async def main(urls):
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
-        data = await get_tasks(session,urls)
-        return data
-    
+# fetching is done by fetch_engine: a bounded number of workers, per-request
+# timeouts and retries, and failed URLs reported instead of failing everything
+async def main(urls, settings=fetch_engine.DEFAULTS, headers=None):
+    pages, failures, stats = await fetch_engine.fetch_all(urls, settings, headers=headers)
+    return pages, failures, stats
+
 def get_ids(urls):
     event_ids = []
     for i in range(len(urls)):
         event_ids.append(urls[i].split("/")[-1])
     return event_ids
 
-def parse(results):
+# workers = 0 parses in this process, otherwise pages are spread over a process pool
+# parser = 'lxml' uses the XPath fast path below instead of BeautifulSoup
+PARSE_DEFAULTS = {'workers': 0, 'batch_size': 50, 'parser': 'bs4'}
+
+def parse_settings_from_config(parser, section='concerts_parse'):
+    return pipeline_config.section_settings(parser, section, PARSE_DEFAULTS)
+
+def parse_page(html):
+    soup = BeautifulSoup(html,'lxml')
+    # get perfomer, venue name, date, time, genre (the first four table rows)
+    rows = soup.find_all('tr', limit=4)
+    info = [rows[i].text for i in range(4)]
+    # get concertful ranking
+    info.append((soup.find(class_='aln')).text.strip('#'))
+    return info
+
+# same result as parse_page, but runs the XPath queries directly on the lxml tree
+# instead of building a BeautifulSoup object on top of it
+rows_xpath = lxml.etree.XPath("(//tr)[position() <= 4]")
+ranking_xpath = lxml.etree.XPath("(//*[contains(concat(' ', normalize-space(@class), ' '), ' aln ')])[1]")
+
+# BeautifulSoup's .text leaves out comments and script/style contents, and turns every
+# whitespace-only string into a single '\n' (or ' '); copy that so both parsers
+# return identical rows and cleaning_concerts.py works the same on either
+def element_text(element, parts=None):
+    top = parts is None
+    parts = [] if top else parts
+    if isinstance(element.tag, str) and element.tag not in ('script', 'style', 'template'):
+        if element.text:
+            parts.append(element.text)
+        for child in element:
+            element_text(child, parts)
+            if child.tail:
+                parts.append(child.tail)
+    if top:
+        return ''.join(('\n' if '\n' in part else ' ') if not part.strip(' \n\t\x0c\r') else part
+                       for part in parts)
+
+def parse_page_lxml(html):
+    tree = lxml.html.document_fromstring(html)
+    rows = rows_xpath(tree)
+    info = [element_text(rows[i]) for i in range(4)]
+    info.append(element_text(ranking_xpath(tree)[0]).strip('#'))
+    return info
+
+def parse_batch(batch, parser='bs4'):
+    parse_one = parse_page_lxml if parser == 'lxml' else parse_page
+    return [parse_one(html) for html in batch]
+
+def parse(results, settings=PARSE_DEFAULTS):
+    if settings['workers'] <= 0:
+        return parse_batch(results, settings['parser'])
+    # parsing is CPU-bound, so use processes rather than threads;
+    # pages are sent in batches to keep the pickling overhead per page low
+    size = settings['batch_size']
+    batches = [results[i:i+size] for i in range(0, len(results), size)]
     events = []
-    for html in results:
-        soup = BeautifulSoup(html,'lxml')
-        # get perfomer, venue name, date, time, genre
-        info = [soup.find_all('tr')[i].text for i in range(4)]
-        # get concertful ranking
-        info.append((soup.find(class_='aln')).text.strip('#'))
-        events.append(info)
+    with ProcessPoolExecutor(max_workers=settings['workers']) as pool:
+        for parsed in pool.map(parse_batch, batches, [settings['parser']]*len(batches)):
+            events.extend(parsed)
     return events
 
+# streaming alternative to main() + parse(): every page is parsed as soon as it
+# arrives and its HTML is dropped right away, rows are turned into a DataFrame
+# every 'chunk_size' events. Memory no longer grows with the HTML of the whole crawl.
+# Rows come out in the order the pages arrived, each one with its own concert_id.
+# With a process pool, batches of pages are parsed in the pool while the
+# download carries on; at most two batches per worker are waiting at any time.
+# 'headers' and 'validators' are used by the incremental mode (see event_cache.py):
+# pages that come back 304 are not parsed, and every page fetched is noted in 'validators'.
+async def stream_events(urls, settings=fetch_engine.DEFAULTS, chunk_size=500, parse_settings=PARSE_DEFAULTS,
+                        headers=None, validators=None):
+    stats = fetch_engine.FetchStats()
+    chunks = []
+    rows, ids = [], []
+    texts, batch_ids = [], []
+    pending = []
+    workers = parse_settings['workers']
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    loop = asyncio.get_running_loop()
+
+    def add_rows(parsed, parsed_ids):
+        nonlocal rows, ids
+        rows.extend(parsed)
+        ids.extend(parsed_ids)
+        if len(rows) >= chunk_size:
+            chunks.append(events_frame(rows, ids))
+            rows, ids = [], []
+
+    async def submit(batch, batch_ids):
+        pending.append((loop.run_in_executor(pool, parse_batch, batch, parse_settings['parser']), batch_ids))
+        while len(pending) > 2 * workers:
+            future, done_ids = pending.pop(0)
+            add_rows(await future, done_ids)
+
+    try:
+        async for page in fetch_engine.stream_pages(urls, settings, stats, headers=headers):
+            event_id = page.url.split("/")[-1]
+            if validators is not None:
+                validators[event_id] = (page.url, page.status, page.etag, page.last_modified)
+            if page.text is None:
+                continue
+            if pool is None:
+                add_rows(parse_batch([page.text], parse_settings['parser']), [event_id])
+                continue
+            texts.append(page.text)
+            batch_ids.append(event_id)
+            if len(texts) >= parse_settings['batch_size']:
+                await submit(texts, batch_ids)
+                texts, batch_ids = [], []
+        if texts:
+            await submit(texts, batch_ids)
+        for future, done_ids in pending:
+            add_rows(await future, done_ids)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    if rows or not chunks:
+        chunks.append(events_frame(rows, ids))
+    df = pd.concat(chunks, ignore_index=True)
+    return df, stats.failures, stats.summary()
+
+# the fields parse_page returns, in order; named so the frame can be stored as Parquet
+event_columns = ['performer', 'venue', 'date', 'genre', 'ranking']
+
+def events_frame(events, event_ids):
+    df = pd.DataFrame(events, columns=event_columns)
+    df['concert_id'] = event_ids
+    return df
+
+def event_urls(run_date, parser, shard=None, store=None):
+    # the URLs getURLs.discover() stored for the day; when it hasn't been run
+    # (the script run on its own), the listings are read here
+    import getURLs
+    try:
+        return getURLs.shard_urls(run_date, parser, shard, store)
+    except FileNotFoundError:
+        if shard is not None:
+            raise
+        return getURLs.get_list(getURLs.settings_from_config(parser))
+
+def fetch_concerts(run_date, parser, shard=None, store=None):
+    # stage: the day's events (or one shard of them) into the 'concerts_df' artifact
+    with metrics.stage('fetch_concerts', shard=shard) as stage_metrics:
+        # lets asyncio.run() work where an event loop is already running (e.g. a notebook);
+        # done here rather than on import, as it patches asyncio for the whole process
+        nest_asyncio.apply()
+        urls = event_urls(run_date, parser, shard, store)
+        stage_metrics.rows_in = len(urls)
+        settings = fetch_engine.settings_from_config(parser)
+        parse_settings = parse_settings_from_config(parser)
+
+        # incremental mode: skip events fetched recently, send conditional requests for the rest
+        cache = None
+        headers = None
+        validators = {}
+        if parser.getboolean("event_cache", "enabled", fallback=False):
+            cache_settings = event_cache.settings_from_config(parser)
+            cache = event_cache.open_cache(os.path.join(pipeline_config.project_directory, cache_settings['path']))
+            urls, headers, fresh = event_cache.plan(cache, urls, get_ids(urls), cache_settings['ttl_hours'])
+            print(f"{fresh} events fetched in the last {cache_settings['ttl_hours']} hours were skipped")
+
+        if parser.getboolean("concerts_fetch", "stream", fallback=False):
+            chunk_size = parser.getint("concerts_fetch", "chunk_size", fallback=500)
+            # fetching and parsing overlap, so they are measured together
+            with metrics.stage('fetch_concerts.stream') as step:
+                step.rows_in = len(urls)
+                df, failures, stats = asyncio.run(stream_events(urls, settings, chunk_size, parse_settings,
+                                                                headers, validators))
+                step.rows_out = len(df)
+        else:
+            with metrics.stage('fetch_concerts.fetch') as step:
+                step.rows_in = len(urls)
+                pages, failures, stats = asyncio.run(main(urls, settings, headers))
+                step.rows_out = len(pages)
+            for page in pages:
+                validators[page.url.split("/")[-1]] = (page.url, page.status, page.etag, page.last_modified)
+            # only the pages that were fetched (and not 304), so ids stay aligned with the parsed rows
+            pages = [page for page in pages if page.text is not None]
+            with metrics.stage('fetch_concerts.parse', parser=parse_settings['parser']) as step:
+                step.rows_in = len(pages)
+                df = events_frame(parse([page.text for page in pages], parse_settings),
+                                  get_ids([page.url for page in pages]))
+                step.rows_out = len(df)
+        print(fetch_engine.format_summary(stats))
+        for failure in failures:
+            print(f"Could not fetch {failure.url} after {failure.attempts} attempts: {failure.error}")
+
+        if cache is not None:
+            fetched = len(df)
+            df, cache_entries = event_cache.changed_events(cache, df, validators)
+            print(f"{len(df)} new or changed events, {len(validators) - len(df)} unchanged "
+                  f"({len(validators) - fetched} not modified)")
+
+        # stored with compact column types (categoricals, Arrow strings, Int64), see concert_schema.py
+        store, storage = artifacts.store_from_config(parser, store=store)
+        df = concert_schema.typed(df, concert_schema.raw)
+        artifacts.write_frame(store, artifacts.artifact_name('concerts_df', run_date, shard), df, storage)
+
+        # only remember the events once the day's data has been stored
+        if cache is not None:
+            event_cache.save(cache, cache_entries)
+            event_cache.evict(cache, cache_settings['expire_days'], cache_settings['max_events'])
+            cache.close()
+        stage_metrics.rows_out = len(df)
+        return len(df)
+
 if __name__ == '__main__':
-    urls = getURLs.get_list()
-    results = asyncio.run(main(urls))
-    total_data = parse(results)
-    df = pd.DataFrame(total_data)
-    df['concert_id']=get_ids(urls)
-    pickled_df = pickle.dumps(df)
-
-    # assuming the 'pipeline.conf' file is in the same location as the 'pipeline_template.conf' file
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    parent_directory = os.path.dirname(current_directory)
-    file_conf = os.path.join(parent_directory, 'pipeline.conf')
-    parser = configparser.ConfigParser()
-    parser.read(file_conf)
-
-    bucket_name = parser.get("aws_boto_credentials", "bucket_name")
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucket_name)
-    concerts_key= 'concerts_df_{}.pkl'.format(datetime.now().strftime("%Y-%m-%d"))
-    bucket.put_object(Key=concerts_key, Body=pickled_df)
+    args = pipeline_config.stage_arguments('Fetch and parse the concert pages', shards=True)
+    fetch_concerts(args.date, pipeline_config.stage_config(args.date), args.shard)
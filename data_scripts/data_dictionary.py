@@ -1,8 +1,9 @@
 import re
 import pandas as pd
-import boto3
-import pickle
-import os, configparser
+
+import artifacts
+import metrics
+import pipeline_config
 
 # creating a data dictionary to provide a brief explanation on all the features
 # most descriptions, particularly for audio features, are directly from Spotify's Web API docs
@@ -59,26 +60,21 @@ top50_songs_df_dict ={
                     to specify how many beats are in each bar (or measure). The time signature ranges from 3 to 7\
                     indicating time signatures of "3/4", to "7/4".']}
 
-# removing extra spaces to improve readability 
-top50_songs_df_dict = {key: [value[0], re.sub('\s{2,}', '', value[1])] for key,value in top50_songs_df_dict.items()}
-
-data_dict_df = pd.DataFrame.from_dict(top50_songs_df_dict, orient='index',
-                       columns=['type', 'description'])
-
-pickled_data_dict = pickle.dumps(data_dict_df)
-
-# assuming the 'pipeline.conf' file is in the same location as the 'pipeline_template.conf' file
-current_directory = os.path.dirname(os.path.abspath(__file__))
-parent_directory = os.path.dirname(current_directory)
-file_conf = os.path.join(parent_directory, 'pipeline.conf')
-parser = configparser.ConfigParser()
-parser.read(file_conf)
+def data_dictionary_frame():
+    # removing extra spaces to improve readability 
+    descriptions = {key: [value[0], re.sub('\s{2,}', '', value[1])] for key,value in top50_songs_df_dict.items()}
+    return pd.DataFrame.from_dict(descriptions, orient='index', columns=['type', 'description'])
 
-bucket = parser.get("aws_boto_credentials", "bucket_name")
+def write_data_dict(parser, store=None):
+    # stage: the data dictionary artifact (not dated, the same every day)
+    with metrics.stage('data_dict'):
+        store, storage = artifacts.store_from_config(parser, store=store)
 
-s3 = boto3.resource('s3')
+        # the extension (if any) is replaced by the one of the format set in [storage]
+        key_for_data_dict = parser.get("aws_boto_credentials", "key_data_dict", fallback='data_dict')
+        # I show name of my data dictionary document in other files, but I wanted to show that you 
+        # can conceal file keys as well if you'd like
+        return artifacts.write_frame(store, key_for_data_dict, data_dictionary_frame(), storage)
 
-key_for_data_dict = parser.get("aws_boto_credentials", "key_data_dict")
-# I show name of my data dictionary document in other files, but I wanted to show that you 
-# can conceal file keys as well if you'd like
-bucket.put_object(Key=key_for_data_dict, Body=pickled_data_dict)
+if __name__ == '__main__':
+    write_data_dict(pipeline_config.stage_config())
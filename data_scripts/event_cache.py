@@ -0,0 +1,114 @@
+# Purpose: remember which concertful events were already fetched, so a daily run
+# only downloads (and passes on to cleaning/loading) what is new or has changed.
+#
+# Each event_id (the id from concerts_data.get_ids) has one row in a local SQLite
+# file with the time it was last fetched, the ETag/Last-Modified validators the
+# server sent, and a hash of the parsed fields.
+#   - fetched less than 'ttl_hours' ago: not requested at all
+#   - older: requested with If-None-Match/If-Modified-Since; a 304 means unchanged
+#   - fetched again but the parsed fields hash the same: unchanged as well
+# Unchanged events are left out of the day's concerts DataFrame, so cleaning and
+# loading never see them.
+# Entries not refreshed for 'expire_days' are dropped, and only the 'max_events'
+# most recently fetched entries are kept.
+
+import hashlib
+import sqlite3
+import time
+
+import pipeline_config
+
+DEFAULTS = {'path': 'event_cache.sqlite3', 'ttl_hours': 72.0, 'expire_days': 30.0, 'max_events': 500000}
+
+
+def settings_from_config(parser, section='event_cache'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def open_cache(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS events (
+                        event_id TEXT PRIMARY KEY,
+                        url TEXT NOT NULL,
+                        fetched_at REAL NOT NULL,
+                        etag TEXT,
+                        last_modified TEXT,
+                        content_hash TEXT)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS events_fetched_at ON events (fetched_at)')
+    return conn
+
+
+def plan(conn, urls, event_ids, ttl_hours, now=None):
+    # returns the urls that have to be fetched, the conditional request headers
+    # for the ones we have validators for, and how many were skipped as fresh
+    now = now or time.time()
+    cached = {row[0]: row[1:] for row in conn.execute('SELECT event_id, fetched_at, etag, last_modified FROM events')}
+    to_fetch, headers, fresh = [], {}, 0
+    for url, event_id in zip(urls, event_ids):
+        entry = cached.get(event_id)
+        if entry is None:
+            to_fetch.append(url)
+            continue
+        fetched_at, etag, last_modified = entry
+        if now - fetched_at < ttl_hours * 3600:
+            fresh += 1
+            continue
+        to_fetch.append(url)
+        conditions = {}
+        if etag:
+            conditions['If-None-Match'] = etag
+        if last_modified:
+            conditions['If-Modified-Since'] = last_modified
+        if conditions:
+            headers[url] = conditions
+    return to_fetch, headers, fresh
+
+
+# the hash is taken over the parsed fields rather than the raw HTML, which also
+# carries things like ads and timestamps that change on every request
+def row_hash(values):
+    return hashlib.sha256('\x1f'.join(str(value) for value in values).encode('utf-8')).hexdigest()
+
+
+def changed_events(conn, df, validators, now=None):
+    # df: parsed events (the parsed fields and 'concert_id'), only the pages that came back 200
+    # validators: {event_id: (url, status, etag, last_modified)} for every page fetched,
+    # 304s included
+    # returns the rows of df that are new or changed, and the cache entries to save
+    # once the day's output has been stored
+    now = now or time.time()
+    cached = dict(conn.execute('SELECT event_id, content_hash FROM events'))
+    fields = df.drop(columns='concert_id')
+    hashes = [row_hash(values) for values in fields.itertuples(index=False, name=None)]
+    keep = [cached.get(event_id) != digest for event_id, digest in zip(df['concert_id'], hashes)]
+    hash_by_id = dict(zip(df['concert_id'], hashes))
+    entries = []
+    for event_id, (url, status, etag, last_modified) in validators.items():
+        # a 304 keeps the hash we already have
+        digest = hash_by_id.get(event_id, cached.get(event_id))
+        entries.append((event_id, url, now, etag, last_modified, digest))
+    return df[keep].reset_index(drop=True), entries
+
+
+def save(conn, entries):
+    with conn:
+        conn.executemany('''INSERT INTO events (event_id, url, fetched_at, etag, last_modified, content_hash)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (event_id) DO UPDATE SET
+                                url = excluded.url,
+                                fetched_at = excluded.fetched_at,
+                                etag = COALESCE(excluded.etag, events.etag),
+                                last_modified = COALESCE(excluded.last_modified, events.last_modified),
+                                content_hash = COALESCE(excluded.content_hash, events.content_hash)''',
+                         entries)
+
+
+def evict(conn, expire_days, max_events, now=None):
+    # returns the number of entries removed
+    now = now or time.time()
+    with conn:
+        expired = conn.execute('DELETE FROM events WHERE fetched_at < ?', (now - expire_days * 86400,)).rowcount
+        overflow = conn.execute('''DELETE FROM events WHERE event_id IN (
+                                       SELECT event_id FROM events ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)''',
+                                (max_events,)).rowcount
+    return expired + overflow
@@ -0,0 +1,200 @@
+# Purpose: fetch a large number of pages concurrently without opening one socket
+# per URL at the same time.
+# A fixed number of workers pull URLs from a shared iterator, so at most
+# 'concurrency' requests are in flight at once (and at most 'per_host' to the
+# same host). Every request has its own timeout and is retried with exponential
+# backoff and jitter. A page that still fails is recorded as a Failure instead
+# of aborting the whole crawl, which is what a single asyncio.gather did.
+
+import asyncio
+import random
+import time
+from collections import namedtuple
+
+import aiohttp
+
+import metrics
+import pipeline_config
+
+DEFAULTS = {
+    'concurrency': 50,     # number of requests in flight at the same time
+    'per_host': 10,        # max open connections to a single host
+    'timeout': 30.0,       # seconds allowed for one request (connect + read)
+    'retries': 3,          # extra attempts after the first one fails
+    'backoff': 0.5,        # base delay in seconds, doubled on every retry
+    'max_backoff': 30.0,   # upper bound for a single delay
+}
+
+# responses worth retrying, anything else (e.g. 404) fails right away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# status is 304 (and text None) when a conditional request found the page unchanged;
+# etag/last_modified are the validators to send with the next conditional request
+Page = namedtuple('Page', ['url', 'text', 'latency', 'status', 'etag', 'last_modified'])
+Failure = namedtuple('Failure', ['url', 'error', 'attempts'])
+
+
+def settings_from_config(parser, section='concerts_fetch'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def backoff_delay(attempt, settings):
+    # "full jitter": random delay between 0 and the exponential ceiling, so that
+    # workers that failed together do not all retry at the same moment
+    ceiling = min(settings['max_backoff'], settings['backoff'] * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class FetchStats:
+    # keeps only the latencies (not the pages) so it can be used while streaming
+
+    def __init__(self):
+        self.latencies = []
+        self.failures = []
+        self.started = time.perf_counter()
+
+    def record(self, result):
+        if isinstance(result, Failure):
+            self.failures.append(result)
+        else:
+            self.latencies.append(result.latency)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        return {'pages': len(latencies),
+                'failed': len(self.failures),
+                'elapsed': round(elapsed, 3),
+                'pages_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                'p50': round(percentile(latencies, 50), 4),
+                'p95': round(percentile(latencies, 95), 4)}
+
+
+def format_summary(summary):
+    return ("fetched {pages} pages ({failed} failed) in {elapsed}s: {pages_per_sec} pages/s, "
+            "p50 {p50}s, p95 {p95}s").format(**summary)
+
+
+async def fetch_page(session, url, settings, headers=None):
+    timeout = aiohttp.ClientTimeout(total=settings['timeout'])
+    attempt = 0
+    while True:
+        attempt += 1
+        start = time.perf_counter()
+        retry_after = None
+        metrics.count('http_requests')
+        try:
+            async with session.get(url, timeout=timeout, headers=headers) as r:
+                if r.status == 429 and r.headers.get('Retry-After', '').isdigit():
+                    retry_after = int(r.headers['Retry-After'])
+                r.raise_for_status()
+                text = None if r.status == 304 else await r.text()
+                if text is not None:
+                    metrics.count('html_chars', len(text))
+                return Page(url, text, time.perf_counter() - start, r.status,
+                            r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+            if not retryable or attempt > settings['retries']:
+                return Failure(url, repr(e), attempt)
+        except Exception as e:
+            # anything else (e.g. a page that doesn't decode in its declared charset)
+            # won't get better by asking again
+            return Failure(url, repr(e), attempt)
+        if retry_after is not None:
+            await asyncio.sleep(min(retry_after, settings['max_backoff']))
+        else:
+            await asyncio.sleep(backoff_delay(attempt, settings))
+
+
+def make_session(settings):
+    connector = aiohttp.TCPConnector(limit=settings['concurrency'], limit_per_host=settings['per_host'])
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def _worker(session, work, settings, stats, handle, headers):
+    # 'work' is an iterator shared by all the workers; next() never awaits, so
+    # each URL is handed to exactly one worker
+    for index, url in work:
+        result = await fetch_page(session, url, settings, headers.get(url))
+        stats.record(result)
+        await handle(index, result)
+
+
+# 'headers' optionally maps a url to extra request headers (e.g. If-None-Match)
+async def run_workers(urls, settings, handle, session=None, stats=None, headers=None):
+    stats = stats if stats is not None else FetchStats()
+    work = iter(enumerate(urls))
+    owns_session = session is None
+    if owns_session:
+        session = make_session(settings)
+    try:
+        workers = [asyncio.create_task(_worker(session, work, settings, stats, handle, headers or {}))
+                   for _ in range(max(1, settings['concurrency']))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            # a handler failed (or the crawl was cancelled): stop the other workers too
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+    finally:
+        if owns_session:
+            await session.close()
+    return stats
+
+
+async def fetch_all(urls, settings=DEFAULTS, session=None, headers=None):
+    # returns the pages that were fetched (in the same order as urls),
+    # the failures, and a summary of throughput and latency
+    results = [None] * len(urls)
+
+    async def keep(index, result):
+        results[index] = result
+
+    stats = await run_workers(urls, settings, keep, session, headers=headers)
+    pages = [result for result in results if isinstance(result, Page)]
+    return pages, stats.failures, stats.summary()
+
+
+async def stream_pages(urls, settings=DEFAULTS, stats=None, queue_size=None, session=None, headers=None):
+    # async generator that yields each Page as soon as it arrives, so the caller
+    # can parse it and drop the HTML while the rest is still downloading.
+    # The queue is bounded: if the consumer falls behind, the workers wait
+    # instead of piling pages up in memory. Failures only go to 'stats'.
+    stats = stats if stats is not None else FetchStats()
+    queue = asyncio.Queue(maxsize=queue_size or settings['concurrency'])
+    done = object()
+
+    async def put(index, result):
+        if isinstance(result, Page):
+            await queue.put(result)
+
+    async def produce():
+        try:
+            await run_workers(urls, settings, put, session, stats, headers)
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            page = await queue.get()
+            if page is done:
+                break
+            yield page
+        await producer
+    finally:
+        # consumer stopped early (or failed), don't leave requests running
+        if not producer.done():
+            producer.cancel()
+        # the cancelled (or failed) producer is awaited, so nothing is left pending or unretrieved
+        await asyncio.gather(producer, return_exceptions=True)
@@ -3,45 +3,136 @@
 # The latter is the list of URLs we want, since we can get data from each URL
 # consisting of information on each concert
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
-from selenium.common.exceptions import StaleElementReferenceException
-from selenium.webdriver.support.ui import WebDriverWait as wait
-from selenium.webdriver.support import expected_conditions as EC
-from time import sleep
-from random import randint
-import numpy as np
-
-def get_list():
-    ignored_exceptions=(NoSuchElementException,StaleElementReferenceException)
-    with webdriver.Safari() as driver:
-        driver.get('https://concertful.com/area/united-states/')
-
-        states = driver.find_elements(By.CSS_SELECTOR, "a[href*='/area/united-states/'][href$='/']")
-        links_states = [state.get_attribute('href') for state in states]
-
-        url_array = []
-        for i in range(len(links_states)):
-            driver.get(links_states[i])
-            sleep(randint(5,15))
+# The states are handed out to a pool of workers, each with its own link
+# extractor (see link_extractors.py): plain HTTP + lxml, a headless browser, or
+# HTTP with the browser as a fallback for pages that need JS. Instead of sleeping
+# a random 5-15 seconds after every page, all workers share a per-host token
+# bucket: the site sees the same average request rate as before, but the time
+# spent loading and reading pages overlaps across workers.
+#
+# As a stage, discover() stores the day's URLs as the 'concert_urls' artifact,
+# each with its shard: the concert stages after it (fetching, cleaning,
+# loading) can then run as 'shards' independent parts of the day.
+
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import zlib
+
+import pandas as pd
+
+import artifacts
+import metrics
+import pipeline_config
+
+from rate_limit import HostRateLimiter
+
+# rate: requests per second per host, shared by all the workers
+# (the old random sleeps averaged about one page every 7.5-10 seconds)
+# backend: http, selenium, or auto (http, falling back to the browser)
+# shards: parts the day's events are split into for the concert stages
+DEFAULTS = {'base_url': 'https://concertful.com', 'workers': 4, 'rate': 0.13, 'burst': 1,
+            'backend': 'auto', 'browser': 'chrome', 'timeout': 20, 'shards': 1}
+
+def settings_from_config(parser, section='discovery'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+def state_links(extractor, settings):
+    area_url = settings['base_url'] + '/area/united-states/'
+    links = extractor.state_links(area_url)
+    # the listing can link to itself, and to the same state more than once
+    return [link for link in dict.fromkeys(links) if link.rstrip('/') != area_url.rstrip('/')]
+
+def state_event_urls(extractor, link):
+    urls, total_pgs = extractor.listing_page(link)
+    # the state page is already page 1, only load the rest
+    for page in range(2, (total_pgs or 1)+1):
+        page_urls, _ = extractor.listing_page(f'{link}?page={page}')
+        urls.extend(page_urls)
+    return urls
+
+def discovery_worker(states, results, settings, limiter, driver_factory):
+    # states: queue of (index, link); the worker keeps one extractor (and browser,
+    # if it needs one) for all the states it takes
+    from link_extractors import make_extractor
+    extractor = make_extractor(settings, limiter, driver_factory)
+    try:
+        while True:
+            try:
+                index, link = states.get_nowait()
+            except queue.Empty:
+                return extractor.pages
             try:
-                total_pgs = driver.find_element(By.XPATH, "//div[@class='buttons_counter']/span")
-                total_pgs = int(total_pgs.text.split(" ")[-1])
-                pages = np.arange(1, total_pgs+1, 1)
-                for page in pages:
-                    driver.get(f'{links_states[i]}?page={page}')
-                    sleep(randint(5,10))
-                    concert_events = wait(driver, 20,ignored_exceptions=ignored_exceptions)\
-                            .until(EC.presence_of_all_elements_located((By.CSS_SELECTOR,\
-                                                        "a[href*='/event/']")))
-                    urls = [concert.get_attribute('href') for concert in concert_events]
-                    url_array.extend(urls)
-            # if concerts for a state fits in one page
-            except Exception:    
-                concert_events = wait(driver, 20,ignored_exceptions=ignored_exceptions)\
-                                .until(EC.presence_of_all_elements_located((By.CSS_SELECTOR,\
-                                                            "a[href*='/event/']")))
-                urls = [concert.get_attribute('href') for concert in concert_events]
-                url_array.extend(urls)
-    return url_array
+                results[index] = state_event_urls(extractor, link)
+            except Exception as e:
+                print(f"Could not get the concerts listed for {link}: {e}")
+                results[index] = []
+    finally:
+        extractor.close()
+
+# link_extractors (requests, lxml) is only imported when the listings are read,
+# not by the stages that only need shard_urls()
+def get_list(settings=None, driver_factory=None):
+    from link_extractors import make_driver, make_extractor
+    settings = settings or DEFAULTS
+    driver_factory = driver_factory or make_driver
+    limiter = HostRateLimiter(settings['rate'], settings['burst'])
+    extractor = make_extractor(settings, limiter, driver_factory)
+    try:
+        links_states = state_links(extractor, settings)
+    finally:
+        extractor.close()
+    metrics.count('listing_pages', extractor.pages)
+
+    states = queue.Queue()
+    for index, link in enumerate(links_states):
+        states.put((index, link))
+    results = [[] for _ in links_states]
+    # Safari only allows one automated session at a time
+    workers = max(1, settings['workers'])
+    if settings['browser'] == 'safari' and settings['backend'] != 'http':
+        workers = 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = [pool.submit(discovery_worker, states, results, settings, limiter, driver_factory)
+                   for _ in range(workers)]
+        for worker in running:
+            metrics.count('listing_pages', worker.result())
+
+    # keep the order of the states, drop events listed twice (e.g. pages shifting while we read them)
+    url_array = []
+    for urls in results:
+        url_array.extend(urls)
+    return list(dict.fromkeys(url_array))
+
+def shard_of(url, shards):
+    # by event id, so an event stays in the same shard from one day to the next
+    return zlib.crc32(url.rstrip('/').split('/')[-1].encode('utf-8')) % shards
+
+def url_shards(urls, shards):
+    return pd.DataFrame({'url': urls, 'shard': [shard_of(url, shards) for url in urls]})
+
+def discover(run_date, parser, driver_factory=None, store=None):
+    # stage: the day's event URLs into the 'concert_urls' artifact; returns the shards
+    with metrics.stage('discover') as stage_metrics:
+        settings = settings_from_config(parser)
+        urls = get_list(settings, driver_factory)
+        stage_metrics.rows_out = len(urls)
+        shards = max(1, settings['shards'])
+        store, storage = artifacts.store_from_config(parser, store=store)
+        urls_df = url_shards(urls, shards)
+        artifacts.write_frame(store, artifacts.artifact_name('concert_urls', run_date), urls_df, storage)
+    return list(range(shards))
+
+def shard_urls(run_date, parser, shard=None, store=None):
+    # the URLs discover() stored for the day (only the shard's, if given)
+    store, storage = artifacts.store_from_config(parser, store=store)
+    urls_df = artifacts.read_frame(store, artifacts.artifact_name('concert_urls', run_date), settings=storage)
+    if shard is not None:
+        urls_df = urls_df[urls_df['shard'] == shard]
+    return urls_df['url'].tolist()
+
+if __name__ == '__main__':
+    import pipeline_config
+
+    args = pipeline_config.stage_arguments('Find the URLs of the listed concerts')
+    shards = discover(args.date, pipeline_config.stage_config(args.date))
+    print(f"URLs for {args.date} stored in {len(shards)} shard(s)")
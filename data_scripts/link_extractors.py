@@ -0,0 +1,176 @@
+# Purpose: ways of reading the concertful listing pages used by getURLs.
+# All we need from a page is the '/event/' links (or the state links on the
+# area page) and the 'buttons_counter' page count. Those are in the HTML the
+# server sends, so a plain HTTP request + lxml can read them at a fraction of
+# the CPU, memory and start-up time of a browser.
+#   - HttpLinkExtractor: requests + lxml XPath
+#   - SeleniumLinkExtractor: a real (headless) browser, for pages that need JS
+#   - FallbackLinkExtractor: HTTP first, browser only when a page has no links in its HTML
+# Each worker in getURLs uses its own extractor; every request goes through the
+# shared rate limiter first.
+
+from urllib.parse import urljoin
+
+import lxml.html
+import requests
+
+# selenium is only imported when a browser is actually needed
+def make_driver(browser):
+    from selenium import webdriver
+    if browser == 'safari':
+        return webdriver.Safari()
+    if browser == 'firefox':
+        options = webdriver.FirefoxOptions()
+        options.add_argument('-headless')
+        return webdriver.Firefox(options=options)
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    return webdriver.Chrome(options=options)
+
+
+# raised when the HTML does not have the links, i.e. the page is rendered by JS
+# (or the site refuses clients that are not a browser)
+class NeedsBrowser(Exception):
+    pass
+
+
+def page_count(text):
+    # counter reads like 'Page 1 of 12'
+    return int(text.split(" ")[-1])
+
+
+class HttpLinkExtractor:
+    state_xpath = "//a[contains(@href, '/area/united-states/') and substring(@href, string-length(@href)) = '/']/@href"
+    event_xpath = "//a[contains(@href, '/event/')]/@href"
+    counter_xpath = "//div[@class='buttons_counter']/span"
+
+    def __init__(self, settings, limiter):
+        self.settings = settings
+        self.limiter = limiter
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = settings.get('user_agent', 'Mozilla/5.0')
+        self.pages = 0
+
+    def get_tree(self, url):
+        self.limiter.wait(url)
+        r = self.session.get(url, timeout=self.settings['timeout'])
+        # bot protection tends to answer plain HTTP clients with a 403
+        if r.status_code == 403:
+            raise NeedsBrowser(url)
+        r.raise_for_status()
+        self.pages += 1
+        return lxml.html.document_fromstring(r.content, base_url=url)
+
+    def state_links(self, area_url):
+        tree = self.get_tree(area_url)
+        links = [urljoin(area_url, href) for href in tree.xpath(self.state_xpath)]
+        if not links:
+            raise NeedsBrowser(area_url)
+        return links
+
+    def listing_page(self, url):
+        # returns the event links on the page and the total number of pages (None if not paginated)
+        tree = self.get_tree(url)
+        links = [urljoin(url, href) for href in tree.xpath(self.event_xpath)]
+        if not links:
+            raise NeedsBrowser(url)
+        counter = tree.xpath(self.counter_xpath)
+        try:
+            total_pages = page_count(counter[0].text_content()) if counter else None
+        except ValueError:
+            total_pages = None
+        return links, total_pages
+
+    def close(self):
+        self.session.close()
+
+
+class SeleniumLinkExtractor:
+
+    def __init__(self, settings, limiter, driver_factory=make_driver):
+        self.settings = settings
+        self.limiter = limiter
+        self.driver_factory = driver_factory
+        self.driver = None
+        self.pages = 0
+
+    def load(self, url):
+        if self.driver is None:
+            self.driver = self.driver_factory(self.settings['browser'])
+        self.limiter.wait(url)
+        self.driver.get(url)
+        self.pages += 1
+
+    def state_links(self, area_url):
+        from selenium.webdriver.common.by import By
+        self.load(area_url)
+        states = self.driver.find_elements(By.CSS_SELECTOR, "a[href*='/area/united-states/'][href$='/']")
+        return [state.get_attribute('href') for state in states]
+
+    def listing_page(self, url):
+        from selenium.webdriver.common.by import By
+        from selenium.common.exceptions import NoSuchElementException
+        from selenium.common.exceptions import StaleElementReferenceException
+        from selenium.webdriver.support.ui import WebDriverWait as wait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        self.load(url)
+        # waiting for the listing also makes sure the page counter has rendered
+        ignored_exceptions=(NoSuchElementException,StaleElementReferenceException)
+        concert_events = wait(self.driver, self.settings['timeout'],ignored_exceptions=ignored_exceptions)\
+                        .until(EC.presence_of_all_elements_located((By.CSS_SELECTOR,\
+                                                    "a[href*='/event/']")))
+        links = [concert.get_attribute('href') for concert in concert_events]
+        try:
+            total_pages = page_count(self.driver.find_element(By.XPATH, "//div[@class='buttons_counter']/span").text)
+        # if concerts for a state fits in one page
+        except (NoSuchElementException, ValueError):
+            total_pages = None
+        return links, total_pages
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+
+class FallbackLinkExtractor:
+    # the browser is only started the first time a page needs it
+
+    def __init__(self, settings, limiter, driver_factory=make_driver):
+        self.http = HttpLinkExtractor(settings, limiter)
+        self.browser = SeleniumLinkExtractor(settings, limiter, driver_factory)
+        self.fallbacks = 0
+
+    @property
+    def pages(self):
+        return self.http.pages + self.browser.pages
+
+    def state_links(self, area_url):
+        try:
+            return self.http.state_links(area_url)
+        except NeedsBrowser:
+            self.fallbacks += 1
+            return self.browser.state_links(area_url)
+
+    def listing_page(self, url):
+        try:
+            return self.http.listing_page(url)
+        except NeedsBrowser:
+            self.fallbacks += 1
+            return self.browser.listing_page(url)
+
+    def close(self):
+        self.http.close()
+        self.browser.close()
+
+
+def make_extractor(settings, limiter, driver_factory=make_driver):
+    backend = settings.get('backend', 'auto')
+    if backend == 'http':
+        return HttpLinkExtractor(settings, limiter)
+    if backend == 'selenium':
+        return SeleniumLinkExtractor(settings, limiter, driver_factory)
+    return FallbackLinkExtractor(settings, limiter, driver_factory)
@@ -0,0 +1,267 @@
+# Purpose: see where a run spends its time and memory, stage by stage.
+#
+# Every stage (and the steps inside it: fetching and parsing, the cleaning
+# steps, each Spotify fetch, each table loader) runs inside metrics.stage(),
+# which records:
+#   - wall and CPU time
+#   - peak RSS of the process so far (the high-water mark; it never goes down)
+#   - rows in and out, where the stage sets them
+#   - counters added with metrics.count() while it runs: API calls, requests,
+#     DB statements, bytes read and written
+# Stages nest: a step is recorded under its own name ('clean.dates') and its
+# counters also add up in the stages around it.
+# The open stages are kept per thread, so stages running side by side (e.g. the
+# tables load_scheduler loads at the same time) each count only their own.
+# Work handed to a pool thread is wrapped with bind(), so it counts into the
+# stages that were open where it was submitted.
+# With [metrics] enabled, each finished stage is appended to a JSON-lines file,
+# or written to a Prometheus textfile (node_exporter's textfile collector). There
+# is one textfile per top-level stage, named after it and its labels
+# (metrics/pipeline_load_concerts_0.prom for path metrics/pipeline.prom), holding
+# it and the steps inside it: the DAG's tasks are separate processes, running
+# side by side, and would otherwise overwrite each other's file.
+# The stages named in 'profile' are also run under cProfile (or pyinstrument,
+# if installed and chosen), one profile file per stage and run date. A selected
+# stage inside another one being profiled is only in the outer profile (one
+# profiler at a time), and only the thread that opened the stage is profiled:
+# work on pool threads (e.g. the tables load_scheduler loads) isn't in it.
+# Disabled (the default), stage() and count() do next to nothing.
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+# pipeline_config imports this module too; each only uses the other inside functions
+import pipeline_config
+
+# output: jsonl or prometheus; path and profile_dir are relative to the project folder
+# profile: stage names, separated by commas ('all' for every stage); profiler: cprofile or pyinstrument
+DEFAULTS = {'enabled': False, 'output': 'jsonl', 'path': 'metrics/metrics.jsonl', 'profile': '',
+            'profiler': 'cprofile', 'profile_dir': 'metrics/profiles'}
+
+project_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def settings_from_config(parser, section='metrics'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if os.uname().sysname == 'Darwin' else 2**10), 1)
+
+
+class StageMetrics:
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.rows_in = None
+        self.rows_out = None
+        # the top-level stage this one runs in (itself, if it is one)
+        self.root = self
+        self.counts = Counter()
+        self.wall = None
+        self.cpu = None
+        self.peak_rss_mb = None
+
+    def values(self):
+        values = {'wall_s': round(self.wall, 4), 'cpu_s': round(self.cpu, 4), 'peak_rss_mb': self.peak_rss_mb,
+                  'rows_in': self.rows_in, 'rows_out': self.rows_out}
+        values.update(self.counts)
+        return values
+
+    def record(self, run_date):
+        record = {'run_date': run_date, 'stage': self.name}
+        record.update(self.labels)
+        record.update(self.values())
+        return record
+
+
+class Recorder:
+
+    def __init__(self, settings=DEFAULTS, run_date=None):
+        self.settings = settings
+        self.run_date = run_date
+        self.stages = []
+        self.profile = {name.strip() for name in settings['profile'].split(',') if name.strip()}
+
+    def path(self, name):
+        return os.path.join(project_directory, name)
+
+    def finished(self, stage):
+        self.stages.append(stage)
+        path = self.path(self.settings['path'])
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if self.settings['output'] == 'prometheus':
+            write_prometheus(prometheus_path(path, stage.root),
+                             [other for other in self.stages if other.root is stage.root], self.run_date)
+        else:
+            with open(path, 'a') as f:
+                f.write(json.dumps(stage.record(self.run_date)) + '\n')
+
+    @contextmanager
+    def profiled(self, name):
+        if name not in self.profile and 'all' not in self.profile or getattr(local, 'profiling', False):
+            yield
+            return
+        local.profiling = True
+        try:
+            with self.profiler(name):
+                yield
+        finally:
+            local.profiling = False
+
+    @contextmanager
+    def profiler(self, name):
+        directory = self.path(self.settings['profile_dir'])
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{name}_{self.run_date or 'run'}")
+        if self.settings['profiler'] == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("pyinstrument is not installed, profiling with cProfile instead")
+            else:
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    yield
+                finally:
+                    profiler.stop()
+                    with open(base + '.html', 'w') as f:
+                        f.write(profiler.output_html())
+                return
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(base + '.prof')
+
+
+# the recorder stage() reports to (set by configure()), and the stages open in
+# each thread (local.stages, a tuple, innermost last)
+recorder = None
+local = threading.local()
+lock = threading.Lock()
+
+
+def configure(parser, run_date=None):
+    # from the [metrics] section; returns the recorder, None when disabled
+    global recorder
+    settings = settings_from_config(parser)
+    recorder = Recorder(settings, run_date) if settings['enabled'] else None
+    return recorder
+
+
+@contextmanager
+def stage(name, **labels):
+    # with metrics.stage('clean') as m: ... m.rows_in = len(df)
+    # labels left as None (e.g. no shard) are not recorded
+    metrics = StageMetrics(name, {key: value for key, value in labels.items() if value is not None})
+    if recorder is None:
+        yield metrics
+        return
+    outer = open_stages()
+    if outer:
+        metrics.root = outer[0].root
+    local.stages = outer + (metrics,)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with recorder.profiled(name):
+            yield metrics
+    finally:
+        metrics.wall = time.perf_counter() - wall
+        metrics.cpu = time.process_time() - cpu
+        metrics.peak_rss_mb = peak_rss_mb()
+        local.stages = outer
+        with lock:
+            recorder.finished(metrics)
+
+
+def open_stages():
+    return getattr(local, 'stages', ())
+
+
+def bind(func):
+    # func, to run on another thread counting into the stages open here
+    stages = open_stages()
+
+    def bound(*args, **kwargs):
+        outer = open_stages()
+        local.stages = stages
+        try:
+            return func(*args, **kwargs)
+        finally:
+            local.stages = outer
+    return bound
+
+
+def count(name, n=1):
+    # adds n to the counter of the stages open in this thread
+    stages = open_stages()
+    if not stages:
+        return
+    with lock:
+        for metrics in stages:
+            metrics.counts[name] += n
+
+
+def watch_engine(engine):
+    # every statement sent to the database counts as 'db_statements'
+    # (executemany batches count once)
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def counted(conn, cursor, statement, parameters, context, executemany):
+        count('db_statements')
+    return engine
+
+
+def prometheus_name(name):
+    return 'pipeline_stage_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def prometheus_path(path, root):
+    # path with the top-level stage's name and label values added: 'metrics/pipeline.prom'
+    # -> 'metrics/pipeline_load_concerts_0.prom'
+    stem, extension = os.path.splitext(path)
+    parts = [root.name] + [str(value) for value in root.labels.values()]
+    return stem + ''.join('_' + ''.join(c if c.isalnum() else '_' for c in part) for part in parts) + (extension or '.prom')
+
+
+def write_prometheus(path, stages, run_date):
+    # one gauge per value, labelled by stage, the run date when there is one, the
+    # top-level stage's labels (a step of shard 0 and one of shard 1 are different
+    # series) and the stage's own; the latest of a stage run more than once wins
+    latest = {}
+    for stage in stages:
+        labels = dict(stage=stage.name, **({'run_date': run_date} if run_date else {}))
+        labels.update(stage.root.labels)
+        labels.update(stage.labels)
+        latest[tuple(sorted(labels.items()))] = (labels, stage.values())
+    lines = []
+    for labels, values in latest.values():
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        for key, value in values.items():
+            if value is not None:
+                lines.append(f'{prometheus_name(key)}{{{label_text}}} {value}')
+    # written next to the file and moved over it, so the collector never reads half a file
+    with open(path + '.tmp', 'w') as f:
+        f.write('\n'.join(sorted(lines)) + '\n')
+    os.replace(path + '.tmp', path)
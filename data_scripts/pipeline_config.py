@@ -0,0 +1,65 @@
+# Purpose: what every stage needs before it starts: pipeline.conf, the date the
+# run is for and, for the concert stages, which shard of the day's events.
+#
+# The stages used to name their artifacts after datetime.now(), so a run going
+# past midnight, or a backfill, read and wrote the wrong day's data. Now the
+# date is passed in (Airflow's {{ ds }}, or --date on the command line) and
+# every artifact key is built from it; today is only the default when a
+# script is run by hand.
+
+import argparse
+import configparser
+import datetime
+import os
+
+import metrics
+
+# assuming the 'pipeline.conf' file is in the same location as the 'pipeline_template.conf' file
+# (PIPELINE_CONF can point to another one, e.g. for the benchmarks)
+project_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+conf_path = os.environ.get('PIPELINE_CONF', os.path.join(project_directory, 'pipeline.conf'))
+
+
+def read_config(path=None):
+    parser = configparser.ConfigParser()
+    parser.read(path or conf_path)
+    return parser
+
+
+def section_settings(parser, section, defaults):
+    # defaults, with the values set in that section of pipeline.conf, each of the default's type
+    settings = dict(defaults)
+    if parser.has_section(section):
+        for name, default in defaults.items():
+            if isinstance(default, bool):
+                settings[name] = parser.getboolean(section, name, fallback=default)
+            else:
+                settings[name] = type(default)(parser.get(section, name, fallback=default))
+    return settings
+
+
+def stage_config(run_date=None, path=None):
+    # read_config(), and the [metrics] recorder set up for the run
+    parser = read_config(path)
+    metrics.configure(parser, run_date)
+    return parser
+
+
+def run_date(value=None):
+    # 'YYYY-MM-DD' (a date, datetime or string), today when None
+    if value is None:
+        return datetime.date.today().isoformat()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%Y-%m-%d')
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def stage_arguments(description, shards=False):
+    # command line of a stage script: --date, and --shard for the sharded concert stages
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument('--date', type=run_date, default=run_date(),
+                            help='the day the run is for, YYYY-MM-DD (default: today)')
+    if shards:
+        arg_parser.add_argument('--shard', type=int, default=None,
+                                help='only this shard of the day\'s events (see shards in [discovery])')
+    return arg_parser.parse_args()
@@ -0,0 +1,98 @@
+# Purpose: token-bucket rate limiting that can be shared between worker threads.
+# Replaces fixed random sleeps: the bucket refills at 'rate' requests per second
+# (up to 'capacity' saved-up requests), so no matter how many workers there are,
+# a host never gets more than that on average.
+# RetryScheduler adds what an API with 429 responses needs on top of that: when
+# one worker is told to back off, every worker waits for the Retry-After.
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # blocks until a token is available
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    # one bucket per host, created the first time the host is seen
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        bucket.acquire()
+
+
+class RetryScheduler:
+    # shared by every worker calling one API; retry_after(error) returns the
+    # seconds to wait before retrying the call that raised error, or None if
+    # error should not be retried
+
+    def __init__(self, rate, retry_after, capacity=1, max_retries=5):
+        self.bucket = TokenBucket(rate, capacity)
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+        self.pauses = 0
+        self.retries = 0
+
+    def pause(self, seconds):
+        # nobody sends anything for 'seconds' (an earlier, longer pause is kept)
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+            self.pauses += 1
+
+    def wait(self):
+        while True:
+            with self.lock:
+                delay = self.resume_at - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        self.bucket.acquire()
+
+    def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.wait()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self.retry_after(e)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                with self.lock:
+                    self.retries += 1
+                self.pause(delay)
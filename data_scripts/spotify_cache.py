@@ -0,0 +1,99 @@
+# Purpose: keep the Spotify album, artist and audio-feature data we fetched in a
+# local SQLite file, so a daily run only asks the API for what is new or stale.
+#
+# Each entity has one row per (kind, Spotify id) with its JSON, when it was
+# fetched and when it was last used. Every kind has its own TTL: audio features
+# don't change (0 = never expire), artist popularity/genres do within a day,
+# album metadata rarely (its popularity lags by up to the album TTL).
+# Entries past their TTL count as misses and are fetched again; once there are
+# more than 'max_entries', the least recently used ones are dropped.
+# hits/misses/stale count lookups per kind, for the run's log.
+
+import json
+import sqlite3
+import time
+from collections import Counter
+
+import pipeline_config
+
+# searches: the artists found for a performer's name (performers.py)
+DEFAULTS = {'path': 'spotify_cache.sqlite3', 'artists_ttl_hours': 24.0, 'albums_ttl_hours': 168.0,
+            'audio_features_ttl_hours': 0.0, 'searches_ttl_hours': 720.0, 'max_entries': 200000}
+
+KINDS = ['albums', 'artists', 'audio_features', 'searches']
+
+# ids per SELECT, below SQLite's limit on bound parameters
+QUERY_BATCH = 500
+
+
+def settings_from_config(parser, section='spotify_cache'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+class SpotifyCache:
+
+    def __init__(self, path, settings=DEFAULTS, clock=time.time):
+        self.ttl = {kind: settings[f'{kind}_ttl_hours'] * 3600 for kind in KINDS}
+        self.max_entries = settings['max_entries']
+        self.clock = clock
+        self.hits = Counter()
+        self.misses = Counter()
+        self.stale = Counter()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS entities (
+                                 kind TEXT NOT NULL,
+                                 id TEXT NOT NULL,
+                                 data TEXT NOT NULL,
+                                 fetched_at REAL NOT NULL,
+                                 used_at REAL NOT NULL,
+                                 PRIMARY KEY (kind, id))''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entities_used_at ON entities (used_at)')
+
+    def get_many(self, kind, ids):
+        # {id: entity} for the ids with an entry younger than the kind's TTL
+        now = self.clock()
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        for start in range(0, len(ids), QUERY_BATCH):
+            batch = ids[start:start + QUERY_BATCH]
+            rows = self.conn.execute(f'''SELECT id, data, fetched_at FROM entities
+                                         WHERE kind = ? AND id IN ({', '.join('?' * len(batch))})''',
+                                     [kind] + batch)
+            for entity_id, data, fetched_at in rows:
+                if self.ttl[kind] and now - fetched_at >= self.ttl[kind]:
+                    self.stale[kind] += 1
+                    continue
+                found[entity_id] = json.loads(data)
+        self.hits[kind] += len(found)
+        self.misses[kind] += len(ids) - len(found)
+        with self.conn:
+            self.conn.executemany('UPDATE entities SET used_at = ? WHERE kind = ? AND id = ?',
+                                  [(now, kind, entity_id) for entity_id in found])
+        return found
+
+    def put_many(self, kind, entities):
+        # entities: {id: entity} as the API returned them
+        now = self.clock()
+        with self.conn:
+            self.conn.executemany('''INSERT INTO entities (kind, id, data, fetched_at, used_at)
+                                     VALUES (?, ?, ?, ?, ?)
+                                     ON CONFLICT (kind, id) DO UPDATE SET
+                                         data = excluded.data,
+                                         fetched_at = excluded.fetched_at,
+                                         used_at = excluded.used_at''',
+                                  [(kind, entity_id, json.dumps(entity), now, now)
+                                   for entity_id, entity in entities.items()])
+
+    def evict(self):
+        # drops the least recently used entries past max_entries, returns how many
+        with self.conn:
+            return self.conn.execute('''DELETE FROM entities WHERE rowid IN (
+                                            SELECT rowid FROM entities ORDER BY used_at DESC LIMIT -1 OFFSET ?)''',
+                                     (self.max_entries,)).rowcount
+
+    def stats(self):
+        return ', '.join(f'{kind}: {self.hits[kind]} hits, {self.misses[kind]} misses ({self.stale[kind]} stale)'
+                         for kind in KINDS)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,260 @@
+# Purpose: get the tracks of the playlists we follow, and the album, artist and
+# audio-feature data for them, with as few Spotify Web API calls as possible.
+#
+# spotify_data.py used to call sp.album(), sp.artist() (per artist) and
+# sp.audio_features() for every playlist item: 150+ sequential requests for 50
+# tracks, fetching the same album or artist again whenever it came up twice.
+# Here the ids are collected and deduplicated first (across all playlists, which
+# share most of their hits), then fetched with the batch endpoints (sp.albums:
+# 20 ids, sp.artists: 50, sp.audio_features: 100 per call) and joined back to
+# the tracks in memory.
+#
+# The playlists (the [spotify] section of pipeline.conf) are read on a pool of
+# worker threads, following the pages of each one; the metadata batches are
+# spread over the same pool. All calls go through one rate_limit.RetryScheduler:
+# requests are paced at 'rate' per second, and a 429 seen by any worker holds
+# every worker back for its Retry-After instead of each one running into it.
+# With a spotify_cache.SpotifyCache, only the ids without a fresh cache entry
+# are fetched at all.
+# search_artists() looks artists up by name for performers.py, the same way:
+# one search per name (there is no batch search), paced, spread over the
+# workers, and cached (names Spotify found nothing for included).
+
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+import metrics
+import pipeline_config
+from rate_limit import RetryScheduler
+
+# playlists: ids, URIs or links, separated by commas or whitespace
+# rate: requests per second shared by all the workers, 0 = no pacing
+DEFAULTS = {'playlists': '37i9dQZEVXbLRQDuF5jeBp', 'workers': 4, 'rate': 10.0, 'max_retries': 5}
+
+# most ids each batch endpoint accepts, and the largest playlist page
+BATCH_LIMITS = {'albums': 20, 'artists': 50, 'audio_features': 100, 'playlist_tracks': 100}
+
+# artists returned per name searched
+SEARCH_LIMIT = 5
+
+# 5xx answers are retried after a short wait, 429s after their Retry-After
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def settings_from_config(parser, section='spotify'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def playlist_ids(playlists):
+    # 'spotify:playlist:<id>', 'https://open.spotify.com/playlist/<id>?si=...' or just '<id>'
+    ids = []
+    for value in re.split(r'[\s,]+', playlists.strip()):
+        if value:
+            ids.append(re.split(r'[:/]', value.split('?')[0].rstrip('/'))[-1])
+    return list(dict.fromkeys(ids))
+
+
+def spotify_retry_after(error):
+    # for RetryScheduler: seconds to wait before retrying, None to give up
+    status = getattr(error, 'http_status', None)
+    if status not in RETRY_STATUSES:
+        return None
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 1))
+    except ValueError:
+        return 1.0
+
+
+def make_scheduler(settings):
+    return RetryScheduler(settings['rate'], spotify_retry_after, max_retries=settings['max_retries'])
+
+
+class ScheduledClient:
+    # wraps a spotipy.Spotify so every API method goes through the scheduler
+
+    def __init__(self, sp, scheduler):
+        self.sp = sp
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        method = getattr(self.sp, name)
+
+        def counted(*args, **kwargs):
+            # every request sent, retries included
+            metrics.count('spotify_api_calls')
+            return method(*args, **kwargs)
+        return lambda *args, **kwargs: self.scheduler.call(counted, *args, **kwargs)
+
+
+def chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def batched(pool, call, ids, size):
+    # call(batch) for each batch of the distinct ids, on the pool if there is one
+    batches = list(chunks(list(dict.fromkeys(ids)), size))
+    results = pool.map(metrics.bind(call), batches) if pool is not None else map(call, batches)
+    return [entry for result in results for entry in result if entry is not None]
+
+
+def fetch_albums(sp, album_ids, pool=None):
+    # {album_id: album}; ids Spotify doesn't know come back as None and are left out
+    albums = batched(pool, lambda batch: sp.albums(batch)['albums'], album_ids, BATCH_LIMITS['albums'])
+    return {album['id']: album for album in albums}
+
+
+def fetch_artists(sp, artist_ids, pool=None):
+    artists = batched(pool, lambda batch: sp.artists(batch)['artists'], artist_ids, BATCH_LIMITS['artists'])
+    return {artist['id']: artist for artist in artists}
+
+
+def fetch_audio_features(sp, track_ids, pool=None):
+    features = batched(pool, sp.audio_features, track_ids, BATCH_LIMITS['audio_features'])
+    return {feats['id']: feats for feats in features}
+
+
+def playlist_items(sp, playlist_id):
+    # every item of the playlist, page after page
+    items = []
+    while True:
+        page = sp.playlist_tracks(playlist_id, limit=BATCH_LIMITS['playlist_tracks'], offset=len(items))
+        items.extend(page['items'])
+        if not page.get('next') or not page['items']:
+            return items
+
+
+audio_feature_columns = ['acousticness', 'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+                         'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'time_signature']
+
+
+def cached_fetch(cache, kind, ids, fetch):
+    # fetch(ids) -> {id: entity}; with a cache, only the ids it has no fresh entry for
+    if cache is None:
+        return fetch(ids)
+    found = cache.get_many(kind, ids)
+    fetched = fetch([entity_id for entity_id in dict.fromkeys(ids) if entity_id not in found])
+    cache.put_many(kind, fetched)
+    found.update(fetched)
+    return found
+
+
+def fetch_metadata(sp, tracks, pool=None, cache=None):
+    # albums, artists and audio features of all the tracks, each id fetched once
+    albums = cached_fetch(cache, 'albums', [track['album']['id'] for track in tracks],
+                          lambda ids: fetch_albums(sp, ids, pool))
+    artists = cached_fetch(cache, 'artists', [artist['id'] for track in tracks for artist in track['artists']],
+                           lambda ids: fetch_artists(sp, ids, pool))
+    features = cached_fetch(cache, 'audio_features', [track['id'] for track in tracks],
+                            lambda ids: fetch_audio_features(sp, ids, pool))
+    return albums, artists, features
+
+
+def track_list(items):
+    # (rank, track) for the items that still have a track
+    return [(rank + 1, item['track']) for rank, item in enumerate(items) if item.get('track') is not None]
+
+
+def playlist_rows(sp, items, date_, playlist_id=None, metadata=None, pool=None):
+    # items: the playlist's items from sp.playlist_tracks(); returns the rows for
+    # the top50, artists, albums and audio features DataFrames, in the same shape
+    # and order spotify_data.py always built them (duplicates included, see its
+    # drop_duplicates). metadata: fetch_metadata() result covering these tracks
+    tracks = track_list(items)
+    albums, artists, features = metadata or fetch_metadata(sp, [track for _, track in tracks], pool)
+
+    top50_data, albums_data, artists_data, tracks_info = [], [], [], []
+    for rank_no, track in tracks:
+        track_id = track['id']
+        album_id = track['album']['id']
+        album_pg = albums.get(album_id)
+        if album_pg is None:
+            print(f"Skipping track {track_id}: album {album_id} could not be fetched")
+            continue
+        tracks_artists_id = [artist['id'] for artist in track['artists']]
+
+        for artist_id in tracks_artists_id:
+            artist_pg = artists.get(artist_id)
+            if artist_pg is None:
+                continue
+            artists_data.append({'artist_id': artist_id,
+                                 'artist_name': artist_pg['name'],
+                                 'artist_popularity': artist_pg['popularity'],
+                                 'artist_genres': artist_pg['genres']})
+
+        rows_top50 = {'date_on_top': date_,
+                      'rank_no': rank_no,
+                      'track_id': track_id,
+                      'track_name': track['name'],
+                      'artists_ids': tracks_artists_id,
+                      'album_id': album_id}
+        if playlist_id is not None:
+            rows_top50['playlist_id'] = playlist_id
+        top50_data.append(rows_top50)
+
+        albums_data.append({'album_id': album_id,
+                            'album_name': album_pg['name'],
+                            'album_label': album_pg['label'],
+                            'album_popularity': album_pg['popularity'],
+                            'album_release_date': album_pg['release_date'],
+                            'album_total_tracks': album_pg['total_tracks'],
+                            'album_artists_ids': [artist['id'] for artist in album_pg['artists']],
+                            'album_type': album_pg['album_type']})
+
+        # tracks without audio features (e.g. local files) get no row
+        audio_feats = features.get(track_id)
+        if audio_feats is not None:
+            rows_feats = {'track_id': track_id}
+            rows_feats.update((column, audio_feats[column]) for column in audio_feature_columns)
+            tracks_info.append(rows_feats)
+
+    return top50_data, artists_data, albums_data, tracks_info
+
+
+def search_artists(sp, names, settings=DEFAULTS, scheduler=None, cache=None, limit=SEARCH_LIMIT):
+    # {name: [{'id', 'name', 'popularity'}, ...]}, the first 'limit' artists Spotify finds for each name
+    scheduler = scheduler or make_scheduler(settings)
+    client = ScheduledClient(sp, scheduler)
+
+    def search(batch):
+        return [(name, client.search(q=f'artist:{name}', type='artist', limit=limit)['artists']['items'])
+                for name in batch]
+
+    with ThreadPoolExecutor(max_workers=max(1, settings['workers'])) as pool:
+        def fetch(names):
+            return {name: {'artists': [{key: artist.get(key) for key in ('id', 'name', 'popularity')}
+                                       for artist in artists]}
+                    for name, artists in batched(pool, search, names, 1)}
+        with metrics.stage('spotify.search') as stage_metrics:
+            stage_metrics.rows_in = len(names)
+            found = cached_fetch(cache, 'searches', names, fetch)
+    return {name: entry['artists'] for name, entry in found.items()}
+
+
+def fetch_playlists(sp, playlists, date_, settings=DEFAULTS, scheduler=None, cache=None):
+    # rows (as playlist_rows) for all the playlists together, top50 rows tagged
+    # with their playlist_id; a playlist that can't be read is reported and skipped
+    scheduler = scheduler or make_scheduler(settings)
+    client = ScheduledClient(sp, scheduler)
+    with ThreadPoolExecutor(max_workers=max(1, settings['workers'])) as pool:
+        with metrics.stage('spotify.playlists') as stage_metrics:
+            pages = {playlist_id: pool.submit(metrics.bind(playlist_items), client, playlist_id)
+                     for playlist_id in playlists}
+            items = {}
+            for playlist_id, future in pages.items():
+                try:
+                    items[playlist_id] = future.result()
+                except Exception as e:
+                    print(f"Could not read playlist {playlist_id}: {e}")
+            tracks = [track for playlist in items.values() for _, track in track_list(playlist)]
+            stage_metrics.rows_out = len(tracks)
+        with metrics.stage('spotify.metadata') as stage_metrics:
+            stage_metrics.rows_in = len(tracks)
+            metadata = fetch_metadata(client, tracks, pool, cache)
+
+    rows = ([], [], [], [])
+    for playlist_id, playlist in items.items():
+        for all_rows, playlist_rows_ in zip(rows, playlist_rows(client, playlist, date_, playlist_id, metadata)):
+            all_rows.extend(playlist_rows_)
+    return rows
@@ -1,58 +1,60 @@
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy import Column, ForeignKey, Integer, String, SmallInteger, Date, Float, Boolean, Table, Time
-import os, configparser
-
-# assuming the 'pipeline.conf' file is in the same location as the 'pipeline_template.conf' file
-current_directory = os.path.dirname(os.path.abspath(__file__))
-parent_directory = os.path.dirname(current_directory)
-file_conf = os.path.join(parent_directory, 'pipeline.conf')
-parser = configparser.ConfigParser()
-parser.read(file_conf)
-
-database_url = parser.get("database", "DB_URL")
-
-engine = create_engine(database_url, pool_pre_ping=True)
-Session = sessionmaker(bind=engine)
-session = Session()
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import (Column, ForeignKey, Integer, BigInteger, String, SmallInteger, Date, Float, Boolean, Table, Time,
+                        Index)
+
 Base = declarative_base()
-metadata = MetaData()
-metadata.bind = engine
 
 # Note: for simple many-to-many relationships (i.e. no additional features describing the relationship)
 # we can directly create table instead of creating a class to link the two
 # since there are no other attributes beyond the one that links them
+# Each link is stored once: both columns form the primary key, whose index also
+# serves lookups by its first column; the second column has an index of its own.
+# (tables created before they had a primary key are rebuilt by upgrades.py)
 
 # ~ simple many-to-many relationship between Artist and Genre 
 artist_genre_table = Table(
     'artist_genre', 
     Base.metadata,
-    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE')),
-    Column('genre_id', Integer, ForeignKey('genres.genre_id', ondelete='CASCADE'))
+    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE'), primary_key=True),
+    Column('genre_id', Integer, ForeignKey('genres.genre_id', ondelete='CASCADE'), primary_key=True),
+    Index('artist_genre_genre_id_idx', 'genre_id')
 )
 
 # ~ simple many-to-many relationship between Artist and Album
 artist_album_table = Table(
     'artist_album',
     Base.metadata,
-    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE')),
-    Column('album_id', String, ForeignKey('albums.album_id'))
+    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE'), primary_key=True),
+    Column('album_id', String, ForeignKey('albums.album_id'), primary_key=True),
+    Index('artist_album_album_id_idx', 'album_id')
 )
 
 # ~ simple many-to-many relationship between Artist and Track
 artist_track_table = Table(
     'artist_track',
     Base.metadata,
-    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE')),
-    Column('track_id', String, ForeignKey('tracks.track_id'))
+    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE'), primary_key=True),
+    Column('track_id', String, ForeignKey('tracks.track_id'), primary_key=True),
+    Index('artist_track_track_id_idx', 'track_id')
     )
 
 # ~ simple many-to-many relationship between Concert and Genre
 concert_genre_table = Table(
     'concert_genre',
     Base.metadata,
-    Column('concert_id', Integer, ForeignKey('concerts.concert_id', ondelete='CASCADE')),
-    Column('genre_id', Integer, ForeignKey('genres.genre_id', ondelete='CASCADE'))
+    Column('concert_id', Integer, ForeignKey('concerts.concert_id', ondelete='CASCADE'), primary_key=True),
+    Column('genre_id', Integer, ForeignKey('genres.genre_id', ondelete='CASCADE'), primary_key=True),
+    Index('concert_genre_genre_id_idx', 'genre_id')
+)
+
+# ~ simple many-to-many relationship between Concert and Artist
+# the concert's performers resolved to Spotify artists (see performers.py)
+concert_artist_table = Table(
+    'concert_artist',
+    Base.metadata,
+    Column('concert_id', Integer, ForeignKey('concerts.concert_id', ondelete='CASCADE'), primary_key=True),
+    Column('artist_id', String, ForeignKey('artists.artist_id', ondelete='CASCADE'), primary_key=True),
+    Index('concert_artist_artist_id_idx', 'artist_id')
 )
 
 class Artist(Base):
@@ -75,6 +77,10 @@ class Artist(Base):
     # artist_track_table is junction table for Artist and Track
     track = relationship('Track', secondary = artist_track_table, back_populates = 'artist')
 
+    # 'artist' attribute in Concert connects Concert to Artist
+    # concert_artist_table is junction table for Concert and Artist
+    concert = relationship('Concert', secondary = concert_artist_table, back_populates = 'artist')
+
 class Genre(Base):
     __tablename__ = 'genres'
     genre_id = Column(Integer, primary_key = True, autoincrement = True)
@@ -88,6 +94,10 @@ class Genre(Base):
     # concert_genre_table is junction table for Concert and Genre
     concert = relationship('Concert', secondary=concert_genre_table, back_populates='genre')
 
+# one row per genre; names are stored normalized (see genres.py)
+# for tables created before this index existed, genres.deduplicate() adds it
+genre_name_index = Index('genres_name_key', Genre.name, unique=True)
+
 class Album(Base):
     __tablename__ = 'albums'
     album_id = Column(String, primary_key = True)
@@ -131,15 +141,26 @@ class Track(Base):
     # 1-to-1 relationship, AudioFeatures references Track on track_id
     audio_features = relationship('AudioFeatures', back_populates = 'track')
 
+    __table_args__ = (Index('tracks_album_id_idx', 'album_id'),)
+
+# the only playlist loaded before several could be (Spotify's Top 50 - Global)
+default_playlist_id = '37i9dQZEVXbLRQDuF5jeBp'
+
 class TopTrack(Base):
     __tablename__ = 'top_tracks'
     date_on_top = Column(Date, primary_key = True)
+    # rank_number is the rank within this playlist on that day
+    playlist_id = Column(String, primary_key = True, server_default = default_playlist_id)
     rank_number = Column(SmallInteger, primary_key = True)
 
     track_id = Column(String, ForeignKey('tracks.track_id', ondelete='CASCADE'), nullable = False)
     # will not define relationship here
     # seems more intuitive to instead query Track for TopTrack info (regarding the reverse relationship)
 
+    # a track's (or artist's, through artist_track) days on the charts, in date order
+    # on PostgreSQL the table can also be partitioned by month, see partitions.py
+    __table_args__ = (Index('top_tracks_track_id_date_idx', 'track_id', 'date_on_top'),)
+
 class AudioFeatures(Base):
     __tablename__ = 'audio_features'
     track_id = Column(String, ForeignKey('tracks.track_id', ondelete='CASCADE'), primary_key=True)
@@ -169,15 +190,20 @@ class DataDictionary(Base):
 class Concert(Base):
     __tablename__ = 'concerts'
     concert_id = Column(Integer, primary_key=True)
-    performer = Column(String) 
-    # future edit: make connection between performer and artist possibly by using spotipy search <performer>
-    # another future edit: break up multiple performers given
+    # the performers as listed, joined with ', '; each one resolved to a Spotify
+    # artist is linked through concert_artist (see performers.py)
+    performer = Column(String)
     venue = Column(String)
     location = Column(String)
     date = Column(Date)
     time = Column(Time)
     concertful_ranking = Column(String)
     genre = relationship('Genre', secondary = concert_genre_table, back_populates = 'concert')
+    artist = relationship('Artist', secondary = concert_artist_table, back_populates = 'concert')
+
+    # concerts in a city over a range of dates, and all concerts over a range of dates
+    __table_args__ = (Index('concerts_location_date_idx', 'location', 'date'),
+                      Index('concerts_date_idx', 'date'))
 
 class Festival(Base):
     __tablename__ = 'festivals'
@@ -191,9 +217,29 @@ class Festival(Base):
     time = Column(Time)
     concertful_ranking = Column(String)
 
-# create the tables in the database
-Base.metadata.create_all(engine)
-# make changes permanent
-session.commit()
-# close the session
-session.close() 
+    __table_args__ = (Index('festivals_start_date_idx', 'start_date'),)
+
+# the content hash of every row last loaded, by frame ('artists', 'concerts', ...)
+# and the row's key, so unchanged rows can be skipped (see row_hashes.py)
+class RowHash(Base):
+    __tablename__ = 'row_hashes'
+    entity = Column(String, primary_key = True)
+    key = Column(String, primary_key = True)
+    hash = Column(BigInteger, nullable = False)
+
+def create_tables(engine):
+    # only the tables that don't exist yet; upgrades.upgrade() also brings older ones up to date
+    Base.metadata.create_all(engine)
+
+# the models are imported by data_transfer.py and loaders.py, so importing this
+# file has no side effects: it only connects and creates the tables when it is
+# run (python database.py, the DAG's old database task)
+if __name__ == '__main__':
+    import os, sys
+    from sqlalchemy import create_engine
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data_scripts'))
+    import pipeline_config
+
+    parser = pipeline_config.read_config()
+    create_tables(create_engine(parser.get("database", "DB_URL"), pool_pre_ping=True))
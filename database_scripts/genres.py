@@ -0,0 +1,116 @@
+# Purpose: keep one row per genre in 'genres'.
+#
+# Loading used to build a new Genre(name=...) for every artist/concert genre, and
+# since genre_id is generated and name was not unique, session.merge() inserted a
+# new genre row (and link) for every occurrence, every day.
+# Now names are normalized (case folded, whitespace collapsed: 'Hip  Hop' and
+# 'hip hop' are the same genre), 'genres.name' has a unique index, and loads go
+# through a GenreResolver: the existing genres are read once into a name -> id
+# map, missing names are inserted in one batch, and links are written by id.
+# deduplicate() folds the duplicates left by earlier loads into one row per
+# name and adds the unique index to an existing table.
+
+from sqlalchemy import Column, Integer, MetaData, Table, bindparam, func, select
+
+from database import Genre, artist_genre_table, concert_genre_table, genre_name_index
+
+genre_link_tables = [artist_genre_table, concert_genre_table]
+
+
+def normalize(name):
+    return ' '.join(name.split()).casefold()
+
+
+def insert_ignoring_duplicates(conn):
+    # loads running side by side (the DAG's concert shards) can add the same new
+    # genre at the same time; the second insert is skipped instead of failing on the unique index
+    genres = Genre.__table__
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif conn.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return genres.insert()
+    return insert(genres).on_conflict_do_nothing()
+
+
+class GenreResolver:
+
+    def __init__(self, conn, batch_size=1000):
+        self.batch_size = batch_size
+        self.ids = {}
+        self.load(conn)
+
+    def load(self, conn, names=None):
+        # names: only these (normalized) names, otherwise the whole table
+        genres = Genre.__table__
+        query = select(genres.c.name, genres.c.genre_id).order_by(genres.c.genre_id.desc())
+        batches = [None] if names is None else [names[i:i + self.batch_size]
+                                                for i in range(0, len(names), self.batch_size)]
+        for batch in batches:
+            rows = conn.execute(query if batch is None else query.where(genres.c.name.in_(batch)))
+            # before deduplicate() there can be several rows per name; the lowest id wins
+            self.ids.update((normalize(name), genre_id) for name, genre_id in rows)
+
+    def resolve(self, conn, names):
+        # {normalized name: genre_id} for names, inserting the ones not in 'genres' yet
+        wanted = list(dict.fromkeys(normalize(name) for name in names))
+        # inserted in name order: two loads adding the same new genres at the same time
+        # then wait for each other in the same order, instead of deadlocking
+        missing = sorted(name for name in wanted if name not in self.ids)
+        if missing:
+            conn.execute(insert_ignoring_duplicates(conn), [{'name': name} for name in missing])
+            self.load(conn, missing)
+        return {name: self.ids[name] for name in wanted}
+
+    def __getitem__(self, name):
+        return self.ids[normalize(name)]
+
+
+def deduplicate(engine, batch_size=1000):
+    # one row per normalized name (the lowest genre_id), links moved to it, then
+    # the unique index; does nothing but read 'genres' once it has been done
+    genres = Genre.__table__
+    with engine.begin() as conn:
+        keep = {}
+        renames = []
+        replaced = []
+        for genre_id, name in conn.execute(select(genres.c.genre_id, genres.c.name).order_by(genres.c.genre_id)):
+            key = normalize(name)
+            if key in keep:
+                replaced.append({'old_id': genre_id, 'new_id': keep[key]})
+                continue
+            keep[key] = genre_id
+            if name != key:
+                renames.append({'kept_id': genre_id, 'normalized': key})
+
+        if replaced:
+            temporary = MetaData()
+            genre_map = Table('genre_map', temporary, Column('old_id', Integer, primary_key=True),
+                              Column('new_id', Integer), prefixes=['TEMPORARY'])
+            genre_map.create(conn)
+            for start in range(0, len(replaced), batch_size):
+                conn.execute(genre_map.insert(), replaced[start:start + batch_size])
+            for table in genre_link_tables:
+                # the links moved to the kept genre, once each (links that now point to the same
+                # genre twice would break the link table's primary key if updated in place)
+                distinct = Table(f'{table.name}_distinct', temporary, *[Column(c.name, c.type) for c in table.columns],
+                                 prefixes=['TEMPORARY'])
+                distinct.create(conn)
+                remapped = [func.coalesce(genre_map.c.new_id, c).label(c.name) if c.name == 'genre_id' else c
+                            for c in table.columns]
+                conn.execute(distinct.insert().from_select(
+                    [c.name for c in table.columns],
+                    select(*remapped).select_from(table.outerjoin(genre_map, genre_map.c.old_id == table.c.genre_id))
+                                     .distinct()))
+                conn.execute(table.delete())
+                conn.execute(table.insert().from_select([c.name for c in table.columns], select(*distinct.columns)))
+                distinct.drop(conn)
+            conn.execute(genres.delete().where(genres.c.genre_id.in_(select(genre_map.c.old_id))))
+            genre_map.drop(conn)
+
+        if renames:
+            conn.execute(genres.update().where(genres.c.genre_id == bindparam('kept_id'))
+                                        .values(name=bindparam('normalized')), renames)
+        genre_name_index.create(conn, checkfirst=True)
+    return len(replaced)
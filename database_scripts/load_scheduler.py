@@ -0,0 +1,99 @@
+# Purpose: load the day's frames side by side where the foreign keys allow it.
+#
+# loaders.bulk_load/merge_load go through the frames one after the other, but
+# only the Spotify ones depend on each other (albums link to artists, tracks to
+# albums, audio features to tracks); concerts, festivals and the data dictionary
+# depend on none of them. The order comes from the foreign keys in
+# database.Base.metadata: a frame waits for the frames that write the tables its
+# own tables refer to, and starts as soon as they have committed. Every frame
+# runs in its own transaction on its own pooled connection (its own Session on
+# the merge path), on a pool of 'load_parallelism' threads.
+#
+# genres has no frame of its own: artists and concerts both add the genres they
+# need, and genres.GenreResolver makes that safe when they do it at the same time.
+# SQLite takes one writer at a time, so there the frames are loaded one by one
+# (in the same order).
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from sqlalchemy.orm import sessionmaker
+
+import loaders
+import metrics
+import pipeline_config
+from database import Base
+
+# load_parallelism: frames loaded at the same time (1: one by one, as before)
+# pool_size: connections the engine keeps open, at least load_parallelism
+DEFAULTS = {'load_parallelism': 4, 'pool_size': 5}
+
+# the tables each frame's loader writes (loaders.py), the frame's own table first
+frame_tables = {'artists': ['artists', 'genres', 'artist_genre'],
+                'albums': ['albums', 'artists', 'artist_album'],
+                'top50': ['tracks', 'artists', 'artist_track', 'top_tracks'],
+                'audio': ['audio_features'],
+                'concerts': ['concerts', 'genres', 'concert_genre'],
+                'festivals': ['festivals'],
+                'data_dict': ['data_dictionary']}
+
+
+def settings_from_config(parser, section='database'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def dependencies(metadata=Base.metadata, tables=frame_tables):
+    # {frame: frames it has to wait for}: the frames owning a table that one of its tables refers to
+    owners = {names[0]: frame for frame, names in tables.items()}
+    waits_for = {}
+    for frame, names in tables.items():
+        waits_for[frame] = set()
+        for name in names:
+            for foreign_key in metadata.tables[name].foreign_keys:
+                owner = owners.get(foreign_key.column.table.name)
+                if owner is not None and owner != frame:
+                    waits_for[frame].add(owner)
+    return waits_for
+
+
+def run(load_frame, names, parallelism, waits_for=None):
+    # load_frame(name) for every name, each once the names it waits for are done;
+    # the first error is raised once the frames already running have finished
+    waits_for = waits_for or dependencies()
+    pending = {name: waits_for.get(name, set()) & set(names) for name in names}
+    done = set()
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        running = {}
+        while pending or running:
+            for name in [name for name, parents in pending.items() if parents <= done]:
+                # the frame's statements count into the stage loading it, not the ones beside it
+                running[pool.submit(metrics.bind(load_frame), name)] = name
+                del pending[name]
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    pending.clear()
+                    wait(running)
+                    raise future.exception()
+                done.add(name)
+    return done
+
+
+def load(engine, frames, mode='bulk', batch_size=1000, row_hashes=None, parallelism=DEFAULTS['load_parallelism']):
+    # like loaders.bulk_load (mode 'bulk') or merge_load ('merge'), with independent frames side by side
+    frames = loaders.prepare(frames)
+    if engine.dialect.name == 'sqlite':
+        parallelism = 1
+
+    def load_frame(name):
+        if mode == 'bulk':
+            loaders.bulk_frame(engine, name, frames[name], batch_size, row_hashes)
+            return
+        session = sessionmaker(bind=engine)()
+        try:
+            loaders.merge_frame(session, name, frames[name], row_hashes)
+        finally:
+            session.close()
+
+    run(load_frame, loaders.loadable(frames), parallelism)
+    return row_hashes.counts if row_hashes is not None else None
@@ -0,0 +1,352 @@
+# Purpose: load the day's DataFrames (see data_transfer.py) into the database tables.
+#
+# Two ways of doing it, picked with load_mode in the [database] section:
+#   - merge: one ORM object per row and session.merge(), which looks every row up
+#     by primary key before inserting or updating it (two round trips per row)
+#   - bulk: set-based; every table is sent in batches of 'batch_size' rows as one
+#     INSERT ... ON CONFLICT (primary key) DO UPDATE statement per batch
+#     (PostgreSQL and SQLite)
+# The association tables (artist_genre, artist_album, artist_track, concert_genre)
+# are replaced the way merge() replaces a collection: the links of every parent
+# being loaded are deleted, then the new links are inserted in batches.
+# In both modes genres go through genres.GenreResolver: one row per (normalized)
+# name, links written by genre_id.
+# Given a row_hashes.RowHashes, both only write the rows that are new or changed
+# since the last load, and return its counts of rows inserted, updated and skipped.
+#
+# frames: {'artists', 'albums', 'top50', 'audio', 'concerts', 'festivals', 'data_dict'}
+# -> DataFrame, as read from the stages' artifacts; frames that are missing or None are skipped.
+
+from sqlalchemy import select
+import pandas as pd
+
+from database import (Artist, Album, Genre, AudioFeatures, TopTrack, Concert, Festival, DataDictionary, Track,
+                      artist_genre_table, artist_album_table, artist_track_table, concert_genre_table,
+                      default_playlist_id)
+from genres import GenreResolver, normalize
+import concert_schema
+import metrics
+
+# frames loaded in this order, so rows referenced by foreign keys are there first
+load_order = ['artists', 'albums', 'top50', 'audio', 'concerts', 'festivals', 'data_dict']
+
+
+def to_dates(series):
+    # datetime64 or 'YYYY-MM-DD' strings into datetime.date (None when missing), for the Date columns
+    series = pd.to_datetime(series)
+    return series.dt.date.astype(object).where(series.notna(), None)
+
+
+def prepare(frames):
+    frames = dict(frames)
+    if frames.get('top50') is not None:
+        frames['top50'] = frames['top50'].assign(date_on_top=to_dates(frames['top50']['date_on_top']))
+        # top50 artifacts written before there were several playlists
+        if 'playlist_id' not in frames['top50']:
+            frames['top50'] = frames['top50'].assign(playlist_id=default_playlist_id)
+    # the concert frames' compact types back into plain values (str ids, datetime.time), see concert_schema.py
+    if frames.get('concerts') is not None:
+        concerts = concert_schema.plain(frames['concerts'])
+        frames['concerts'] = concerts.assign(date=to_dates(concerts['date']))
+    if frames.get('festivals') is not None:
+        festivals = concert_schema.plain(frames['festivals'])
+        frames['festivals'] = festivals.assign(start_date=to_dates(festivals['start_date']),
+                                               end_date=to_dates(festivals['end_date']))
+    return frames
+
+
+def genre_names(genre):
+    # the 'genre' of a concert is a string of genres separated by commas
+    return [name.strip() for name in genre.split(",")] if genre is not None else []
+
+
+## merge ##
+
+def merge_artists(session, artists_df):
+    # genres are looked up (or added) by name first, so every genre stays a single row
+    names = [genre for genres in artists_df['artist_genres'] for genre in genres]
+    genre_ids = GenreResolver(session.connection()).resolve(session.connection(), names)
+    # convert DataFrame to a list of dictionaries-- to be in a form we can be insert into the tables
+    for row in artists_df.to_dict('records'):
+        artist = Artist(artist_id = row['artist_id'],
+                        name = row['artist_name'],
+                        popularity = row['artist_popularity'])
+        # use merge() to handle insert or update process based on PKs
+        # otherwise would have to query for existing records and use many conditionals/cases
+        artist = session.merge(artist)
+        # to link artist with genre (replacing its previous genres)
+        artist.genre = [session.get(Genre, genre_ids[genre])
+                        for genre in dict.fromkeys(map(normalize, row['artist_genres']))]
+    session.commit()
+
+
+def merge_albums(session, albums_df):
+    for row in albums_df.to_dict('records'):
+        album = Album(album_id = row['album_id'],
+                      title = row['album_name'],
+                      label = row['album_label'],
+                      album_type = row['album_type'],
+                      popularity = row['album_popularity'],
+                      release_date = row['album_release_date'],
+                      total_tracks = row['album_total_tracks'])
+        for artist_id in row['album_artists_ids']:
+            album_artist = Artist(artist_id = artist_id)
+            album.artist.append(album_artist)
+        session.merge(album)
+    session.commit()
+
+
+def merge_top_tracks(session, top50_df):
+    for row in top50_df.to_dict('records'):
+        # insert data into 'tracks' with associated artists
+        track = Track(track_id = row['track_id'],
+                      title = row['track_name'],
+                      album_id = row['album_id'])
+        for artist_id in row['artists_ids']:
+            track_artist = Artist(artist_id = artist_id)
+            track.artist.append(track_artist)
+        session.merge(track)
+        # insert data into 'top_tracks'
+        top_song = TopTrack(date_on_top = row['date_on_top'],
+                        playlist_id = row['playlist_id'],
+                        rank_number = row['rank_no'],
+                        track_id = row['track_id'])
+        session.merge(top_song)
+    session.commit()
+
+
+def merge_audio_features(session, audio_df):
+    # column names all match and no junction table
+    for row in audio_df.to_dict('records'):
+        audio = AudioFeatures(**row)
+        # merge() and PKs prevent duplicate records
+        session.merge(audio)
+    session.commit()
+
+
+def merge_concerts(session, concerts_df):
+    names = [name for genre in concerts_df['genre'] for name in genre_names(genre)]
+    genre_ids = GenreResolver(session.connection()).resolve(session.connection(), names)
+    for row in concerts_df.to_dict('records'):
+        # use of .pop() to remove genre aids in insertion process below
+        genres_list = genre_names(row.pop('genre'))
+        # use .pop() to "rename", i.e. remove, reassign to new column
+        row['concertful_ranking'] = row.pop('ranking')
+
+        concert = session.merge(Concert(**row))
+        concert.genre = [session.get(Genre, genre_ids[genre]) for genre in dict.fromkeys(map(normalize, genres_list))]
+    session.commit()
+
+
+def merge_festivals(session, festivals_df):
+    # drop 'genre' column since it is no longer in the database table
+    # The column mostly consisted of 'Festival', though some were events over multiple days-- may account for this in future revisions.
+    for row in festivals_df.drop(columns=['genre']).to_dict('records'):
+        row['concertful_ranking'] = row.pop('ranking')
+        row['festival_id'] = row.pop('concert_id')
+        festival = Festival(**row)
+        session.merge(festival)
+    session.commit()
+
+
+def merge_data_dictionary(session, dict_df):
+    for row in dict_df.to_dict('records'):
+        record = DataDictionary(name = row['type'],
+                                description = row['description'])
+        session.merge(record)
+    session.commit()
+
+
+merge_loaders = {'artists': merge_artists, 'albums': merge_albums, 'top50': merge_top_tracks,
+                 'audio': merge_audio_features, 'concerts': merge_concerts, 'festivals': merge_festivals,
+                 'data_dict': merge_data_dictionary}
+
+
+def loadable(frames):
+    # the names of the frames to load, in load_order
+    names = []
+    for name in load_order:
+        if name not in frames:
+            continue
+        if frames[name] is None:
+            print(f"Nothing to load for '{name}', its data could not be read")
+            continue
+        names.append(name)
+    return names
+
+
+def merge_frame(session, name, df, row_hashes=None):
+    # one prepared frame
+    with metrics.stage(f'load.{name}') as stage_metrics:
+        stage_metrics.rows_in = len(df)
+        if row_hashes is not None:
+            df = row_hashes.changed(session.connection(), name, df)
+        stage_metrics.rows_out = len(df)
+        if len(df):
+            merge_loaders[name](session, df)
+        if row_hashes is not None:
+            row_hashes.save(session.connection(), name)
+            session.commit()
+
+
+def merge_load(session, frames, row_hashes=None):
+    frames = prepare(frames)
+    for name in loadable(frames):
+        merge_frame(session, name, frames[name], row_hashes)
+    return row_hashes.counts if row_hashes is not None else None
+
+
+## bulk ##
+
+def records(df, columns):
+    # columns: {DataFrame column: table column}; NaN/NaT become None
+    values = df[list(columns)].astype(object)
+    values = values.where(values.notna(), None)
+    return [dict(zip(columns.values(), row)) for row in values.itertuples(index=False, name=None)]
+
+
+def batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def insert_statement(conn, table):
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif conn.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"load_mode 'bulk' needs PostgreSQL or SQLite, not {conn.dialect.name}")
+    return insert(table)
+
+
+def upsert(conn, table, rows, batch_size, update=True):
+    # update=False only inserts the rows that are not there yet
+    keys = [column.name for column in table.primary_key.columns]
+    # one row per key, the last one wins (as with merge); PostgreSQL refuses to
+    # update the same row twice in one statement
+    rows = list({tuple(row[key] for key in keys): row for row in rows}.values())
+    if not rows:
+        return
+    statement = insert_statement(conn, table)
+    columns = [column for column in rows[0] if column not in keys]
+    if update and columns:
+        statement = statement.on_conflict_do_update(index_elements=keys,
+                                                    set_={column: statement.excluded[column] for column in columns})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=keys)
+    for batch in batches(rows, batch_size):
+        conn.execute(statement, batch)
+
+
+def replace_links(conn, table, parent_column, child_column, parents, links, batch_size):
+    # parents: every parent being loaded, links: (parent, child) pairs
+    parents = list(dict.fromkeys(parents))
+    for batch in batches(parents, batch_size):
+        conn.execute(table.delete().where(table.c[parent_column].in_(batch)))
+    rows = [{parent_column: parent, child_column: child} for parent, child in dict.fromkeys(links)]
+    for batch in batches(rows, batch_size):
+        conn.execute(table.insert(), batch)
+
+
+def referenced_artists(conn, artist_ids, batch_size):
+    # artists linked from albums/tracks are added with only their id if they are new
+    upsert(conn, Artist.__table__, [{'artist_id': artist_id} for artist_id in artist_ids], batch_size, update=False)
+
+
+def bulk_artists(conn, artists_df, batch_size):
+    upsert(conn, Artist.__table__,
+           records(artists_df, {'artist_id': 'artist_id', 'artist_name': 'name', 'artist_popularity': 'popularity'}),
+           batch_size)
+    ids = GenreResolver(conn, batch_size)\
+              .resolve(conn, [genre for genres in artists_df['artist_genres'] for genre in genres])
+    links = [(artist_id, ids[normalize(genre)])
+             for artist_id, genres in zip(artists_df['artist_id'], artists_df['artist_genres']) for genre in genres]
+    replace_links(conn, artist_genre_table, 'artist_id', 'genre_id', artists_df['artist_id'], links, batch_size)
+
+
+def bulk_albums(conn, albums_df, batch_size):
+    upsert(conn, Album.__table__,
+           records(albums_df, {'album_id': 'album_id', 'album_name': 'title', 'album_label': 'label',
+                               'album_type': 'album_type', 'album_popularity': 'popularity',
+                               'album_release_date': 'release_date', 'album_total_tracks': 'total_tracks'}),
+           batch_size)
+    links = [(album_id, artist_id) for album_id, artists in zip(albums_df['album_id'], albums_df['album_artists_ids'])
+             for artist_id in artists]
+    referenced_artists(conn, [artist_id for _, artist_id in links], batch_size)
+    replace_links(conn, artist_album_table, 'album_id', 'artist_id', albums_df['album_id'], links, batch_size)
+
+
+def bulk_top_tracks(conn, top50_df, batch_size):
+    upsert(conn, Track.__table__,
+           records(top50_df, {'track_id': 'track_id', 'track_name': 'title', 'album_id': 'album_id'}), batch_size)
+    links = [(track_id, artist_id) for track_id, artists in zip(top50_df['track_id'], top50_df['artists_ids'])
+             for artist_id in artists]
+    referenced_artists(conn, [artist_id for _, artist_id in links], batch_size)
+    replace_links(conn, artist_track_table, 'track_id', 'artist_id', top50_df['track_id'], links, batch_size)
+    upsert(conn, TopTrack.__table__,
+           records(top50_df, {'date_on_top': 'date_on_top', 'playlist_id': 'playlist_id', 'rank_no': 'rank_number',
+                             'track_id': 'track_id'}), batch_size)
+
+
+def bulk_audio_features(conn, audio_df, batch_size):
+    table = AudioFeatures.__table__
+    columns = [column.name for column in table.columns if column.name in audio_df]
+    upsert(conn, table, records(audio_df, dict(zip(columns, columns))), batch_size)
+
+
+def bulk_concerts(conn, concerts_df, batch_size):
+    concerts_df = concerts_df.assign(concert_id=concerts_df['concert_id'].astype(int))
+    upsert(conn, Concert.__table__,
+           records(concerts_df, {'concert_id': 'concert_id', 'performer': 'performer', 'venue': 'venue',
+                                 'location': 'location', 'date': 'date', 'time': 'time',
+                                 'ranking': 'concertful_ranking'}),
+           batch_size)
+    genres = [genre_names(genre) for genre in concerts_df['genre']]
+    ids = GenreResolver(conn, batch_size).resolve(conn, [name for names in genres for name in names])
+    links = [(concert_id, ids[normalize(name)])
+             for concert_id, names in zip(concerts_df['concert_id'], genres) for name in names]
+    replace_links(conn, concert_genre_table, 'concert_id', 'genre_id', concerts_df['concert_id'], links, batch_size)
+
+
+def bulk_festivals(conn, festivals_df, batch_size):
+    upsert(conn, Festival.__table__,
+           records(festivals_df, {'concert_id': 'festival_id', 'performer': 'performer', 'venue': 'venue',
+                                  'location': 'location', 'start_date': 'start_date', 'end_date': 'end_date',
+                                  'time': 'time', 'ranking': 'concertful_ranking'}),
+           batch_size)
+
+
+def bulk_data_dictionary(conn, dict_df, batch_size):
+    # rows have a generated id, so only the (name, description) pairs not stored yet are added
+    table = DataDictionary.__table__
+    stored = set(conn.execute(select(table.c.name, table.c.description)).all())
+    rows = records(dict_df, {'type': 'name', 'description': 'description'})
+    rows = [row for row in rows if (row['name'], row['description']) not in stored]
+    for batch in batches(rows, batch_size):
+        conn.execute(table.insert(), batch)
+
+
+bulk_loaders = {'artists': bulk_artists, 'albums': bulk_albums, 'top50': bulk_top_tracks,
+                'audio': bulk_audio_features, 'concerts': bulk_concerts, 'festivals': bulk_festivals,
+                'data_dict': bulk_data_dictionary}
+
+
+def bulk_frame(engine, name, df, batch_size=1000, row_hashes=None):
+    # one prepared frame, in one transaction (like the merge path's commit per table)
+    with metrics.stage(f'load.{name}') as stage_metrics, engine.begin() as conn:
+        stage_metrics.rows_in = len(df)
+        if row_hashes is not None:
+            df = row_hashes.changed(conn, name, df)
+        stage_metrics.rows_out = len(df)
+        if len(df):
+            bulk_loaders[name](conn, df, batch_size)
+        if row_hashes is not None:
+            row_hashes.save(conn, name)
+
+
+def bulk_load(engine, frames, batch_size=1000, row_hashes=None):
+    frames = prepare(frames)
+    for name in loadable(frames):
+        bulk_frame(engine, name, frames[name], batch_size, row_hashes)
+    return row_hashes.counts if row_hashes is not None else None
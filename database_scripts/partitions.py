@@ -0,0 +1,131 @@
+# Purpose: optional monthly partitioning of top_tracks on PostgreSQL.
+#
+# top_tracks gets a row per rank per playlist every day and is mostly read by
+# date ("a track's days on the charts this year", the last month's charts). With
+# partition_top_tracks set in [database], the table is range-partitioned on
+# date_on_top, one partition per month (top_tracks_y2023m05, ...), plus a
+# default partition for dates outside them. Queries over a date range only read
+# the months they cover, and old months can be detached or dropped whole.
+#
+# partition_top_tracks() turns the existing table into a partitioned one (once),
+# then makes sure there is a partition for every month from the oldest row up to
+# months_ahead months after the current one; rows that went to the default
+# partition (a backfill of older dates) move into their month's partition as it
+# is created. upgrades.upgrade() runs it before every day's loads.
+#
+# concerts is not partitioned: PostgreSQL needs the partition key in every
+# unique constraint, so concert_id alone could no longer be the primary key
+# that concert_genre's foreign key refers to. Its date and (location, date)
+# indexes (database.py) serve the date range queries instead.
+# Other databases (SQLite) are left as they are.
+
+import datetime
+
+from sqlalchemy import inspect, text
+
+import pipeline_config
+from database import TopTrack
+
+DEFAULTS = {'partition_top_tracks': False, 'partition_months_ahead': 3}
+
+
+def settings_from_config(parser, section='database'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def partition_name(table_name, month):
+    return f'{table_name}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned(conn, table_name):
+    return conn.execute(text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                             "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"),
+                        {'name': table_name}).first() is not None
+
+
+def existing_partitions(conn, table_name):
+    return {row[0] for row in conn.execute(text("SELECT c.relname FROM pg_inherits i "
+                                                "JOIN pg_class c ON c.oid = i.inhrelid "
+                                                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                                                "WHERE parent.relname = :name"), {'name': table_name})}
+
+
+def convert(conn, table, column):
+    # the table as it is into a partitioned table with the same columns, key, foreign key and indexes
+    name = table.name
+    old = f'{name}_unpartitioned'
+    inspector = inspect(conn)
+    # index names are per schema: the old table's go, the new table gets them again below
+    for index in inspector.get_indexes(name):
+        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    primary_key = inspector.get_pk_constraint(name)
+    conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{old}"'))
+    if primary_key.get('name'):
+        conn.execute(text(f'ALTER TABLE "{old}" RENAME CONSTRAINT "{primary_key["name"]}" TO "{old}_pkey"'))
+    conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{old}" INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")'))
+    keys = ', '.join(f'"{c.name}"' for c in table.primary_key.columns)
+    conn.execute(text(f'ALTER TABLE "{name}" ADD PRIMARY KEY ({keys})'))
+    for foreign_key in table.foreign_keys:
+        referred = foreign_key.column
+        on_delete = f' ON DELETE {foreign_key.ondelete}' if foreign_key.ondelete else ''
+        conn.execute(text(f'ALTER TABLE "{name}" ADD FOREIGN KEY ("{foreign_key.parent.name}") '
+                          f'REFERENCES "{referred.table.name}" ("{referred.name}"){on_delete}'))
+    for index in table.indexes:
+        index.create(conn)
+    conn.execute(text(f'CREATE TABLE "{name}_default" PARTITION OF "{name}" DEFAULT'))
+    return old
+
+
+def add_month(conn, table_name, column, month):
+    # the month's partition, with the rows the default partition holds for it
+    partition = partition_name(table_name, month)
+    start, end = month.isoformat(), next_month(month).isoformat()
+    conn.execute(text(f'CREATE TABLE "{partition}" (LIKE "{table_name}" INCLUDING DEFAULTS)'))
+    conn.execute(text(f'WITH moved AS (DELETE FROM "{table_name}_default" '
+                      f'WHERE "{column}" >= :start AND "{column}" < :end RETURNING *) '
+                      f'INSERT INTO "{partition}" SELECT * FROM moved'), {'start': start, 'end': end})
+    conn.execute(text(f'ALTER TABLE "{table_name}" ATTACH PARTITION "{partition}" '
+                      f"FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+
+def partition_top_tracks(engine, months_ahead=DEFAULTS['partition_months_ahead'], today=None):
+    # returns the partitions created, None when the database isn't PostgreSQL or has no top_tracks
+    if engine.dialect.name != 'postgresql':
+        return None
+    table, column = TopTrack.__table__, 'date_on_top'
+    today = today or datetime.date.today()
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(table.name):
+            return None
+        old = None
+        if not is_partitioned(conn, table.name):
+            old = convert(conn, table, column)
+            first = conn.execute(text(f'SELECT MIN("{column}") FROM "{old}"')).scalar()
+        else:
+            first = conn.execute(text(f'SELECT MIN("{column}") FROM "{table.name}"')).scalar()
+
+        existing = existing_partitions(conn, table.name)
+        created = []
+        month = month_start(min(first or today, today))
+        last = month_start(today)
+        for _ in range(months_ahead):
+            last = next_month(last)
+        while month <= last:
+            if partition_name(table.name, month) not in existing:
+                add_month(conn, table.name, column, month)
+                created.append(partition_name(table.name, month))
+            month = next_month(month)
+
+        if old is not None:
+            # every month of the old rows has its partition by now
+            conn.execute(text(f'INSERT INTO "{table.name}" SELECT * FROM "{old}"'))
+            conn.execute(text(f'DROP TABLE "{old}"'))
+    return created
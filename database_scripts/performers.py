@@ -0,0 +1,297 @@
+# Purpose: link each concert to the Spotify artists performing at it
+# ('concert_artist'), from the performer text concertful lists.
+#
+# A cleaned concert's performer is 'A, B, others': the names are split on ', '
+# (pieces are joined back when together they are a known artist, 'Tyler, The
+# Creator'), 'others' is dropped, and each name is normalized (accents, case,
+# '&'/'and' and punctuation folded) into a key. Keys are resolved in steps, each
+# only for what the one before left over:
+#   exact     a dict lookup of the key among the artists in the database
+#   similar   trigram blocking: the artists sharing a trigram with the key (common
+#             trigrams, in more than max_block artists, don't count for that) are
+#             candidates; the 'candidates' sharing the most are scored exactly
+#             (Dice: 2 * shared trigrams / both counts) with numpy, and the best one
+#             at 'threshold' or above wins
+#   searched  with search on, a Spotify search per name (batched over the workers
+#             and cached, see spotify_fetch.search_artists); the best result at the
+#             threshold is added to 'artists' and linked
+# Ties go to the more popular artist. A concert's links are replaced each time it
+# is linked, so a run can be repeated.
+
+import collections
+import re
+import unicodedata
+
+import numpy as np
+from sqlalchemy import select
+
+import data_transfer
+import artifacts
+import metrics
+import pipeline_config
+
+from database import Artist, concert_artist_table
+import loaders
+
+# threshold: lowest Dice similarity accepted for a match
+# max_block: trigrams found in more artists than this don't make candidates
+# candidates: artists scored per name
+# search: ask the Spotify API for names not matched in the database
+DEFAULTS = {'threshold': 0.8, 'max_block': 2000, 'candidates': 10, 'search': False, 'batch_size': 1000}
+
+
+def settings_from_config(parser, section='performers'):
+    return pipeline_config.section_settings(parser, section, DEFAULTS)
+
+
+separator_pattern = re.compile(r'[\W_]+')
+
+
+def normalize(name):
+    # 'Beyoncé & The Band!' -> 'beyonce and the band'
+    if not name.isascii():
+        name = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+    return ' '.join(separator_pattern.sub(' ', name.casefold().replace('&', ' and ')).split())
+
+
+def trigrams(key):
+    # padded so the first letters (and short names) have trigrams of their own
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    # Dice coefficient of the two keys' trigrams
+    a, b = trigrams(a), trigrams(b)
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class ArtistIndex:
+    # artists: (artist_id, name) pairs, the most popular first
+
+    def __init__(self, artists, max_block=DEFAULTS['max_block']):
+        self.exact = {}
+        for artist_id, name in artists:
+            if name:
+                self.exact.setdefault(normalize(name), artist_id)
+        self.keys = list(self.exact)
+        self.ids = list(self.exact.values())
+
+        # every key's trigrams as ids, one row each, padded with -1
+        self.gram_ids = {}
+        rows = [[self.gram_ids.setdefault(gram, len(self.gram_ids)) for gram in trigrams(key)] for key in self.keys]
+        self.sizes = np.array([len(row) for row in rows], dtype=np.int64)
+        self.grams = np.full((len(rows), max(self.sizes, default=0)), -1, dtype=np.int64)
+        for i, row in enumerate(rows):
+            self.grams[i, :len(row)] = row
+
+        # postings: the keys having each trigram, in trigram order
+        grams = self.grams[self.grams >= 0]
+        owners = np.nonzero(self.grams >= 0)[0]
+        order = np.argsort(grams, kind='stable')
+        self.postings = owners[order]
+        self.counts = np.bincount(grams, minlength=len(self.gram_ids))
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]]).astype(np.int64)
+        # trigrams too common to tell artists apart are left out of the blocking
+        self.counts[self.counts > max_block] = 0
+
+    @classmethod
+    def from_database(cls, conn, max_block=DEFAULTS['max_block']):
+        artists = Artist.__table__
+        query = select(artists.c.artist_id, artists.c.name).order_by(artists.c.popularity.desc().nullslast(),
+                                                                      artists.c.artist_id)
+        return cls(conn.execute(query), max_block)
+
+    def query_grams(self, keys, pad):
+        # the keys' known trigram ids, one row each padded with pad, and every key's trigram count
+        rows = [[self.gram_ids[gram] for gram in trigrams(key) if gram in self.gram_ids] for key in keys]
+        sizes = np.array([len(trigrams(key)) for key in keys], dtype=np.int64)
+        grams = np.full((len(rows), max((len(row) for row in rows), default=0)), pad, dtype=np.int64)
+        for i, row in enumerate(rows):
+            grams[i, :len(row)] = row
+        return grams, sizes
+
+    def pairs(self, grams, blocked, sizes, threshold, max_pairs):
+        # (key, artist) pairs sharing an unblocked trigram that can still reach threshold,
+        # with the number they share; about max_pairs trigram hits at a time
+        query_of, column = np.nonzero(grams >= 0)
+        gram = grams[query_of, column]
+        lengths = self.counts[gram]
+        per_key = np.bincount(query_of, weights=lengths, minlength=len(grams))
+        batch_of = (np.cumsum(per_key) - per_key) // max_pairs
+        for batch in np.unique(batch_of):
+            keys = np.nonzero(batch_of == batch)[0]
+            lo, hi = np.searchsorted(query_of, [keys[0], keys[-1] + 1])
+            batch_lengths = lengths[lo:hi]
+            total = int(batch_lengths.sum())
+            if not total:
+                continue
+            # the postings of every trigram hit, one after the other
+            offsets = np.repeat(self.starts[gram[lo:hi]] - np.cumsum(batch_lengths) + batch_lengths,
+                                batch_lengths) + np.arange(total)
+            query, artist = np.repeat(query_of[lo:hi], batch_lengths), self.postings[offsets]
+            # Dice can only reach threshold if the trigram counts are within threshold / (2 - threshold)
+            # of each other
+            longer = np.maximum(sizes[query], self.sizes[artist])
+            shorter = np.minimum(sizes[query], self.sizes[artist])
+            close = shorter * (2 - threshold) >= longer * threshold - 1e-9
+            pairs = query[close] * len(self.keys) + artist[close]
+            pairs, shared = np.unique(pairs, return_counts=True)
+            query, artist = np.divmod(pairs, len(self.keys))
+            # at most the shared trigrams plus the key's blocked ones can be in common
+            bound = np.minimum(np.minimum(shared + blocked[query], sizes[query]), self.sizes[artist])
+            keep = 2 * bound >= threshold * (sizes[query] + self.sizes[artist]) - 1e-9
+            yield query[keep], artist[keep], shared[keep]
+
+    def match(self, keys, threshold=DEFAULTS['threshold'], candidates=DEFAULTS['candidates'], max_pairs=2**23,
+              chunk=2**22):
+        # {key: (artist_id, score)} for the keys with an artist at threshold or above
+        if not keys or not self.keys:
+            return {}
+        grams, sizes = self.query_grams(keys, pad=-2)
+        blocked = ((grams >= 0) & (self.counts[np.maximum(grams, 0)] == 0)).sum(axis=1)
+
+        found = [[], []]
+        for query_of, artist, shared in self.pairs(grams, blocked, sizes, threshold, max_pairs):
+            # the artists sharing the most trigrams with each key (the more popular first)
+            order = np.lexsort((artist, -shared, query_of))
+            query_of, artist = query_of[order], artist[order]
+            keep = np.arange(len(query_of)) - np.searchsorted(query_of, query_of) < candidates
+            found[0].append(query_of[keep])
+            found[1].append(artist[keep])
+        if not found[0]:
+            return {}
+        query_of, artist = np.concatenate(found[0]), np.concatenate(found[1])
+
+        # exact Dice over all the trigrams, a chunk of pairs at a time
+        scores = np.empty(len(query_of))
+        step = max(1, chunk // max(1, grams.shape[1] * self.grams.shape[1]))
+        for start in range(0, len(query_of), step):
+            q, a = query_of[start:start + step], artist[start:start + step]
+            common = (grams[q][:, :, None] == self.grams[a][:, None, :]).sum(axis=(1, 2))
+            scores[start:start + step] = 2 * common / (sizes[q] + self.sizes[a])
+
+        # the best artist per key; lexsort is stable, so ties stay with the more popular one
+        order = np.lexsort((artist, -scores, query_of))
+        query_of, artist, scores = query_of[order], artist[order], scores[order]
+        best = np.ones(len(query_of), dtype=bool)
+        best[1:] = query_of[1:] != query_of[:-1]
+        best &= scores >= threshold
+        return {keys[q]: (self.ids[a], float(score))
+                for q, a, score in zip(query_of[best].tolist(), artist[best].tolist(), scores[best].tolist())}
+
+
+def performer_names(text, exact=()):
+    # 'A, B, others' -> ['A', 'B']; up to three pieces are joined back into one
+    # name when the index knows them together ('Tyler, The Creator')
+    if not isinstance(text, str):
+        return []
+    pieces = [piece.strip() for piece in text.split(',') if piece.strip()]
+    names = []
+    i = 0
+    while i < len(pieces):
+        size = 1
+        for joined in range(min(3, len(pieces) - i), 1, -1):
+            if normalize(', '.join(pieces[i:i + joined])) in exact:
+                size = joined
+                break
+        name = ', '.join(pieces[i:i + size])
+        if normalize(name) != 'others':
+            names.append(name)
+        i += size
+    return names
+
+
+def best_result(key, items, threshold):
+    # the search result closest to key at threshold or above, the more popular on a tie
+    scored = [(similarity(key, normalize(item['name'] or '')), item.get('popularity') or 0, item)
+              for item in items if item.get('id')]
+    scored = [entry for entry in scored if entry[0] >= threshold]
+    if not scored:
+        return None
+    return max(scored, key=lambda entry: entry[:2])[2]
+
+
+def resolve(names, index, settings=DEFAULTS, search=None):
+    # names: performer names; search(names) -> {name: [{'id', 'name', 'popularity'}, ...]}
+    # returns {key: artist_id}, Counter of keys per step, and the searched artists to add
+    wanted = {}
+    for name in names:
+        key = normalize(name)
+        if key:
+            wanted.setdefault(key, name)
+    counts = collections.Counter()
+    ids = {key: index.exact[key] for key in wanted if key in index.exact}
+    counts['exact'] = len(ids)
+
+    left = [key for key in wanted if key not in ids]
+    similar = index.match(left, settings['threshold'], settings['candidates'])
+    ids.update((key, artist_id) for key, (artist_id, _) in similar.items())
+    counts['similar'] = len(similar)
+
+    new_artists = {}
+    left = [key for key in left if key not in ids]
+    if search is not None and left:
+        found = search([wanted[key] for key in left])
+        for key in left:
+            item = best_result(key, found.get(wanted[key], []), settings['threshold'])
+            if item is not None:
+                ids[key] = item['id']
+                new_artists[item['id']] = {'artist_id': item['id'], 'name': item['name'],
+                                           'popularity': item.get('popularity')}
+                counts['searched'] += 1
+    counts['unresolved'] = len(wanted) - len(ids)
+    return ids, counts, list(new_artists.values())
+
+
+def spotify_search(parser):
+    # spotify_fetch.search_artists with the [spotify] settings (and [spotify_cache], if enabled)
+    import spotify_data
+    import spotify_fetch
+
+    sp = spotify_data.spotify_client(parser)
+    settings = spotify_fetch.settings_from_config(parser)
+    cache = spotify_data.cache_from_config(parser)
+    return lambda names: spotify_fetch.search_artists(sp, names, settings, cache=cache), cache
+
+
+def link(run_date, parser, shard=None, engine=None, store=None):
+    # stage: the cleaned concerts' performers (the shard's, if given) resolved to
+    # artists into 'concert_artist'; the concerts must be loaded already
+    with metrics.stage('link_performers', shard=shard) as stage_metrics:
+        settings = settings_from_config(parser)
+        engine = engine or data_transfer.engine_from_config(parser)
+        store, storage = artifacts.store_from_config(parser, store=store)
+        concerts = artifacts.read_frame(store, artifacts.artifact_name('cleaned_concerts', run_date, shard),
+                                        columns=['concert_id', 'performer'], settings=storage)
+        concerts = concerts[concerts['concert_id'].notna()]
+        stage_metrics.rows_in = len(concerts)
+
+        with engine.connect() as conn:
+            index = ArtistIndex.from_database(conn, settings['max_block'])
+        performers = [performer_names(text, index.exact)
+                      for text in concerts['performer'].astype(object).where(concerts['performer'].notna(), None)]
+
+        search, cache = spotify_search(parser) if settings['search'] else (None, None)
+        ids, counts, new_artists = resolve([name for names in performers for name in names], index, settings, search)
+        if cache is not None:
+            cache.evict()
+            cache.close()
+
+        concert_ids = [int(concert_id) for concert_id in concerts['concert_id']]
+        links = list(dict.fromkeys((concert_id, ids[key]) for concert_id, names in zip(concert_ids, performers)
+                                   for key in map(normalize, names) if key in ids))
+        with engine.begin() as conn:
+            loaders.upsert(conn, Artist.__table__, new_artists, settings['batch_size'], update=False)
+            loaders.replace_links(conn, concert_artist_table, 'concert_id', 'artist_id', concert_ids, links,
+                                  settings['batch_size'])
+        stage_metrics.rows_out = len(links)
+        for kind, count in counts.items():
+            metrics.count(f'performers_{kind}', count)
+        print(f"performers: {dict(counts)}, {len(links)} links")
+    return counts
+
+
+if __name__ == '__main__':
+    args = pipeline_config.stage_arguments('Link the concerts to the Spotify artists performing', shards=True)
+    link(args.date, pipeline_config.stage_config(args.date), args.shard)
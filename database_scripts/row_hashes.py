@@ -0,0 +1,93 @@
+# Purpose: only write the rows that are new or changed since the last load.
+#
+# Most of a day's artists, albums, audio features and concerts are exactly what
+# the database already holds, yet every one of them used to be merged (a SELECT
+# and an UPDATE per row) or upserted again. With skip_unchanged set in
+# [database], every row of a frame gets a 64-bit hash of its content (its links
+# included: an artist's genres, a track's artists, a concert's genre), and the
+# hashes stored by earlier loads are read from 'row_hashes' in one query per
+# table. Rows whose hash matches are skipped; the others go to the loader and
+# their hashes are stored with them, in the same transaction for the bulk path.
+#
+# A row without a stored hash counts as inserted, so the first load after
+# turning this on reports (and writes) every row once. Rows changed in the
+# database by hand are not noticed: delete their entity's rows from
+# 'row_hashes' to have them written again.
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from database import RowHash
+
+# the columns that identify a row of each frame (loaders.py's frame names)
+key_columns = {'artists': ['artist_id'], 'albums': ['album_id'], 'top50': ['date_on_top', 'playlist_id', 'rank_no'],
+               'audio': ['track_id'], 'concerts': ['concert_id'], 'festivals': ['concert_id']}
+
+
+def canonical(value):
+    # lists (and the arrays Parquet gives back for them) as one string, so they can be hashed
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return '\x1f'.join(map(str, value))
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return str(value)
+
+
+def row_keys(df, columns):
+    key = df[columns[0]].astype(str)
+    for column in columns[1:]:
+        key = key + '|' + df[column].astype(str)
+    return key
+
+
+def content_hashes(df):
+    # one int64 per row from every column (in name order, so column order doesn't matter)
+    values = pd.DataFrame({column: df[column].map(canonical) if df[column].dtype == object else df[column]
+                           for column in sorted(df.columns)}, index=df.index)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy().view(np.int64)
+
+
+class RowHashes:
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        # {frame name: Counter of inserted, updated, skipped}
+        self.counts = {}
+        self.pending = {}
+
+    def changed(self, conn, name, df):
+        # the rows of df to write; their hashes are kept for save()
+        if name not in key_columns or df.empty:
+            return df
+        key = row_keys(df, key_columns[name]).to_numpy()
+        hashes = content_hashes(df)
+        table = RowHash.__table__
+        stored = dict(conn.execute(select(table.c.key, table.c.hash).where(table.c.entity == name)).all())
+        is_new = np.array([k not in stored for k in key], dtype=bool)
+        before = np.array([stored.get(k, 0) for k in key], dtype=np.int64)
+        is_changed = ~is_new & (before != hashes)
+        write = is_new | is_changed
+        self.counts[name] = Counter(inserted=int(is_new.sum()), updated=int(is_changed.sum()),
+                                    skipped=int(len(df) - write.sum()))
+        # one hash per key, the last row wins (as in the loaders)
+        self.pending[name] = dict(zip(key[write], hashes[write].tolist()))
+        return df[write]
+
+    def save(self, conn, name):
+        # stores the hashes of the rows changed() let through, once they have been written
+        pending = self.pending.pop(name, None)
+        if not pending:
+            return
+        table = RowHash.__table__
+        keys = list(pending)
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            conn.execute(table.delete().where(table.c.entity == name).where(table.c.key.in_(batch)))
+            conn.execute(table.insert(), [{'entity': name, 'key': key, 'hash': pending[key]} for key in batch])
+
+    def report(self):
+        return '; '.join(f"{name}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                         f"{counts['skipped']} skipped" for name, counts in self.counts.items())
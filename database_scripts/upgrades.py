@@ -0,0 +1,117 @@
+# Purpose: bring tables created by earlier versions of database.py up to date.
+# Every upgrade checks the table first, so running them on each load is cheap and
+# does nothing once they have been applied.
+#
+# top_tracks: several playlists can be loaded now, so a day's ranks are kept per
+# playlist; the primary key went from (date_on_top, rank_number) to
+# (date_on_top, playlist_id, rank_number). The rows already there came from the
+# one playlist loaded until then (database.default_playlist_id).
+#
+# artist_genre, artist_album, artist_track, concert_genre: the link tables had no
+# primary key, and could hold the same link twice. They are rebuilt with
+# (both columns) as the primary key, keeping each link once.
+#
+# indexes: the ones database.py defines now (foreign key and date columns) are
+# added to tables created before them.
+#
+# upgrade() runs all of them and creates the tables that are missing; the DAG
+# does it once before any of the day's loads start. With partition_top_tracks
+# set in [database], it also partitions top_tracks by month on PostgreSQL (see
+# partitions.py).
+
+from sqlalchemy import Column, MetaData, Table, and_, func, inspect, literal, select
+
+import genres
+import partitions
+from database import (Base, TopTrack, create_tables, default_playlist_id, artist_genre_table, artist_album_table,
+                      artist_track_table, concert_genre_table)
+
+link_tables = [artist_genre_table, artist_album_table, artist_track_table, concert_genre_table]
+
+
+def add_top_tracks_playlist(engine, playlist_id=default_playlist_id):
+    # returns the number of rows moved, None if there was nothing to do
+    top_tracks = TopTrack.__table__
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table(top_tracks.name):
+            return None
+        if 'playlist_id' in [column['name'] for column in inspector.get_columns(top_tracks.name)]:
+            return None
+
+        # the primary key can't be changed in place on SQLite: copy the rows out,
+        # create the table again and copy them back
+        old_columns = [column for column in top_tracks.columns if column.name != 'playlist_id']
+        temporary = MetaData()
+        saved = Table('top_tracks_saved', temporary, *[Column(c.name, c.type) for c in old_columns],
+                      prefixes=['TEMPORARY'])
+        saved.create(conn)
+        existing = Table(top_tracks.name, MetaData(), autoload_with=conn)
+        conn.execute(saved.insert().from_select([c.name for c in old_columns],
+                                                select(*[existing.c[c.name] for c in old_columns])))
+        existing.drop(conn)
+        top_tracks.create(conn)
+        moved = conn.execute(top_tracks.insert().from_select(
+            [c.name for c in old_columns] + ['playlist_id'],
+            select(*saved.columns, literal(playlist_id)))).rowcount
+        saved.drop(conn)
+    return moved
+
+
+def add_link_primary_keys(engine):
+    # returns {table: links dropped (repeated, or with a missing id)} for the tables rebuilt
+    rebuilt = {}
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in link_tables:
+            if not inspector.has_table(table.name):
+                continue
+            if inspector.get_pk_constraint(table.name)['constrained_columns']:
+                continue
+            # as for top_tracks: copied out, created again with the key, copied back once each
+            names = [column.name for column in table.columns]
+            existing = Table(table.name, MetaData(), autoload_with=conn)
+            saved = Table(f'{table.name}_saved', MetaData(), *[Column(c.name, c.type) for c in table.columns],
+                          prefixes=['TEMPORARY'])
+            saved.create(conn)
+            links = [existing.c[name] for name in names]
+            conn.execute(saved.insert().from_select(
+                names, select(*links).where(and_(*[link.isnot(None) for link in links])).distinct()))
+            before = conn.execute(select(func.count()).select_from(existing)).scalar()
+            existing.drop(conn)
+            table.create(conn)
+            kept = conn.execute(table.insert().from_select(names, select(*saved.columns))).rowcount
+            saved.drop(conn)
+            rebuilt[table.name] = before - kept
+    return rebuilt
+
+
+def add_indexes(engine):
+    # returns the names of the indexes added
+    added = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                # the unique index on genres.name comes with genres.deduplicate(), once there are no duplicates
+                if index.unique or index.name in existing:
+                    continue
+                index.create(conn)
+                added.append(index.name)
+    return added
+
+
+def upgrade(engine, partition_settings=None):
+    # partition_settings: partitions.settings_from_config(), nothing is partitioned without them
+    add_top_tracks_playlist(engine)
+    create_tables(engine)
+    # one row per genre name (once), see genres.py; before the link tables get their
+    # primary keys, as it moves links from one genre to another
+    genres.deduplicate(engine)
+    add_link_primary_keys(engine)
+    add_indexes(engine)
+    if partition_settings and partition_settings['partition_top_tracks']:
+        partitions.partition_top_tracks(engine, partition_settings['partition_months_ahead'])
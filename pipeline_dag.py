@@ -1,68 +1,122 @@
-from airflow import DAG
-from airflow.operators.bash import BashOperator
+from airflow.decorators import dag, task
 from datetime import datetime
+import os
 
 default_args = {
 	'owner': 'airflow',
-	'start_date': datetime(2023, 5, 1),
 	'retries' : 2,
 }
 
-dag = DAG(
-	'etl_pipeline_v8',
-	default_args=default_args,
-	schedule="0 18 * * *",
-	catchup=False
-)
+# the stages run in the pipeline's own virtual environment (python3.10 and the
+# packages in requirements.txt), not Airflow's, to keep projects separate and
+# avoid incompatible versions of libraries
+# set these, or replace them with the absolute paths
+PIPELINE_PYTHON = os.environ.get('PIPELINE_PYTHON', '<absolute path of the venv python3.10>')
+PIPELINE_DIR = os.environ.get('PIPELINE_DIR', '<absolute path of the project folder>')
 
-#use BashOperator instead of PythonOperator to keep projects separate
-#and avoid incompatible versions of libraries
-#would alternatively have to include or import code into DAG file
+# at most this many concert shards are fetched at the same time; per_host in
+# [concerts_fetch] applies to each of them, so the site sees up to
+# FETCH_PARALLELISM * per_host connections
+FETCH_PARALLELISM = 4
 
-# if you get errors from using python3.10, I recommend using the absolute path for that as well
+# every task gets the run's date ({{ ds }}) and names its artifacts after it, so
+# runs for different dates (a backfill) can go side by side without reading
+# each other's data. Concert fetching, cleaning and loading are mapped over the
+# shards discover_concert_urls splits the day's events into ('shards' in [discovery]).
 
-extract_urls_task = BashOperator(
-	task_id='extract_concert_urls',
-	bash_command='python3.10 <absolute path of getURLS.py>',
-	dag=dag,
-)
- 
-extract_concerts_task = BashOperator(
-	task_id='extract_concerts_data',
-	bash_command='python3.10 <absolute path of concerts_data.py>',
-	dag=dag,
-)
+# external_python runs only the function's own code: imports go inside
+@task.external_python(task_id='extract_concert_urls', python=PIPELINE_PYTHON)
+def discover_concert_urls(project_directory, run_date):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'data_scripts')]
+	import getURLs, pipeline_config
+	return getURLs.discover(run_date, pipeline_config.stage_config(run_date))
 
-clean_concerts_task = BashOperator(
-	task_id='clean_concerts_data',
-	bash_command='python3.10 <absolute path of cleaning_concerts.py>',
-	dag=dag,
-)
+@task.external_python(task_id='extract_concerts_data', python=PIPELINE_PYTHON,
+					  max_active_tis_per_dag=FETCH_PARALLELISM)
+def fetch_concerts(project_directory, run_date, shard):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'data_scripts')]
+	import concerts_data, pipeline_config
+	concerts_data.fetch_concerts(run_date, pipeline_config.stage_config(run_date), shard)
+	return shard
 
-get_spotify_task = BashOperator(
-	task_id='getting_spotify_info',
-	bash_command='python3.10 <absolute path of spotify_data.py>',
-	dag=dag,
-)
+@task.external_python(task_id='clean_concerts_data', python=PIPELINE_PYTHON)
+def clean_concerts(project_directory, run_date, shard):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'data_scripts')]
+	import cleaning_concerts, pipeline_config
+	cleaning_concerts.clean(run_date, pipeline_config.stage_config(run_date), shard)
+	return shard
 
-data_dict_task = BashOperator(
-	task_id='creating_data_dict',
-	bash_command='python3.10 <absolute path of data_dictionary.py>',
-	dag=dag,
-)
+@task.external_python(task_id='getting_spotify_info', python=PIPELINE_PYTHON)
+def fetch_spotify(project_directory, run_date):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'data_scripts')]
+	import spotify_data, pipeline_config
+	spotify_data.fetch_spotify(run_date, pipeline_config.stage_config(run_date))
 
-database_task = BashOperator(
-	task_id='creating_data_databse',
-	bash_command='python3.10 <absolute path of database.py>',
-	dag=dag,
-)
+@task.external_python(task_id='creating_data_dict', python=PIPELINE_PYTHON)
+def write_data_dict(project_directory):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'data_scripts')]
+	import data_dictionary, pipeline_config
+	data_dictionary.write_data_dict(pipeline_config.stage_config())
 
-data_transfer_task = BashOperator(
-	task_id='uploading_to_database',
-	bash_command='python3.10 <absolute path of data_transfer.py>',
-	dag=dag,
+# creates missing tables and upgrades old ones, before any of the loads start
+@task.external_python(task_id='creating_data_databse', python=PIPELINE_PYTHON)
+def create_tables(project_directory):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'database_scripts'), os.path.join(project_directory, 'data_scripts')]
+	import data_transfer, partitions, upgrades, pipeline_config
+	parser = pipeline_config.stage_config()
+	upgrades.upgrade(data_transfer.engine_from_config(parser), partitions.settings_from_config(parser))
+
+@task.external_python(task_id='uploading_to_database', python=PIPELINE_PYTHON)
+def load_spotify(project_directory, run_date):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'database_scripts'), os.path.join(project_directory, 'data_scripts')]
+	import data_transfer, pipeline_config
+	data_transfer.transfer(run_date, pipeline_config.stage_config(run_date), groups=['spotify'])
+
+@task.external_python(task_id='uploading_concerts_to_database', python=PIPELINE_PYTHON)
+def load_concerts(project_directory, run_date, shard):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'database_scripts'), os.path.join(project_directory, 'data_scripts')]
+	import data_transfer, pipeline_config
+	data_transfer.transfer(run_date, pipeline_config.stage_config(run_date), groups=['concerts'], shard=shard)
+
+# the shard's concerts linked to the Spotify artists performing, once both are loaded
+@task.external_python(task_id='linking_performers', python=PIPELINE_PYTHON)
+def link_performers(project_directory, run_date, shard):
+	import sys, os
+	sys.path[:0] = [os.path.join(project_directory, 'database_scripts'), os.path.join(project_directory, 'data_scripts')]
+	import performers, pipeline_config
+	performers.link(run_date, pipeline_config.stage_config(run_date), shard=shard)
+
+@dag(
+	dag_id='etl_pipeline_v9',
+	default_args=default_args,
+	start_date=datetime(2023, 5, 1),
+	schedule="0 18 * * *",
+	catchup=False,
+	# backfilled dates run in parallel
+	max_active_runs=4,
 )
+def etl_pipeline():
+	run_date = '{{ ds }}'
+	shards = discover_concert_urls(PIPELINE_DIR, run_date)
+	fetched = fetch_concerts.partial(project_directory=PIPELINE_DIR, run_date=run_date).expand(shard=shards)
+	cleaned = clean_concerts.partial(project_directory=PIPELINE_DIR, run_date=run_date).expand(shard=fetched)
+
+	tables = create_tables(PIPELINE_DIR)
+	concerts_loaded = load_concerts.partial(project_directory=PIPELINE_DIR, run_date=run_date).expand(shard=cleaned)
+	tables >> concerts_loaded
+
+	spotify_loaded = load_spotify(PIPELINE_DIR, run_date)
+	[fetch_spotify(PIPELINE_DIR, run_date), write_data_dict(PIPELINE_DIR), tables] >> spotify_loaded
+
+	linked = link_performers.partial(project_directory=PIPELINE_DIR, run_date=run_date).expand(shard=cleaned)
+	[concerts_loaded, spotify_loaded] >> linked
 
-extract_urls_task >> extract_concerts_task >> clean_concerts_task >> database_task
-get_spotify_task >> data_dict_task >> database_task
-database_task >> data_transfer_task
+etl_pipeline()
@@ -0,0 +1,126 @@
+# Purpose: run any of the pipeline's stages, in order, in one Python process.
+#
+#   python -m pipeline_runner                        (every stage, for today)
+#   python -m pipeline_runner --date 2023-05-20 --stages clean load_concerts
+#
+# Run as separate scripts (or DAG tasks), every stage starts an interpreter,
+# imports pandas and whatever else it uses, parses pipeline.conf and makes its
+# own boto3 client and SQLAlchemy engine. Here that happens once: the stages
+# share one parsed config, one artifact store (one S3 client) and one engine
+# (one connection pool). A stage's module is only imported when the stage runs,
+# so running a few stages only loads what those use.
+# Concert stages run over the whole day here (no shards); the DAG is the place
+# for running shards side by side.
+
+import argparse
+import os
+import sys
+import time
+
+project_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(project_directory, 'data_scripts'), os.path.join(project_directory, 'database_scripts')]
+
+import metrics
+import pipeline_config
+
+
+class RunContext:
+    # what the stages share; the store and engine are made when first used
+
+    def __init__(self, run_date, parser):
+        self.run_date = run_date
+        self.parser = parser
+        self._store = None
+        self._engine = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            import artifacts
+            self._store, _ = artifacts.store_from_config(self.parser)
+        return self._store
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import data_transfer
+            self._engine = data_transfer.engine_from_config(self.parser)
+        return self._engine
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+def discover(context):
+    import getURLs
+    getURLs.discover(context.run_date, context.parser, store=context.store)
+
+def fetch_concerts(context):
+    import concerts_data
+    concerts_data.fetch_concerts(context.run_date, context.parser, store=context.store)
+
+def clean(context):
+    import cleaning_concerts
+    cleaning_concerts.clean(context.run_date, context.parser, store=context.store)
+
+def fetch_spotify(context):
+    import spotify_data
+    spotify_data.fetch_spotify(context.run_date, context.parser, store=context.store)
+
+def data_dict(context):
+    import data_dictionary
+    data_dictionary.write_data_dict(context.parser, store=context.store)
+
+def create_tables(context):
+    import partitions, upgrades
+    upgrades.upgrade(context.engine, partitions.settings_from_config(context.parser))
+
+def load_spotify(context):
+    import data_transfer
+    data_transfer.transfer(context.run_date, context.parser, ['spotify'], engine=context.engine, store=context.store)
+
+def load_concerts(context):
+    import data_transfer
+    data_transfer.transfer(context.run_date, context.parser, ['concerts'], engine=context.engine, store=context.store)
+
+def link_performers(context):
+    import performers
+    performers.link(context.run_date, context.parser, engine=context.engine, store=context.store)
+
+
+# in the order they run
+STAGES = {'discover': discover, 'fetch_concerts': fetch_concerts, 'clean': clean, 'fetch_spotify': fetch_spotify,
+          'data_dict': data_dict, 'create_tables': create_tables, 'load_spotify': load_spotify,
+          'load_concerts': load_concerts, 'link_performers': link_performers}
+
+
+def run(stages, run_date, parser):
+    # returns {stage: seconds}; a failing stage stops the run, like a failed task in the DAG
+    # every stage records its metrics, with [metrics] enabled
+    metrics.configure(parser, run_date)
+    context = RunContext(run_date, parser)
+    timings = {}
+    try:
+        for name in STAGES:
+            if name not in stages:
+                continue
+            start = time.perf_counter()
+            STAGES[name](context)
+            timings[name] = time.perf_counter() - start
+            print(f"{name}: {timings[name]:.2f}s")
+    finally:
+        context.close()
+    return timings
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Run pipeline stages in one process')
+    arg_parser.add_argument('--date', type=pipeline_config.run_date, default=pipeline_config.run_date(),
+                            help='the day the run is for, YYYY-MM-DD (default: today)')
+    arg_parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    arg_parser.add_argument('--config', default=None, help='default: pipeline.conf (or $PIPELINE_CONF)')
+    args = arg_parser.parse_args()
+
+    timings = run(args.stages, args.date, pipeline_config.read_config(args.config))
+    print(f"{len(timings)} stage(s) in {sum(timings.values()):.2f}s")